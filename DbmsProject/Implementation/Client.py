@@ -1,26 +1,115 @@
 import socket
+import sys
+from protocol import send_messages, recv_tagged_message
 
 HOST = '127.0.0.1'  # Server IP address
 PORT = 65431       # Server port
+PIPELINE_WINDOW = 128  # commands sent ahead of their responses
+
+class Client:
+    """Connection to the server; execute_many pipelines commands instead of waiting for each reply."""
+
+    def __init__(self, host=HOST, port=PORT):
+        self.sock = socket.create_connection((host, port))
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.next_tag = 1
+        self.welcome = self._receive()[1]
+
+    def _receive(self):
+        message = recv_tagged_message(self.sock)
+        if message is None:
+            raise ConnectionError("Server closed the connection.")
+        return message
+
+    def execute(self, command):
+        return self.execute_many([command])[0]
+
+    def execute_many(self, commands, window=PIPELINE_WINDOW):
+        """Send commands without waiting between them; responses come back in order."""
+        commands = list(commands)
+        responses = []
+        sent = 0
+        first_tag = self.next_tag
+        while len(responses) < len(commands):
+            # Top the window up in one write, then collect the next response
+            in_flight = sent - len(responses)
+            if sent < len(commands) and in_flight < window:
+                batch = commands[sent:sent + window - in_flight]
+                send_messages(self.sock, [(first_tag + sent + i, command) for i, command in enumerate(batch)])
+                sent += len(batch)
+            tag, response = self._receive()
+            if tag != first_tag + len(responses):
+                raise ConnectionError(f"Response tag {tag} arrived out of order.")
+            responses.append(response)
+        self.next_tag = first_tag + len(commands)
+        return responses
+
+    def execute_script(self, path):
+        """Run every statement of a SQL script file; returns [(statement, response)]."""
+        with open(path, 'r', encoding='utf-8') as f:
+            statements = split_script(f.read())
+        return list(zip(statements, self.execute_many(statements)))
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def split_script(text):
+    # Statements end with ';' (outside quotes); lines starting with '--' are comments
+    statements = []
+    current = []
+    quote = None
+    for line in text.splitlines():
+        if quote is None and line.strip().startswith("--"):
+            continue
+        for char in line:
+            if quote:
+                if char == quote:
+                    quote = None
+            elif char in ("'", '"'):
+                quote = char
+            elif char == ";":
+                statements.append("".join(current).strip())
+                current = []
+                continue
+            current.append(char)
+        current.append("\n")
+    statements.append("".join(current).strip())
+    return [statement for statement in statements if statement]
 
 # Function to start the client
 def start_client():
-    client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client.connect((HOST, PORT))
-    
-    print(client.recv(1024).decode('utf-8'))  # Welcome message from server
+    client = Client()
+    print(client.welcome)  # Welcome message from server
 
     while True:
         command = input("Enter command: ")
         if command.lower() == 'exit':
             print("Closing connection...")
             break
-        
-        client.send(command.encode('utf-8'))
-        response = client.recv(1024).decode('utf-8')
+
+        try:
+            response = client.execute(command)
+        except ConnectionError:
+            print("Server closed the connection.")
+            break
         print(response)
-    
+
     client.close()
 
+def run_script(path):
+    with Client() as client:
+        for statement, response in client.execute_script(path):
+            print(f"> {statement}")
+            print(response)
+
 if __name__ == "__main__":
-    start_client()
+    if len(sys.argv) > 1:
+        run_script(sys.argv[1])
+    else:
+        start_client()
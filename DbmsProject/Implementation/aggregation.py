@@ -0,0 +1,191 @@
+# aggregation.py
+# SELECTs with COUNT/SUM/AVG/MIN/MAX and GROUP BY. Only primary key columns are
+# visible to MongoDB (every other column is packed into the binary "row"), so a
+# query without WHERE that groups and aggregates on key columns alone runs as one
+# $group pipeline and only the groups come back. Everything else is aggregated
+# here: rows are read a batch at a time, hashed into groups per batch, and each
+# aggregate is folded over the batch's column values with the builtins.
+import itertools
+import os
+
+from db_operations import engine
+from query_engine import plan_select, iterate_plan, explain_plan
+from record_codec import cast_value
+from sql_parser import Select
+
+AGGREGATE_BATCH_SIZE = int(os.environ.get("DBMS_AGGREGATE_BATCH_SIZE", "1000"))
+
+
+def label(column):
+    # Output name of a select-list item
+    return f"{column[0]}({column[1]})" if isinstance(column, tuple) else column
+
+
+def plan_aggregate(db_name, query, store):
+    """Check the select list against GROUP BY and decide between pushdown and hash aggregation."""
+    aggregates = [column for column in query.columns if isinstance(column, tuple)]
+    for column in query.columns:
+        if not isinstance(column, tuple) and column not in query.group_by:
+            raise ValueError(f"Column {column} must appear in GROUP BY or inside an aggregate function.")
+
+    # The rows to aggregate: group columns first, then every aggregated column once
+    inputs = list(dict.fromkeys(query.group_by))
+    for _, argument in aggregates:
+        if argument != "*" and argument not in inputs:
+            inputs.append(argument)
+
+    plan = {
+        'table': query.table,
+        'columns': [label(column) for column in query.columns],
+        'select': query.columns,
+        'group_by': list(dict.fromkeys(query.group_by)),
+        'aggregates': aggregates,
+        'inputs': inputs,
+        'scan': Select(inputs, query.table, query.joins, query.where)
+    }
+    if query.joins:
+        plan['type'] = 'hash'
+        return plan
+
+    scan_plan = plan_select(db_name, plan['scan'], store)
+    plan['scan_plan'] = scan_plan
+    plan['type'] = 'hash'
+    table_info = scan_plan['table_info']
+    primary_keys = table_info['primary_keys']
+    on_keys = all(column in primary_keys for column in inputs)
+    if store.key_aggregation and query.where is None and on_keys:
+        types = {attr['name']: (attr['type'] or '').upper() for attr in table_info['structure']}
+        kinds = {pk: types[pk] if types[pk] in ("INT", "FLOAT") else "TEXT" for pk in primary_keys}
+        numeric = all(function in ("COUNT", "MIN", "MAX") or kinds[argument] != "TEXT"
+                      for function, argument in aggregates)
+        if numeric:
+            plan['type'] = 'pushdown'
+            plan['types'] = types
+            plan['group_positions'] = [primary_keys.index(column) for column in plan['group_by']]
+            # COUNT(key column) is COUNT(*): key columns are never NULL
+            plan['pushed'] = [
+                (function, None, None) if function == "COUNT" else
+                (function, primary_keys.index(argument), kinds[argument])
+                for function, argument in aggregates
+            ]
+    return plan
+
+
+def _initial(function):
+    if function == "COUNT":
+        return 0
+    if function == "AVG":
+        return [0, 0]
+    return None
+
+
+def _fold(function, argument, state, values):
+    # One aggregate over one group's non-NULL values from one batch
+    if function == "COUNT":
+        return state + len(values)
+    if not values:
+        return state
+    if function in ("SUM", "AVG"):
+        if not all(isinstance(value, (int, float)) for value in values):
+            raise ValueError(f"{function}({argument}) needs a numeric column.")
+        total = sum(values)
+        if function == "AVG":
+            return [state[0] + total, state[1] + len(values)]
+        return total if state is None else state + total
+    best = min(values) if function == "MIN" else max(values)
+    if state is None:
+        return best
+    return min(state, best) if function == "MIN" else max(state, best)
+
+
+def _final(function, state):
+    if function == "AVG":
+        return state[0] / state[1] if state[1] else None
+    return state
+
+
+def hash_aggregate(rows, group_count, specs):
+    """{group key: [aggregate values]} for an iterator of input tuples.
+
+    specs are (function, argument, input position or None for COUNT(*)).
+    """
+    groups = {}
+    while True:
+        batch = list(itertools.islice(rows, AGGREGATE_BATCH_SIZE))
+        if not batch:
+            break
+        buckets = {}
+        for row in batch:
+            buckets.setdefault(row[:group_count], []).append(row)
+        for key, members in buckets.items():
+            states = groups.get(key)
+            if states is None:
+                states = groups[key] = [_initial(function) for function, _, _ in specs]
+            for number, (function, argument, position) in enumerate(specs):
+                if position is None:
+                    states[number] += len(members)
+                else:
+                    values = [row[position] for row in members if row[position] is not None]
+                    states[number] = _fold(function, argument, states[number], values)
+    return {key: [_final(spec[0], state) for spec, state in zip(specs, states)] for key, states in groups.items()}
+
+
+def _pushdown_groups(plan, store):
+    types = plan['types']
+    groups = {}
+    for key, values in store.aggregate_keys(plan['group_positions'], plan['pushed']):
+        key = tuple(cast_value(part, types[column]) for part, column in zip(key, plan['group_by']))
+        values = [cast_value(value, types[argument]) if function in ("MIN", "MAX") and isinstance(value, str) else value
+                  for (function, argument), value in zip(plan['aggregates'], values)]
+        groups[key] = values
+    return groups
+
+
+def execute_aggregate(db_name, query, transaction=None):
+    """Run an aggregate SELECT and return (column names, list of row tuples)."""
+    store = engine.table(db_name, query.table)
+    if transaction is not None and transaction.db_name == db_name:
+        store = transaction.view(query.table, store)
+    plan = plan_aggregate(db_name, query, store)
+
+    if plan['type'] == 'pushdown':
+        groups = _pushdown_groups(plan, store)
+    else:
+        if query.joins:
+            from join_engine import execute_join
+            _, rows = execute_join(db_name, plan['scan'])
+            rows = iter(rows)
+        else:
+            rows = iterate_plan(plan['scan_plan'], store)
+        specs = [(function, argument, None if argument == "*" else plan['inputs'].index(argument))
+                 for function, argument in plan['aggregates']]
+        groups = hash_aggregate(rows, len(plan['group_by']), specs)
+
+    # Without GROUP BY there is always exactly one row, even for an empty input
+    if not plan['group_by'] and not groups:
+        groups = {(): [_final(function, _initial(function)) for function, _ in plan['aggregates']]}
+
+    result = []
+    for key, values in sorted(groups.items(), key=lambda item: [(value is None, value) for value in item[0]]):
+        aggregated = iter(values)
+        result.append(tuple(
+            next(aggregated) if isinstance(column, tuple) else key[plan['group_by'].index(column)]
+            for column in plan['select']
+        ))
+    return plan['columns'], result
+
+
+def explain_aggregate(db_name, query):
+    plan = plan_aggregate(db_name, query, engine.table(db_name, query.table))
+    aggregates = ", ".join(label(column) for column in plan['aggregates']) or "none"
+    grouping = f" group by {', '.join(plan['group_by'])}" if plan['group_by'] else ""
+    if plan['type'] == 'pushdown':
+        return f"AGGREGATE PUSHDOWN on {query.table} ($group on _id){grouping}\n  aggregates: {aggregates}"
+    if query.joins:
+        from join_engine import explain_join
+        source = explain_join(db_name, plan['scan'])
+    else:
+        source = explain_plan(plan['scan_plan'])
+    lines = [f"HASH AGGREGATE{grouping}", f"  aggregates: {aggregates}"]
+    lines.extend("  " + line for line in source.splitlines())
+    return "\n".join(lines)
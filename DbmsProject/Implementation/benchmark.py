@@ -0,0 +1,259 @@
+# benchmark.py
+# End-to-end load generator: starts main_server in-process on an in-memory MongoDB
+# stand-in (or targets a running server with --host/--port), drives N concurrent
+# clients over the socket protocol and reports throughput and latency percentiles.
+#
+#   python benchmark.py --clients 32 --operations 500 --mix insert=60,delete=20,select=10,show=5,create=5
+#   python benchmark.py --shared-table --mix insert=100 [--no-group-commit]   (concurrent ingest)
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import tempfile
+import threading
+import time
+
+DEFAULT_MIX = "insert=60,delete=20,select=10,show=5,create=5"
+COMMAND_TYPES = ("create", "insert", "delete", "select", "show")
+BENCH_DATABASE = "bench"
+SHARED_TABLE = "load_shared"
+SHARED_ID_STRIDE = 10_000_000  # clients of a shared table use disjoint id ranges
+
+
+def parse_mix(text):
+    """"insert=60,delete=20" -> {'insert': 60.0, 'delete': 20.0}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip().lower()
+        if name not in COMMAND_TYPES:
+            raise ValueError(f"Unknown command type '{name}' in mix (expected one of {', '.join(COMMAND_TYPES)}).")
+        mix[name] = float(weight or 1)
+    if not any(mix.values()):
+        raise ValueError("The command mix needs at least one positive weight.")
+    return mix
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(fraction * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def _free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+
+
+def start_local_server(host, group_commit=True):
+    """Run main_server in a background thread against memory_mongo, in a scratch directory."""
+    # The catalog and JSON mirror files are relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="dbms-bench-"))
+
+    # Only warnings from the server, so its log does not drown the report
+    import metrics
+    metrics.configure_logging("WARNING")
+
+    # The engine has to be in place before the server modules bind it
+    import storage_engine
+    from memory_mongo import MemoryMongoClient
+    storage_engine.set_engine(storage_engine.MongoEngine(client=MemoryMongoClient()))
+    import main_server
+    import group_commit as group_commit_module
+    group_commit_module.GROUP_COMMIT = group_commit
+
+    port = _free_port(host)
+    ready = threading.Event()
+    thread = threading.Thread(
+        target=lambda: asyncio.run(main_server.serve(host, port, ready=ready)),
+        name="bench-server", daemon=True
+    )
+    thread.start()
+    if not ready.wait(30):
+        raise RuntimeError("The server did not start within 30 seconds.")
+    return port
+
+
+class Worker(threading.Thread):
+    """One client connection issuing a random command mix and timing every round trip."""
+
+    def __init__(self, number, host, port, operations, mix, seed, start_barrier, shared_table=False):
+        super().__init__(name=f"bench-client-{number}", daemon=True)
+        self.number = number
+        self.host = host
+        self.port = port
+        self.operations = operations
+        self.mix = mix
+        self.random = random.Random(seed + number)
+        self.start_barrier = start_barrier
+        self.shared_table = shared_table
+        self.latencies = {name: [] for name in COMMAND_TYPES}
+        self.errors = {name: 0 for name in COMMAND_TYPES}
+        self.live_ids = []
+        self.next_id = number * SHARED_ID_STRIDE if shared_table else 0
+        self.tables_created = 0
+        self.failure = None
+
+    def table(self):
+        return SHARED_TABLE if self.shared_table else f"load_{self.number}"
+
+    def next_command(self):
+        kinds = list(self.mix)
+        kind = self.random.choices(kinds, weights=[self.mix[k] for k in kinds])[0]
+        if kind in ("delete", "select") and not self.live_ids:
+            kind = "insert"  # nothing to delete or read yet
+        if kind == "create":
+            self.tables_created += 1
+            return kind, (f"CREATE TABLE extra_{self.number}_{self.tables_created} "
+                          f"(id INT PRIMARY KEY, name VARCHAR(30), score INT)")
+        if kind == "insert":
+            self.next_id += 1
+            self.live_ids.append(self.next_id)
+            return kind, (f"INSERT INTO {self.table()} (id, name, score) "
+                          f"VALUES ({self.next_id}, 'name {self.next_id}', {self.random.randint(0, 100)})")
+        if kind == "delete":
+            position = self.random.randrange(len(self.live_ids))
+            self.live_ids[position], self.live_ids[-1] = self.live_ids[-1], self.live_ids[position]
+            return kind, f"DELETE FROM {self.table()} WHERE id = {self.live_ids.pop()}"
+        if kind == "select":
+            return kind, f"SELECT name, score FROM {self.table()} WHERE id = {self.random.choice(self.live_ids)}"
+        return kind, "SHOW TABLES"
+
+    def run(self):
+        from Client import Client
+        try:
+            with Client(self.host, self.port) as client:
+                client.execute(f"USE {BENCH_DATABASE}")
+                if not self.shared_table:
+                    client.execute(f"CREATE TABLE {self.table()} (id INT PRIMARY KEY, name VARCHAR(30), score INT)")
+                self.start_barrier.wait()
+                for _ in range(self.operations):
+                    kind, command = self.next_command()
+                    started = time.perf_counter()
+                    response = client.execute(command)
+                    self.latencies[kind].append(time.perf_counter() - started)
+                    if response.startswith("Error") or "does not exist" in response:
+                        self.errors[kind] += 1
+        except Exception as e:
+            self.failure = e
+            self.start_barrier.abort()
+
+
+def summarize(workers, elapsed, config):
+    """Throughput and p50/p95/p99 latency (ms) per command type and overall."""
+    def stats(latencies, errors):
+        latencies = sorted(latencies)
+        return {
+            'count': len(latencies),
+            'errors': errors,
+            'throughput_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3) if latencies else 0.0
+        }
+
+    commands = {}
+    everything = []
+    total_errors = 0
+    for kind in COMMAND_TYPES:
+        latencies = [value for worker in workers for value in worker.latencies[kind]]
+        errors = sum(worker.errors[kind] for worker in workers)
+        if latencies:
+            commands[kind] = stats(latencies, errors)
+        everything.extend(latencies)
+        total_errors += errors
+    return {
+        'config': config,
+        'elapsed_sec': round(elapsed, 3),
+        'commands': commands,
+        'total': stats(everything, total_errors)
+    }
+
+
+def format_table(report):
+    header = ("command", "count", "errors", "ops/s", "p50 ms", "p95 ms", "p99 ms", "max ms")
+    rows = []
+    for name, entry in list(report['commands'].items()) + [("TOTAL", report['total'])]:
+        rows.append((name, entry['count'], entry['errors'], entry['throughput_per_sec'],
+                     entry['p50_ms'], entry['p95_ms'], entry['p99_ms'], entry['max_ms']))
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    lines = ["  ".join(str(value).rjust(width) for value, width in zip(header, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    for row in rows:
+        lines.append("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+    return "\n".join(lines)
+
+
+def run_benchmark(clients=16, operations=500, mix=DEFAULT_MIX, host="127.0.0.1", port=None, seed=1,
+                  shared_table=False, group_commit=True):
+    """Run one benchmark and return the report dict; starts a local server when port is None."""
+    mix = parse_mix(mix) if isinstance(mix, str) else mix
+    if port is None:
+        port = start_local_server(host, group_commit)
+
+    from Client import Client
+    with Client(host, port) as client:
+        client.execute(f"CREATE DATABASE {BENCH_DATABASE}")
+        if shared_table:
+            client.execute(f"USE {BENCH_DATABASE}")
+            client.execute(f"CREATE TABLE {SHARED_TABLE} (id INT PRIMARY KEY, name VARCHAR(30), score INT)")
+
+    barrier = threading.Barrier(clients + 1)
+    workers = [Worker(number, host, port, operations, mix, seed, barrier, shared_table) for number in range(clients)]
+    for worker in workers:
+        worker.start()
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        pass
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    failures = [worker.failure for worker in workers if worker.failure is not None]
+    if failures:
+        raise RuntimeError(f"{len(failures)} client(s) failed, first: {failures[0]!r}")
+
+    config = {'clients': clients, 'operations_per_client': operations, 'mix': mix,
+              'host': host, 'port': port, 'seed': seed, 'shared_table': shared_table,
+              'group_commit': group_commit}
+    return summarize(workers, elapsed, config)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the DBMS server over its socket protocol.")
+    parser.add_argument("--clients", type=int, default=16, help="concurrent client connections")
+    parser.add_argument("--operations", type=int, default=500, help="commands per client")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"command weights (default {DEFAULT_MIX})")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=None,
+                        help="benchmark a server that is already running instead of an in-process one")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--shared-table", action="store_true",
+                        help="all clients write to one table instead of one table each")
+    parser.add_argument("--no-group-commit", action="store_true",
+                        help="write every INSERT/DELETE on its own (in-process server only)")
+    parser.add_argument("--json", metavar="FILE", help="also write the JSON report to FILE ('-' for stdout)")
+    args = parser.parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json and args.json != "-" else args.json
+
+    report = run_benchmark(args.clients, args.operations, args.mix, args.host, args.port, args.seed,
+                           args.shared_table, not args.no_group_commit)
+    print(format_table(report))
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    elif json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,698 @@
+# btree.py
+# Page-based B+tree files behind the catalog's BTree indexes (<index>.ind).
+#
+# Page 0 is the file header; every other page is a leaf, an internal node or a free
+# page, all of the file's fixed page size. Leaf entries are (key, primary key,
+# INCLUDE values) in (key, primary key) order, so equal keys are fine and every
+# entry has exactly one place; internal nodes hold (key, primary key) separators.
+# Keys are tuples of index_manager.sort_key parts. Leaves are linked both ways, for
+# ordered scans in either direction.
+#
+# Decoded nodes are kept in an LRU cache. Changed nodes stay pinned in it until
+# commit(), which writes them together behind a rollback journal (<file>-journal):
+# the old images of the pages about to be overwritten are written and synced first,
+# so a crash in the middle of a split is undone when the file is next opened and the
+# tree is back as it was at the last commit.
+import bisect
+import logging
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+BTREE_PAGE_SIZE = int(os.environ.get("DBMS_BTREE_PAGE_SIZE", "4096"))
+BTREE_CACHE_PAGES = int(os.environ.get("DBMS_BTREE_CACHE_PAGES", "256"))  # decoded nodes kept per file
+BTREE_FSYNC = os.environ.get("DBMS_BTREE_FSYNC", "1") != "0"  # without it a power loss may still tear a commit
+BULK_FILL_FACTOR = 0.9  # bulk-loaded pages leave room for later inserts before they split
+SCAN_BATCH = 256        # entries a scan collects per hold of the tree lock
+
+MAGIC = b"DBMSBPT1"
+JOURNAL_MAGIC = b"DBMSJRN1"
+
+_LEAF = 1
+_INTERNAL = 2
+_FREE = 3
+
+# magic, page size, root, first leaf, last leaf, first free page, page count, height, entries, signature length
+_HEADER = struct.Struct("<8sIIIIIIHQH")
+_LEAF_HEADER = struct.Struct("<BHII")    # kind, entries, previous leaf, next leaf (0: none)
+_INTERNAL_HEADER = struct.Struct("<BH")  # kind, separators; one more child page number follows than separators
+_FREE_HEADER = struct.Struct("<BI")      # kind, next free page
+_JOURNAL_HEADER = struct.Struct("<8sIII")  # magic, page size, page count before the commit, saved pages
+_PAGE = struct.Struct("<I")
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LENGTH = struct.Struct("<I")
+
+log = logging.getLogger("dbms.btree")
+
+
+def max_entry_size(page_size):
+    # Entries stay below a quarter page, so a split always leaves two pages that fit
+    return (page_size - 32) // 4
+
+
+def page_size_for(entry_size):
+    """The page size for entries of up to entry_size bytes: BTREE_PAGE_SIZE, doubled as needed."""
+    page_size = BTREE_PAGE_SIZE
+    while max_entry_size(page_size) < entry_size:
+        page_size *= 2
+    return page_size
+
+
+def _encode_value(value, out):
+    # Tagged values: 0 NULL, 1 integer, 2 float, 3 text, 4 integer too large for 8 bytes
+    if value is None:
+        out.append(0)
+    elif isinstance(value, float):
+        out.append(2)
+        out += _FLOAT.pack(value)
+    elif isinstance(value, int) and -(1 << 63) <= value < (1 << 63):
+        out.append(1)
+        out += _INT.pack(value)
+    else:
+        data = str(value).encode('utf-8')
+        out.append(4 if isinstance(value, int) else 3)
+        out += _LENGTH.pack(len(data))
+        out += data
+
+
+def _decode_value(data, offset):
+    tag = data[offset]
+    offset += 1
+    if tag == 0:
+        return None, offset
+    if tag == 1:
+        return _INT.unpack_from(data, offset)[0], offset + 8
+    if tag == 2:
+        return _FLOAT.unpack_from(data, offset)[0], offset + 8
+    (length,) = _LENGTH.unpack_from(data, offset)
+    offset += 4
+    text = data[offset:offset + length].decode('utf-8')
+    return (int(text) if tag == 4 else text), offset + length
+
+
+def _part(value):
+    # The sort_key part a stored value came from
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value)
+
+
+def _encode_separator(key, primary_key):
+    # bytearray, so _encode_entry can append the INCLUDE values
+    out = bytearray((len(key),))
+    for part in key:
+        _encode_value(None if part[0] == 0 else part[1], out)
+    _encode_value(primary_key, out)
+    return out
+
+
+def _encode_entry(key, primary_key, included):
+    out = _encode_separator(key, primary_key)
+    if included is None:
+        out.append(255)
+    else:
+        out.append(len(included))
+        for value in included:
+            _encode_value(value, out)
+    return bytes(out)
+
+
+def _decode_separator(data, offset):
+    count = data[offset]
+    offset += 1
+    parts = []
+    for _ in range(count):
+        value, offset = _decode_value(data, offset)
+        parts.append(_part(value))
+    primary_key, offset = _decode_value(data, offset)
+    return (tuple(parts), primary_key), offset
+
+
+def _decode_included(data, offset):
+    count = data[offset]
+    offset += 1
+    if count == 255:
+        return None, offset
+    values = []
+    for _ in range(count):
+        value, offset = _decode_value(data, offset)
+        values.append(value)
+    return tuple(values), offset
+
+
+class _Node:
+    """A decoded page. keys are (key, primary key) tuples; blobs their encoded bytes."""
+
+    __slots__ = ("page", "kind", "keys", "blobs", "included", "children", "previous", "next", "size")
+
+    def __init__(self, page, kind):
+        self.page = page
+        self.kind = kind
+        self.keys = []
+        self.blobs = []
+        self.included = []   # leaves: INCLUDE values per entry
+        self.children = []   # internal nodes: child page numbers, one more than keys
+        self.previous = 0    # leaves: neighbours; free pages: next is the next free page
+        self.next = 0
+        self.size = _LEAF_HEADER.size if kind == _LEAF else _INTERNAL_HEADER.size
+
+    def encode(self, page_size):
+        if self.kind == _LEAF:
+            parts = [_LEAF_HEADER.pack(_LEAF, len(self.keys), self.previous, self.next)]
+        elif self.kind == _INTERNAL:
+            parts = [_INTERNAL_HEADER.pack(_INTERNAL, len(self.keys)),
+                     struct.pack(f"<{len(self.children)}I", *self.children)]
+        else:
+            return _FREE_HEADER.pack(_FREE, self.next).ljust(page_size, b"\0")
+        parts.extend(self.blobs)
+        return b"".join(parts).ljust(page_size, b"\0")
+
+
+def _decode_node(page, data):
+    kind = data[0]
+    node = _Node(page, kind)
+    if kind == _LEAF:
+        _, count, node.previous, node.next = _LEAF_HEADER.unpack_from(data, 0)
+        offset = _LEAF_HEADER.size
+        for _ in range(count):
+            start = offset
+            entry, offset = _decode_separator(data, offset)
+            included, offset = _decode_included(data, offset)
+            node.keys.append(entry)
+            node.included.append(included)
+            node.blobs.append(data[start:offset])
+        node.size = offset
+    elif kind == _INTERNAL:
+        _, count = _INTERNAL_HEADER.unpack_from(data, 0)
+        offset = _INTERNAL_HEADER.size
+        node.children = list(struct.unpack_from(f"<{count + 1}I", data, offset))
+        offset += 4 * (count + 1)
+        for _ in range(count):
+            start = offset
+            entry, offset = _decode_separator(data, offset)
+            node.keys.append(entry)
+            node.blobs.append(data[start:offset])
+        node.size = offset
+    elif kind == _FREE:
+        _, node.next = _FREE_HEADER.unpack_from(data, 0)
+    else:
+        raise ValueError(f"page {page} has unknown kind {kind}")
+    return node
+
+
+def _build(path, page_size, signature, entries):
+    """Write a new tree file from entries sorted by (key, primary key); returns the entry count."""
+    capacity = int(page_size * BULK_FILL_FACTOR)
+    count = 0
+    with open(path, "wb") as file:
+        file.write(b"\0" * page_size)  # the header, written last
+
+        # Leaves are written in order, so every full leaf's successor is the next page
+        level = []  # (first entry, page) of every node of the level just written
+        leaf = _Node(1, _LEAF)
+        for key, primary_key, included in entries:
+            blob = _encode_entry(key, primary_key, included)
+            if leaf.keys and leaf.size + len(blob) > capacity:
+                leaf.next = leaf.page + 1
+                file.write(leaf.encode(page_size))
+                level.append((leaf.keys[0], leaf.page))
+                previous = leaf.page
+                leaf = _Node(previous + 1, _LEAF)
+                leaf.previous = previous
+            leaf.keys.append((key, primary_key))
+            leaf.blobs.append(blob)
+            leaf.size += len(blob)
+            count += 1
+        file.write(leaf.encode(page_size))
+        level.append((leaf.keys[0] if leaf.keys else None, leaf.page))
+        first_leaf, last_leaf = 1, leaf.page
+        next_page = leaf.page + 1
+
+        # Then one level of internal nodes at a time, until a single root is left
+        height = 1
+        while len(level) > 1:
+            upper = []
+            node, first = _Node(next_page, _INTERNAL), level[0][0]
+            node.children.append(level[0][1])
+            node.size += 4
+            for entry, child in level[1:]:
+                blob = _encode_separator(*entry)
+                if len(node.children) >= 2 and node.size + len(blob) + 4 > capacity:
+                    file.write(node.encode(page_size))
+                    upper.append((first, node.page))
+                    next_page += 1
+                    node, first = _Node(next_page, _INTERNAL), entry
+                    node.children.append(child)
+                    node.size += 4
+                    continue
+                node.keys.append(entry)
+                node.blobs.append(bytes(blob))
+                node.children.append(child)
+                node.size += len(blob) + 4
+            file.write(node.encode(page_size))
+            upper.append((first, node.page))
+            next_page += 1
+            level = upper
+            height += 1
+
+        signature = signature.encode('utf-8')
+        file.seek(0)
+        file.write(_HEADER.pack(MAGIC, page_size, level[0][1], first_leaf, last_leaf, 0, next_page,
+                                height, count, len(signature)) + signature)
+        file.flush()
+        if BTREE_FSYNC:
+            os.fsync(file.fileno())
+    return count
+
+
+class BPlusTree:
+    """One index file: (key, primary key) entries in order, with their INCLUDE values.
+
+    signature describes what the entries are made of; a file with another signature
+    (or an unreadable one) is started again empty, and reused is False.
+    """
+
+    def __init__(self, path, page_size=BTREE_PAGE_SIZE, signature=""):
+        self.path = path
+        self.journal_path = path + "-journal"
+        self.signature = signature
+        self.lock = threading.RLock()
+        self.cache = OrderedDict()  # page -> _Node, least recently used first
+        self.dirty = set()          # pages changed since the last commit; never evicted
+        self.hits = 0
+        self.misses = 0
+        self.file = None
+        self.reused = False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if os.path.exists(path):
+            try:
+                self._recover()
+                self._open()
+                self.reused = True
+            except (OSError, ValueError, struct.error) as e:
+                log.warning("Index file %s cannot be used (%s); it is rebuilt.", path, e)
+                self._close_file()
+        if not self.reused:
+            self.page_size = page_size
+            self.bulk_load([])
+
+    # ----- file -----
+
+    def _recover(self):
+        # A journal left behind means a commit was cut short: put the saved pages back
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb") as journal:
+            data = journal.read()
+        valid = len(data) >= _JOURNAL_HEADER.size + 4
+        if valid:
+            magic, page_size, page_count, saved = _JOURNAL_HEADER.unpack_from(data, 0)
+            valid = (magic == JOURNAL_MAGIC
+                     and len(data) == _JOURNAL_HEADER.size + saved * (4 + page_size) + 4
+                     and _PAGE.unpack_from(data, len(data) - 4)[0] == zlib.crc32(data[:-4]))
+        if valid:
+            with open(self.path, "r+b") as file:
+                offset = _JOURNAL_HEADER.size
+                for _ in range(saved):
+                    (page,) = _PAGE.unpack_from(data, offset)
+                    os.pwrite(file.fileno(), data[offset + 4:offset + 4 + page_size], page * page_size)
+                    offset += 4 + page_size
+                file.truncate(page_count * page_size)
+                file.flush()
+                os.fsync(file.fileno())
+            log.warning("Index file %s: rolled back a commit interrupted by a crash.", self.path)
+        # An incomplete journal was never followed by writes to the file itself
+        os.remove(self.journal_path)
+
+    def _open(self):
+        self.file = open(self.path, "r+b")
+        data = os.pread(self.file.fileno(), _HEADER.size, 0)
+        if len(data) < _HEADER.size:
+            raise ValueError("truncated header")
+        (magic, self.page_size, self.root, self.first_leaf, self.last_leaf, self.free_page,
+         self.page_count, self.height, self.entry_count, signature_length) = _HEADER.unpack(data)
+        if magic != MAGIC:
+            raise ValueError("not an index file")
+        signature = os.pread(self.file.fileno(), signature_length, _HEADER.size).decode('utf-8', 'replace')
+        if signature != self.signature:
+            raise ValueError(f"built for {signature!r}")
+        if os.path.getsize(self.path) < self.page_count * self.page_size:
+            raise ValueError("truncated file")
+        self.file_pages = self.page_count
+
+    def _close_file(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def _read_page(self, page):
+        data = os.pread(self.file.fileno(), self.page_size, page * self.page_size)
+        if len(data) != self.page_size:
+            raise ValueError(f"page {page} is beyond the end of {self.path}")
+        return data
+
+    def _header_bytes(self):
+        signature = self.signature.encode('utf-8')
+        return (_HEADER.pack(MAGIC, self.page_size, self.root, self.first_leaf, self.last_leaf, self.free_page,
+                             self.page_count, self.height, self.entry_count, len(signature)) + signature)
+
+    # ----- node cache -----
+
+    def _node(self, page):
+        node = self.cache.get(page)
+        if node is not None:
+            self.cache.move_to_end(page)
+            self.hits += 1
+            return node
+        self.misses += 1
+        node = _decode_node(page, self._read_page(page))
+        self.cache[page] = node
+        return node
+
+    def _evict(self):
+        # Called once an operation is done, so no node it still holds is dropped midway.
+        # Least recently used clean nodes go first; changed ones wait for the commit
+        while len(self.cache) > BTREE_CACHE_PAGES:
+            for page in self.cache:
+                if page not in self.dirty:
+                    break
+            else:
+                return
+            del self.cache[page]
+
+    def _allocate(self, kind):
+        if self.free_page:
+            page = self.free_page
+            self.free_page = self._node(page).next
+        else:
+            page = self.page_count
+            self.page_count += 1
+        node = _Node(page, kind)
+        self.cache[page] = node
+        self.dirty.add(page)
+        return node
+
+    def _release(self, node):
+        node.kind = _FREE
+        node.keys, node.blobs, node.included, node.children = [], [], [], []
+        node.next = self.free_page
+        self.free_page = node.page
+        self.dirty.add(node.page)
+
+    # ----- search -----
+
+    def _descend(self, target):
+        # The leaf where target belongs, and the (internal node, child position) path to it
+        path = []
+        node = self._node(self.root)
+        while node.kind == _INTERNAL:
+            position = bisect.bisect_right(node.keys, target)
+            path.append((node, position))
+            node = self._node(node.children[position])
+        return node, path
+
+    def _seek(self, target, after):
+        # Leaf and position of the first entry >= target (> target when after)
+        if target is None:
+            return self._node(self.first_leaf), 0
+        leaf, _ = self._descend(target)
+        search = bisect.bisect_right if after else bisect.bisect_left
+        return leaf, search(leaf.keys, target)
+
+    def _seek_back(self, target, inclusive):
+        # Leaf and position of the last entry < target (<= target when inclusive)
+        if target is None:
+            leaf = self._node(self.last_leaf)
+            return leaf, len(leaf.keys) - 1
+        leaf, _ = self._descend(target)
+        search = bisect.bisect_right if inclusive else bisect.bisect_left
+        return leaf, search(leaf.keys, target) - 1
+
+    def scan(self, start=None, end=None, reverse=False):
+        """Yield (key, primary key, INCLUDE values) with start <= (key, primary key) < end.
+
+        start and end are tuples compared with (key, primary key), None for no bound.
+        Each batch is found again from the root, so writes between batches cannot
+        make the scan skip or repeat entries.
+        """
+        resume = None
+        while True:
+            batch = []
+            done = False
+            with self.lock:
+                if reverse:
+                    leaf, position = self._seek_back(end, False) if resume is None else self._seek_back(resume, False)
+                else:
+                    leaf, position = self._seek(start, False) if resume is None else self._seek(resume, True)
+                while len(batch) < SCAN_BATCH:
+                    if reverse and position < 0:
+                        if not leaf.previous:
+                            done = True
+                            break
+                        leaf = self._node(leaf.previous)
+                        position = len(leaf.keys) - 1
+                        continue
+                    if not reverse and position >= len(leaf.keys):
+                        if not leaf.next:
+                            done = True
+                            break
+                        leaf, position = self._node(leaf.next), 0
+                        continue
+                    entry = leaf.keys[position]
+                    if (start is not None and entry < start) if reverse else (end is not None and entry >= end):
+                        done = True
+                        break
+                    batch.append((entry[0], entry[1], leaf.included[position]))
+                    position += -1 if reverse else 1
+                self._evict()
+            yield from batch
+            if done:
+                return
+            resume = batch[-1][:2]
+
+    def __len__(self):
+        return self.entry_count
+
+    # ----- changes -----
+
+    def fits(self, key, primary_key, included):
+        return len(_encode_entry(key, primary_key, included)) <= max_entry_size(self.page_size)
+
+    def insert(self, key, primary_key, included=None):
+        entry = (key, primary_key)
+        blob = _encode_entry(key, primary_key, included)
+        if len(blob) > max_entry_size(self.page_size):
+            raise ValueError(f"index entry of {len(blob)} bytes does not fit a {self.page_size}-byte page")
+        with self.lock:
+            leaf, path = self._descend(entry)
+            position = bisect.bisect_left(leaf.keys, entry)
+            if position < len(leaf.keys) and leaf.keys[position] == entry:
+                # Already there: only the INCLUDE values can differ
+                leaf.size += len(blob) - len(leaf.blobs[position])
+                leaf.blobs[position] = blob
+                leaf.included[position] = included
+            else:
+                leaf.keys.insert(position, entry)
+                leaf.blobs.insert(position, blob)
+                leaf.included.insert(position, included)
+                leaf.size += len(blob)
+                self.entry_count += 1
+            self.dirty.add(leaf.page)
+            if leaf.size > self.page_size:
+                self._split_leaf(leaf, path)
+            self._evict()
+
+    def _split_point(self, node):
+        # First position of the right half: about half the bytes on either side
+        half = (node.size - _LEAF_HEADER.size) / 2
+        total = 0
+        for position, blob in enumerate(node.blobs):
+            total += len(blob)
+            if total >= half:
+                return min(max(position, 1), len(node.blobs) - 1)
+        return len(node.blobs) // 2
+
+    def _split_leaf(self, leaf, path):
+        middle = self._split_point(leaf)
+        right = self._allocate(_LEAF)
+        right.keys, leaf.keys = leaf.keys[middle:], leaf.keys[:middle]
+        right.blobs, leaf.blobs = leaf.blobs[middle:], leaf.blobs[:middle]
+        right.included, leaf.included = leaf.included[middle:], leaf.included[:middle]
+        moved = sum(len(blob) for blob in right.blobs)
+        right.size += moved
+        leaf.size -= moved
+
+        right.previous, right.next = leaf.page, leaf.next
+        if leaf.next:
+            following = self._node(leaf.next)
+            following.previous = right.page
+            self.dirty.add(following.page)
+        else:
+            self.last_leaf = right.page
+        leaf.next = right.page
+        self._add_separator(path, right.keys[0], right.page)
+
+    def _add_separator(self, path, entry, right_page):
+        # entry is the first entry under right_page, the new right sibling of the path's last node
+        blob = bytes(_encode_separator(*entry))
+        if not path:
+            root = self._allocate(_INTERNAL)
+            root.keys, root.blobs, root.children = [entry], [blob], [self.root, right_page]
+            root.size += len(blob) + 8
+            self.root = root.page
+            self.height += 1
+            return
+        parent, position = path.pop()
+        parent.keys.insert(position, entry)
+        parent.blobs.insert(position, blob)
+        parent.children.insert(position + 1, right_page)
+        parent.size += len(blob) + 4
+        self.dirty.add(parent.page)
+        if parent.size <= self.page_size:
+            return
+
+        # The middle separator moves up; the ones after it go to a new right node
+        middle = min(max(self._split_point(parent), 1), len(parent.keys) - 2)
+        up = parent.keys[middle]
+        right = self._allocate(_INTERNAL)
+        right.keys, right.blobs = parent.keys[middle + 1:], parent.blobs[middle + 1:]
+        right.children = parent.children[middle + 1:]
+        parent.keys, parent.blobs = parent.keys[:middle], parent.blobs[:middle]
+        parent.children = parent.children[:middle + 1]
+        for node in (parent, right):
+            node.size = _INTERNAL_HEADER.size + 4 * len(node.children) + sum(len(blob) for blob in node.blobs)
+        self._add_separator(path, up, right.page)
+
+    def delete(self, key, primary_key):
+        """Remove one entry; returns whether it was there."""
+        entry = (key, primary_key)
+        with self.lock:
+            leaf, path = self._descend(entry)
+            position = bisect.bisect_left(leaf.keys, entry)
+            if position == len(leaf.keys) or leaf.keys[position] != entry:
+                return False
+            leaf.size -= len(leaf.blobs[position])
+            del leaf.keys[position]
+            del leaf.blobs[position]
+            del leaf.included[position]
+            self.entry_count -= 1
+            self.dirty.add(leaf.page)
+            # Pages are not merged; a leaf that runs empty is unlinked and reused later
+            if not leaf.keys and path and len(path[-1][0].children) > 1:
+                self._remove_leaf(leaf, path[-1])
+            self._evict()
+            return True
+
+    def _remove_leaf(self, leaf, parent_position):
+        parent, position = parent_position
+        if leaf.previous:
+            before = self._node(leaf.previous)
+            before.next = leaf.next
+            self.dirty.add(before.page)
+        else:
+            self.first_leaf = leaf.next
+        if leaf.next:
+            after = self._node(leaf.next)
+            after.previous = leaf.previous
+            self.dirty.add(after.page)
+        else:
+            self.last_leaf = leaf.previous
+        # Everything the leaf covered now belongs to a neighbour under the same parent
+        separator = position - 1 if position > 0 else 0
+        parent.size -= len(parent.blobs[separator]) + 4
+        del parent.keys[separator]
+        del parent.blobs[separator]
+        del parent.children[position]
+        self.dirty.add(parent.page)
+        self._release(leaf)
+
+        # A root left with a single child hands the role to it
+        root = self._node(self.root)
+        while root.kind == _INTERNAL and len(root.children) == 1:
+            self.root = root.children[0]
+            self.height -= 1
+            self._release(root)
+            root = self._node(self.root)
+
+    def commit(self):
+        """Write every changed page; a crash part-way is rolled back when the file is next opened."""
+        with self.lock:
+            if not self.dirty:
+                return
+            pages = sorted(self.dirty)
+            fd = self.file.fileno()
+            # The old images of the header and of every existing page about to change
+            saved = [0] + [page for page in pages if page < self.file_pages]
+            journal = bytearray(_JOURNAL_HEADER.pack(JOURNAL_MAGIC, self.page_size, self.file_pages, len(saved)))
+            for page in saved:
+                journal += _PAGE.pack(page)
+                journal += self._read_page(page)
+            journal += _PAGE.pack(zlib.crc32(journal))
+            with open(self.journal_path, "wb") as file:
+                file.write(journal)
+                file.flush()
+                if BTREE_FSYNC:
+                    os.fsync(file.fileno())
+
+            for page in pages:
+                os.pwrite(fd, self.cache[page].encode(self.page_size), page * self.page_size)
+            os.pwrite(fd, self._header_bytes(), 0)
+            if BTREE_FSYNC:
+                os.fsync(fd)
+            # Removing the journal is what makes the commit final
+            os.remove(self.journal_path)
+            self.file_pages = self.page_count
+            self.dirty.clear()
+            self._evict()
+
+    def bulk_load(self, entries):
+        """Replace the whole tree with entries sorted by (key, primary key), packing pages in order.
+
+        The new file is written next to the old one and swapped in, so a crash leaves
+        one or the other. entries may be a scan of this tree.
+        """
+        with self.lock:
+            temporary = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                _build(temporary, self.page_size, self.signature, entries)
+            except BaseException:
+                if os.path.exists(temporary):
+                    os.remove(temporary)
+                raise
+            self._close_file()
+            os.replace(temporary, self.path)
+            self.cache.clear()
+            self.dirty.clear()
+            self._open()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': self.entry_count,
+                'height': self.height,
+                'pages': self.page_count,
+                'page_size': self.page_size,
+                'file_bytes': self.page_count * self.page_size,
+                'cache_hits': self.hits,
+                'cache_misses': self.misses
+            }
+
+    def close(self):
+        with self.lock:
+            if self.file is not None:
+                self.commit()
+                self._close_file()
+
+    def drop(self):
+        with self.lock:
+            self._close_file()
+            self.cache.clear()
+            self.dirty.clear()
+            for path in (self.path, self.journal_path):
+                if os.path.exists(path):
+                    os.remove(path)
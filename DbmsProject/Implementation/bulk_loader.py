@@ -0,0 +1,343 @@
+# bulk_loader.py
+# Streams CSV or JSON files into a table in chunks, for LOAD DATA and from the command line:
+#
+#   python bulk_loader.py <database> <table> <file> [--format csv|json|jsonl] [--chunk-size N] [--defer-foreign-keys]
+#
+# LOAD DATA, which takes its path from the client, only reads files under FILE_DIR and,
+# by their file name, the JSON mirror snapshots of the current database's tables (so a
+# table can be restored from its mirror). The command line loads any file the operator names.
+#
+# Every chunk is validated against the catalog schema and written with one duplicate
+# query and one insert_many. Index entries are collected and merged into the table's
+# indexes once at the end, and the JSON mirror is re-snapshotted once, instead of
+# per row. Files ending in .gz are decompressed on the fly.
+import argparse
+import csv
+import gzip
+import json
+import os
+import sys
+import time
+
+import foreign_keys
+import index_manager
+import json_mirror
+import table_stats
+import wal
+from db_catalog import get_table, init_catalog, list_table_names
+from db_operations import engine
+from record_codec import build_document, codec_for
+
+LOAD_CHUNK_SIZE = int(os.environ.get("DBMS_LOAD_CHUNK_SIZE", "5000"))
+# Directory LOAD DATA reads from and EXPORT TABLE writes to; client paths are relative to it
+FILE_DIR = os.environ.get("DBMS_FILE_DIR", "files")
+READ_SIZE = 1 << 16       # characters read at a time from JSON array files
+MAX_RECORD_SIZE = 1 << 24  # a JSON record longer than this is treated as malformed
+MAX_REPORTED_ERRORS = 10  # rejected rows listed in the summary; the rest are only counted
+
+FORMATS = ("CSV", "JSON", "JSONL")
+_EXTENSIONS = {".csv": "CSV", ".json": "JSON", ".jsonl": "JSONL", ".ndjson": "JSONL"}
+
+
+def detect_format(path, file_format=None):
+    if file_format:
+        file_format = file_format.upper()
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown file format '{file_format}' (expected one of {', '.join(FORMATS)}).")
+        return file_format
+    name = path[:-3] if path.lower().endswith(".gz") else path
+    extension = os.path.splitext(name)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f"Cannot tell the format of '{path}'; add FORMAT CSV, JSON or JSONL.")
+    return _EXTENSIONS[extension]
+
+
+def resolve_path(path):
+    """The file a client-given path names inside FILE_DIR; ValueError for absolute paths
+    and for paths that lead out of it (through '..' or a symbolic link)."""
+    if os.path.isabs(path) or os.path.splitdrive(path)[0]:
+        raise ValueError(f"Path '{path}' must be relative to the file directory.")
+    base = os.path.realpath(FILE_DIR)
+    full = os.path.realpath(os.path.join(base, path))
+    if os.path.commonpath([base, full]) != base:
+        raise ValueError(f"Path '{path}' is outside the file directory.")
+    return full
+
+
+def open_text(path, mode="r", compressed=None):
+    # Text mode with universal newlines left to the csv module; gzip by extension unless given
+    if compressed is None:
+        compressed = path.lower().endswith(".gz")
+    if compressed:
+        return gzip.open(path, mode + "t", encoding="utf-8", newline="")
+    return open(path, mode, encoding="utf-8", newline="")
+
+
+def _json_array_items(file):
+    """Yield the elements of a top-level JSON array without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    opened = False
+    while True:
+        # Skip whitespace and separators, reading more when the buffer runs out
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position < len(buffer):
+                break
+            buffer, position = file.read(READ_SIZE), 0
+            if not buffer:
+                raise ValueError("Unexpected end of file inside the JSON array.")
+
+        if not opened:
+            if buffer[position] != "[":
+                raise ValueError("Expected a JSON array of records.")
+            opened = True
+            position += 1
+            continue
+        if buffer[position] == "]":
+            return
+
+        # An item may span several reads
+        while True:
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+                break
+            except json.JSONDecodeError:
+                more = file.read(READ_SIZE)
+                if not more or len(buffer) - position > MAX_RECORD_SIZE:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+        yield item
+
+
+def _json_lines_items(file):
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _record_values(item, codec):
+    # A mirror record {"key": "pk1#pk2", "value": "v1#v2"} or a plain {column: value} object
+    if not isinstance(item, dict):
+        return None, "Error: Expected a JSON object."
+    if set(item) == {"key", "value"}:
+        key_parts = str(item["key"]).split('#')
+        value = item["value"] or ""
+        value_parts = value.split('#') if value != "" else []
+        values = {pk: key_parts[i] if i < len(key_parts) else '' for i, pk in enumerate(codec.primary_keys)}
+        for i, column in enumerate(codec.columns):
+            values[column] = value_parts[i] if i < len(value_parts) else ''
+        return values, None
+    return {column: '' if value is None else value for column, value in item.items()}, None
+
+
+def read_rows(file, file_format, table_info):
+    """Yield (row_number, values, error) for every record of the file."""
+    if file_format == "CSV":
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        header = [name.strip() for name in header]
+        for row_number, row in enumerate(reader, start=1):
+            if not row:
+                continue
+            if len(row) != len(header):
+                yield row_number, None, f"Error: Expected {len(header)} fields but found {len(row)}."
+                continue
+            yield row_number, dict(zip(header, row)), None
+        return
+
+    codec = codec_for(table_info)
+    items = _json_array_items(file) if file_format == "JSON" else _json_lines_items(file)
+    for row_number, item in enumerate(items, start=1):
+        values, error = _record_values(item, codec)
+        yield row_number, values, error
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkLoad:
+    """State of one load: counters, pending index entries and the UNIQUE keys written so far."""
+
+    def __init__(self, db_name, table_info, store, deferred=None):
+        self.db_name = db_name
+        self.table_info = table_info
+        self.store = store
+        self.deferred = deferred
+        self.allowed = set(table_info['attributes'])
+        # Built before loading, so rows can be checked against what was there already
+        self.indexes = index_manager.table_indexes(db_name, table_info, store)
+        self.index_entries = {index.name: [] for index in self.indexes}
+        self.unique_seen = {}
+        self.total = 0
+        self.loaded = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, row_number, error):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Row {row_number}: {error}")
+
+    def load_chunk(self, chunk):
+        self.total += len(chunk)
+        documents = []  # (row_number, document, values)
+        chunk_keys = set()
+        for row_number, values, error in chunk:
+            if error is None:
+                invalid_fields = set(values) - self.allowed
+                if invalid_fields:
+                    error = f"Error: Invalid field(s) {', '.join(sorted(invalid_fields))} for table '{self.table_info['name']}'."
+            if error is None:
+                document, error = build_document(values, self.table_info)
+            if error is None and document["_id"] in chunk_keys:
+                error = "Error: Duplicate primary key within the file."
+            if error is not None:
+                self.reject(row_number, error)
+                continue
+            chunk_keys.add(document["_id"])
+            documents.append((row_number, document, values))
+
+        def keep(rejected):
+            for position, error in rejected.items():
+                self.reject(documents[position][0], error)
+            return [entry for position, entry in enumerate(documents) if position not in rejected]
+
+        # Earlier chunks are already stored, so one query also catches duplicates between chunks
+        if documents:
+            existing = self.store.existing_keys([document["_id"] for _, document, _ in documents])
+            documents = keep({
+                position: "Error: Record with this primary key already exists."
+                for position, (_, document, _) in enumerate(documents) if document["_id"] in existing
+            })
+        if documents and self.deferred is None:
+            documents = keep(foreign_keys.check_parents(
+                self.db_name, self.table_info, [values for _, _, values in documents]))
+        if documents:
+            documents = keep(index_manager.check_unique(
+                self.db_name, self.table_info, self.store, [values for _, _, values in documents], self.unique_seen))
+        if not documents:
+            return
+
+        documents = keep(self.store.insert_many([document for _, document, _ in documents]))
+        table_stats.record_documents(self.db_name, self.table_info, [document for _, document, _ in documents], 1)
+        for index in self.indexes:
+            self.index_entries[index.name].extend(
+                index.make_entry(values, document["_id"]) for _, document, values in documents)
+        if self.deferred is not None:
+            self.deferred.add(self.db_name, self.table_info['name'],
+                              [(document["_id"], values) for _, document, values in documents])
+        self.loaded += len(documents)
+
+    def finish(self):
+        # One merge per index and one mirror snapshot for the whole load
+        for index in self.indexes:
+            if self.index_entries[index.name]:
+                index.extend(self.index_entries[index.name])
+            self.index_entries[index.name] = []
+        if self.loaded:
+            json_mirror.rebuild_table(self.store, self.db_name, self.table_info['name'])
+            # Loaded rows are not logged one by one; a checkpoint makes them durable instead
+            # (and drops older records of this table, which replaying would apply over them)
+            wal.checkpoint()
+
+    def summary(self, elapsed, error=None):
+        rate = self.loaded / elapsed if elapsed > 0 else 0.0
+        lines = [error] if error else []
+        lines.append(f"Loaded {self.loaded} of {self.total} row(s) into table {self.table_info['name']} "
+                     f"in {elapsed:.2f}s ({rate:.0f} rows/sec).")
+        if self.rejected:
+            lines.append(f"{self.rejected} row(s) rejected:")
+            lines.extend(self.errors)
+            if self.rejected > len(self.errors):
+                lines.append(f"... and {self.rejected - len(self.errors)} more.")
+        return "\n".join(lines)
+
+
+def load_file(db_name, table_name, path, file_format=None, chunk_size=None, deferred=None):
+    """LOAD DATA: load a file under FILE_DIR, or a mirror snapshot of the current database
+    named as json_mirror.snapshot_path names it, into a table; returns the summary message."""
+    try:
+        full_path = resolve_path(path)
+    except ValueError as e:
+        return f"Error: {e}"
+    # The mirror writes its snapshots to the working directory, not to FILE_DIR
+    if not os.path.isfile(full_path) and db_name and path in {
+            json_mirror.snapshot_path(db_name, name) for name in list_table_names(db_name)}:
+        full_path = os.path.abspath(path)
+    return load_path(db_name, table_name, full_path, file_format, chunk_size, deferred, shown_path=path)
+
+
+def load_path(db_name, table_name, path, file_format=None, chunk_size=None, deferred=None, shown_path=None):
+    """Load a CSV/JSON file into a table; returns the summary message. Messages name
+    the file as shown_path (the path the client gave), if set."""
+    shown_path = shown_path or path
+    if not db_name:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    table_info = get_table(db_name, table_name)
+    if table_info is None:
+        return f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."
+    try:
+        file_format = detect_format(shown_path, file_format)
+    except ValueError as e:
+        return f"Error: {e}"
+    if not os.path.isfile(path):
+        return f"Error: File '{shown_path}' does not exist."
+
+    load = BulkLoad(db_name, table_info, engine.table(db_name, table_name), deferred)
+    started = time.perf_counter()
+    error = None
+    try:
+        with open_text(path) as file:
+            for chunk in _chunks(read_rows(file, file_format, table_info), chunk_size or LOAD_CHUNK_SIZE):
+                load.load_chunk(chunk)
+    except (ValueError, csv.Error, OSError, EOFError) as e:
+        # Rows written before the problem stay loaded
+        error = f"Error reading {shown_path} after {load.total} row(s): {e}"
+    finally:
+        load.finish()
+    return load.summary(time.perf_counter() - started, error)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load a CSV or JSON file into a table.")
+    parser.add_argument("database")
+    parser.add_argument("table")
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=[name.lower() for name in FORMATS],
+                        help="file format (default: from the file extension)")
+    parser.add_argument("--chunk-size", type=int, default=LOAD_CHUNK_SIZE, help="rows validated and written together")
+    parser.add_argument("--defer-foreign-keys", action="store_true",
+                        help="check foreign keys once after the load instead of per chunk")
+    args = parser.parse_args(argv)
+
+    if init_catalog() is None:
+        print("Failed to load catalog.")
+        return 1
+    wal.recover()
+    deferred = foreign_keys.DeferredChecks() if args.defer_foreign_keys else None
+    print(load_path(args.database, args.table, args.file, args.format, args.chunk_size, deferred))
+    if deferred is not None:
+        violations = deferred.verify()
+        if violations:
+            print(f"{len(violations)} foreign key violation(s):")
+            for violation in violations:
+                print(violation)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# cursors.py
+import itertools
+import os
+
+from query_engine import open_select, format_result
+
+# OPEN keeps a SELECT's row iterator in the session instead of building the whole
+# result; every FETCH pulls the next rows from it, so the server holds one batch of
+# a large result at a time. Full scans read CURSOR_BATCH_SIZE rows per backend round
+# trip (see storage_engine). Each FETCH sees the table as it is when it runs.
+CURSOR_FETCH_SIZE = int(os.environ.get("DBMS_CURSOR_FETCH_SIZE", "100"))  # rows per FETCH without a count
+MAX_CURSORS = 16  # open cursors per connection
+
+_END = object()
+
+
+class Cursor:
+    """An open SELECT result, read a batch at a time by FETCH."""
+
+    def __init__(self, name, db_name, tables, columns, rows):
+        self.name = name
+        self.db_name = db_name
+        self.tables = tables  # locked (shared) for every FETCH
+        self.columns = columns
+        self.rows = rows
+        self.fetched = 0
+        self.exhausted = False
+        self.next_row = _END
+
+    def fetch(self, count):
+        rows = []
+        if self.next_row is not _END:
+            rows.append(self.next_row)
+            self.next_row = _END
+        rows.extend(itertools.islice(self.rows, count - len(rows)))
+        # Look one row ahead, so the last batch already says it is the last
+        self.next_row = next(self.rows, _END) if len(rows) == count else _END
+        self.exhausted = self.next_row is _END
+        self.fetched += len(rows)
+        return rows
+
+    def close(self):
+        close = getattr(self.rows, "close", None)
+        if close is not None:
+            close()
+        self.exhausted = True
+
+
+def open_cursor(session, name, query):
+    if not session.current_database:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    if name in session.cursors:
+        return f"Error: Cursor {name} is already open."
+    if len(session.cursors) >= MAX_CURSORS:
+        return f"Error: At most {MAX_CURSORS} cursors can be open on one connection."
+    try:
+        columns, rows = open_select(session.current_database, query, session.transaction)
+    except ValueError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error executing query: {str(e)}"
+    session.cursors[name] = Cursor(name, session.current_database, query.tables(), columns, rows)
+    return f"Cursor {name} opened on columns {', '.join(columns)}."
+
+
+def fetch_cursor(session, name, count=None):
+    cursor = session.cursors.get(name)
+    if cursor is None:
+        return f"Error: No open cursor named {name}."
+    count = CURSOR_FETCH_SIZE if count is None else count
+    if count < 1:
+        return "Error: FETCH needs a positive row count."
+    try:
+        rows = cursor.fetch(count)
+    except Exception as e:
+        close_cursor(session, name)
+        return f"Error fetching from cursor {name}: {str(e)}. The cursor was closed."
+    if cursor.exhausted:
+        status = f"-- end of cursor {name}, {cursor.fetched} row(s) in total; CLOSE it to release it"
+    else:
+        status = f"-- more rows available, FETCH again from cursor {name}"
+    return format_result(cursor.columns, rows) + "\n" + status
+
+
+def close_cursor(session, name):
+    cursor = session.cursors.pop(name, None)
+    if cursor is None:
+        return f"Error: No open cursor named {name}."
+    cursor.close()
+    return f"Cursor {name} closed after {cursor.fetched} row(s)."
+
+
+def cursor_tables(session, name):
+    # (database, tables) a FETCH reads, for its shared locks
+    cursor = session.cursors.get(name)
+    if cursor is None:
+        return session.current_database, ()
+    return cursor.db_name, cursor.tables
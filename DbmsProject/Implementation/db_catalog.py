@@ -1,15 +1,194 @@
 # db_catalog.py
+import logging
+import os
 import xml.etree.ElementTree as ET
 
-DATABASE_FILE = 'Database.xml'
+import metrics
+
+DATABASE_FILE = 'DataBase.xml'
+
+# The catalog is parsed once and kept in memory. Lookups go through the
+# dictionaries below instead of walking the XML tree on every command.
+_tree = None
+_databases = {}  # db_name -> <DataBase> element
+_tables = {}     # (db_name, table_name) -> table info (see _build_table_info)
+_version = 0     # bumped on every write-through to disk
+
+log = logging.getLogger("dbms.catalog")
+
+
+def init_catalog():
+    """Parse the XML catalog from disk and build the in-memory lookup dictionaries."""
+    global _tree
+    if not os.path.exists(DATABASE_FILE):
+        _tree = ET.ElementTree(ET.Element("Databases"))
+    else:
+        try:
+            _tree = ET.parse(DATABASE_FILE)
+        except ET.ParseError:
+            log.error("%s is not well-formed.", DATABASE_FILE)
+            _tree = None
+            return None
+    _rebuild_index()
+    return _tree
+
 
 def load_catalog():
-    try:
-        tree = ET.parse(DATABASE_FILE)
-        return tree
-    except ET.ParseError:
-        print("Error: Database.xml is not well-formed.")
-        return None
+    # Returns the cached tree; the file is only parsed the first time
+    if _tree is None:
+        return init_catalog()
+    return _tree
+
 
 def save_catalog(tree):
-    tree.write(DATABASE_FILE, encoding='utf-8', xml_declaration=True)
+    global _tree, _version
+    # Write through to disk with an atomic rename so a crash never leaves a half-written catalog
+    tmp_path = DATABASE_FILE + ".tmp"
+    with open(tmp_path, "wb") as f:
+        tree.write(f, encoding='utf-8', xml_declaration=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, DATABASE_FILE)
+
+    _tree = tree
+    _rebuild_index()
+    _version += 1
+
+
+def get_catalog_version():
+    return _version
+
+
+def _build_table_info(table):
+    # Attributes in declaration order, with their type information
+    structure = []
+    structure_el = table.find("Structure")
+    if structure_el is not None:
+        for attr in structure_el.findall("Attribute"):
+            structure.append({
+                'name': attr.get("attributeName"),
+                'type': attr.get("type"),
+                'length': attr.get("length"),
+                'isnull': attr.get("isnull")
+            })
+
+    primary_keys = []
+    pk_el = table.find("primaryKey")
+    if pk_el is not None:
+        primary_keys = [pk.text for pk in pk_el.findall("pkAttribute")]
+
+    foreign_keys = []
+    fks_el = table.find("foreignKeys")
+    if fks_el is not None:
+        for fk in fks_el.findall("foreignKey"):
+            foreign_keys.append({
+                'fk_col': fk.findtext("fkAttribute"),
+                'ref_table': fk.findtext("references/refTable"),
+                'ref_col': fk.findtext("references/refAttribute")
+            })
+
+    indexes = []
+    index_files = table.find("IndexFiles")
+    if index_files is not None:
+        for index in index_files.findall("IndexFile"):
+            indexes.append({
+                'name': index.get("indexName"),
+                'columns': [a.text for a in index.findall("IndexAttributes/IAttribute")],
+                'include': [a.text for a in index.findall("IncludeAttributes/IAttribute")],
+                'is_unique': index.get("isUnique") == "1",
+                'type': index.get("indexType"),
+                'key_length': index.get("keyLength")
+            })
+
+    # Rows are stored under the '#'-joined key, so a composite primary key gets an
+    # in-memory index over its columns: lookups on its leading column(s) need no scan
+    if len(primary_keys) > 1 and not any(index['columns'][:1] == primary_keys[:1] for index in indexes):
+        indexes.append({
+            'name': f"{table.get('tableName')}_pk.ind",
+            'columns': list(primary_keys),
+            'include': [],
+            'is_unique': False,
+            'type': "BTree",
+            'key_length': None,
+            'implicit': True
+        })
+
+    # Foreign key columns get an in-memory index of their own (unless one already leads with
+    # the column) so deleting a parent row can find its children without a scan
+    for fk in foreign_keys:
+        if not any(index['columns'] and index['columns'][0] == fk['fk_col'] for index in indexes):
+            indexes.append({
+                'name': f"{table.get('tableName')}_{fk['fk_col']}_fk.ind",
+                'columns': [fk['fk_col']],
+                'include': [],
+                'is_unique': False,
+                'type': "BTree",
+                'key_length': None,
+                'implicit': True
+            })
+
+    return {
+        'element': table,
+        'name': table.get("tableName"),
+        'file_name': table.get("fileName"),
+        'row_length': table.get("rowLength"),
+        'structure': structure,
+        'attributes': [attr['name'] for attr in structure],
+        'primary_keys': primary_keys,
+        'foreign_keys': foreign_keys,
+        'indexes': indexes
+    }
+
+
+def _rebuild_index():
+    # Build fresh dictionaries and swap them in, so concurrent readers never see a half-built index
+    global _databases, _tables
+    databases = {}
+    tables = {}
+    if _tree is not None:
+        for db in _tree.getroot().findall("DataBase"):
+            db_name = db.get("dataBaseName")
+            databases[db_name] = db
+            tables_el = db.find("Tables")
+            if tables_el is None:
+                continue
+            for table in tables_el.findall("Table"):
+                tables[(db_name, table.get("tableName"))] = _build_table_info(table)
+    _databases, _tables = databases, tables
+
+
+@metrics.timed("catalog")
+def get_database(db_name):
+    load_catalog()
+    return _databases.get(db_name)
+
+
+@metrics.timed("catalog")
+def get_table(db_name, table_name):
+    load_catalog()
+    return _tables.get((db_name, table_name))
+
+
+@metrics.timed("catalog")
+def list_database_names():
+    load_catalog()
+    return list(_databases.keys())
+
+
+@metrics.timed("catalog")
+def list_table_names(db_name):
+    load_catalog()
+    return [table for (db, table) in _tables.keys() if db == db_name]
+
+
+def get_referencing_foreign_keys(db_name, table_name):
+    # All foreign keys in other tables of the database that point at table_name
+    load_catalog()
+    references = []
+    for (db, child_table), info in _tables.items():
+        if db != db_name or child_table == table_name:
+            continue
+        for fk in info['foreign_keys']:
+            if fk['ref_table'] == table_name:
+                references.append((child_table, fk))
+    return references
@@ -1,136 +1,222 @@
 # db_operations.py
-from db_catalog import load_catalog, save_catalog
+import logging
+from db_catalog import (
+    load_catalog, save_catalog, get_database, get_table, list_database_names,
+    list_table_names, get_referencing_foreign_keys
+)
 import xml.etree.ElementTree as ET
-from pymongo import MongoClient
-from pymongo.server_api import ServerApi
-import json
+import json_mirror
+import index_manager
+import foreign_keys
+import table_stats
+import wal
+from record_codec import build_document, attribute_width
+from storage_engine import get_engine, slot_layout
 
-# Insert a new record into a specified table in the MongoDB database
+log = logging.getLogger("dbms.operations")
 
-# client = MongoClient("mongodb://localhost:27017/")
+engine = get_engine()
 
-# def convert_type(value):
-#     # Try to convert to integer, then to float, or keep as string if neither works
-#     try:
-#         return int(value)
-#     except ValueError:
-#         try:
-#             return float(value)
-#         except ValueError:
-#             return value.strip("'\"")  # Remove any extra quotes around strings
+def load_table_schema(db_name, table_name):
+    """Load the allowed schema and primary key for a specific table in the given database from the XML catalog."""
+    table = get_table(db_name, table_name)
+    if table is None:
+        return None, None  # Return None if table or database is not found
 
+    # Return list of attribute names and primary key fields
+    return table['attributes'], table['primary_keys']
 
-client = MongoClient("mongodb://localhost:27017/")
+def insert_record(table_name, values, db_name, deferred=None):
+    return insert_statements(table_name, [([values], deferred, True)], db_name)[0]
 
-def write_to_json(collection, json_file_path):
-    
-    documents = collection.find({}, {"_id": 0})  
-    records = list(documents)  
-    
-    with open(json_file_path, "w") as json_file:
-        json.dump(records, json_file, indent=4)
 
+def insert_records(table_name, rows, db_name, deferred=None):
+    """Insert several rows with one duplicate check and one unordered insert_many."""
+    return insert_statements(table_name, [(rows, deferred, False)], db_name)[0]
 
-import xml.etree.ElementTree as ET
 
-def load_table_schema(db_name, table_name):
-    """Load the allowed schema and primary key for a specific table in the given database from the XML catalog."""
-    tree = ET.parse("DataBase.xml")  
-    root = tree.getroot()
-    
-    # Navigate to the correct database and table
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            for table in db.find("Tables").findall("Table"):
-                if table.get("tableName") == table_name:
-                    # Extract attribute names
-                    attributes = [attr.get("attributeName") for attr in table.find("Structure").findall("Attribute")]
-                    
-                    # Extract primary key fields
-                    primary_keys = [pk.text for pk in table.find("primaryKey").findall("pkAttribute")]
-                    
-                    return attributes, primary_keys  # Return list of attribute names and primary key fields
-    return None, None  # Return None if table or database is not found
-
-def insert_record(table_name, values, db_name):
+def insert_statements(table_name, statements, db_name):
+    """Insert the rows of several INSERT statements into one table with a single
+    duplicate check and a single backend write; returns one response per statement.
+
+    Each statement is (rows, deferred, single): deferred is the session's DeferredChecks
+    (or None), and single selects the one-row response instead of the per-row summary.
+    """
     if not db_name:
-        return "No database selected. Use 'USE <database_name>' to select a database."
-    
-    # Load table from XML 
+        return ["No database selected. Use 'USE <database_name>' to select a database."] * len(statements)
+
+    # Load the schema once for the whole batch
     allowed_fields, primary_keys = load_table_schema(db_name, table_name)
     if allowed_fields is None or primary_keys is None:
-        return f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."
-    
-    # Validation
-    input_fields = set(values.keys())
-    if not input_fields.issubset(set(allowed_fields)):
-        invalid_fields = input_fields - set(allowed_fields)
-        return f"Error: Invalid field(s) {', '.join(invalid_fields)} for table '{table_name}'."
-    
-    # Access the MongoDB 
-    db = client[db_name]
-    collection = db[table_name]
-    
-    # Separate primary key 
-    primary_key_values = [str(values[pk]) for pk in primary_keys if pk in values]
-    if len(primary_key_values) != len(primary_keys):
-        return f"Error: Missing primary key value(s) for table '{table_name}'."
-
-    # composite key
-    composite_key = '#'.join(primary_key_values)
-
-    # Concatenate the other attr (no pk)
-    non_primary_values = {k: v for k, v in values.items() if k not in primary_keys}
-    concatenated_values = '#'.join(str(v) for v in non_primary_values.values())
-    
-    document = {
-        "_id": composite_key,  
-        "key": composite_key,
-        "value": concatenated_values
-    }
-    
-    # Insert the record into MongoDB, handling duplicates
+        return [f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."] * len(statements)
+    allowed_set = set(allowed_fields)
+    table_info = get_table(db_name, table_name)
+
+    # Validate every row and build its document; errors are reported per row (1-based)
+    errors = [{} for _ in statements]
+    documents = []  # (statement_number, row_number, document, values)
+    for number, (rows, _, _) in enumerate(statements):
+        seen_keys = set()
+        for row_number, values in enumerate(rows, start=1):
+            invalid_fields = set(values.keys()) - allowed_set
+            if invalid_fields:
+                errors[number][row_number] = f"Error: Invalid field(s) {', '.join(invalid_fields)} for table '{table_name}'."
+                continue
+
+            # Typed binary row; a value that does not fit its column type is rejected here
+            document, error = build_document(values, table_info)
+            if error:
+                errors[number][row_number] = error
+                continue
+
+            if document["_id"] in seen_keys:
+                errors[number][row_number] = "Error: Duplicate primary key within the same INSERT."
+                continue
+            seen_keys.add(document["_id"])
+            documents.append((number, row_number, document, values))
+
+    store = engine.table(db_name, table_name)
+    failure = None
     try:
-        # validation for duplicates
-        if collection.find_one({"_id": composite_key}):
-            return "Error: Record with this primary key already exists."
-        
-        # Insert 
-        collection.insert_one(document)
-        json_file_path = f"{table_name}.json"  # for JSON file 
-        write_to_json(collection, json_file_path)
-        
-        return f"Record inserted successfully into table {table_name}."
+        store_documents(db_name, table_info, store, statements, documents, errors)
     except Exception as e:
-        return f"Error inserting record: {str(e)}"
-
+        failure = str(e)
+
+    responses = []
+    for number, (rows, _, single) in enumerate(statements):
+        if single:
+            if failure is not None:
+                responses.append(f"Error inserting record: {failure}")
+            elif errors[number]:
+                responses.append(next(iter(errors[number].values())))
+            else:
+                responses.append(f"Record inserted successfully into table {table_name}.")
+            continue
+        if failure is not None:
+            responses.append(f"Error inserting records: {failure}")
+            continue
+        lines = [f"{len(rows) - len(errors[number])} of {len(rows)} record(s) inserted successfully into table {table_name}."]
+        for row_number in sorted(errors[number]):
+            lines.append(f"Row {row_number}: {errors[number][row_number]}")
+        responses.append("\n".join(lines))
+    return responses
+
+
+def store_documents(db_name, table_info, store, statements, documents, errors, logged=True, written=None):
+    """Check and write prepared rows; rejected rows are recorded in errors.
+
+    documents holds (statement_number, row_number, document, values) entries for the
+    statements of insert_statements. Returns the documents actually inserted. With
+    logged=False the caller writes them to the redo log (wal) itself. A written list
+    gets the inserted documents as soon as they are in the backend, so the caller can
+    take them out again even if a later step raises.
+    """
+    def reject(rejected):
+        for position, error in rejected.items():
+            number, row_number = documents[position][:2]
+            errors[number][row_number] = error
+        return [entry for position, entry in enumerate(documents) if position not in rejected]
+
+    if not documents:
+        return []
+
+    # One query for all duplicates already stored; between statements of one batch the
+    # earlier statement wins, as if they had run one after the other
+    existing = store.existing_keys([document["_id"] for _, _, document, _ in documents])
+    duplicates = {}
+    for position, (_, _, document, _) in enumerate(documents):
+        if document["_id"] in existing:
+            duplicates[position] = "Error: Record with this primary key already exists."
+        existing.add(document["_id"])
+    documents = reject(duplicates)
+
+    # UNIQUE indexes, including duplicates between rows of this batch
+    documents = reject(index_manager.check_unique(
+        db_name, table_info, store, [values for _, _, _, values in documents]))
+
+    # One parent lookup per foreign key for the whole batch, skipping statements whose
+    # session has deferred its checks
+    checked = [position for position, entry in enumerate(documents) if statements[entry[0]][1] is None]
+    if checked:
+        fk_errors = foreign_keys.check_parents(db_name, table_info, [documents[position][3] for position in checked])
+        documents = reject({checked[position]: error for position, error in fk_errors.items()})
+
+    # One unordered write for the whole batch; failures are mapped back to their rows
+    if not documents:
+        return []
+    documents = reject(store.insert_many([document for _, _, document, _ in documents]))
+
+    inserted_documents = [document for _, _, document, _ in documents]
+    if written is not None:
+        written.extend(inserted_documents)
+    index_manager.index_documents(db_name, table_info, store, inserted_documents)
+    table_stats.record_documents(db_name, table_info, inserted_documents, 1)
+    if logged:
+        wal.log_changes(db_name, {table_info['name']: (store, [("put", document) for document in inserted_documents])})
+    for number, (_, deferred, _) in enumerate(statements):
+        if deferred is not None:
+            deferred.add(db_name, table_info['name'], [
+                (document["_id"], values) for entry_number, _, document, values in documents if entry_number == number
+            ])
+    return inserted_documents
 
 
+def delete_record(table_name, primary_key_value, db_name):
+    return delete_records(table_name, [primary_key_value], db_name)[0]
 
 
-def delete_record(table_name, primary_key_value, db_name):
+def delete_records(table_name, keys, db_name):
+    """Delete rows by primary key with one child check and one backend delete; returns one response per key."""
     if not db_name:
-        return "No database selected. Use 'USE <database_name>' to select a database."
+        return ["No database selected. Use 'USE <database_name>' to select a database."] * len(keys)
 
-    # Access the MongoDB 
-    db = client[db_name]
-    collection = db[table_name]
+    # Access the table's storage
+    store = engine.table(db_name, table_name)
+    if store is None:
+        return [f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."] * len(keys)
 
-    # Delete record based on pk 
+    # Delete records based on pk
     try:
-        result = collection.delete_one({"key": primary_key_value})
-        if result.deleted_count == 0:
-            return "No record found with the given primary key."
-
-        # update the JSON file
-        json_file_path = f"{table_name}.json"
-        write_to_json(collection, json_file_path)  
-        return f"Record with key {primary_key_value} deleted successfully from table {table_name}."
+        errors, deleted = remove_documents(db_name, get_table(db_name, table_name), store, keys)
     except Exception as e:
-        return f"Error deleting record: {str(e)}"
+        return [f"Error deleting record: {str(e)}"] * len(keys)
+
+    # A key deleted twice in one batch is only found by the first delete
+    responses = []
+    for position, key in enumerate(keys):
+        if position in errors:
+            responses.append(errors[position])
+        elif deleted.pop(key, None) is not None:
+            responses.append(f"Record with key {key} deleted successfully from table {table_name}.")
+        else:
+            responses.append("No record found with the given primary key.")
+    return responses
+
+
+def remove_documents(db_name, table_info, store, keys, logged=True, written=None):
+    """Delete rows by key; returns ({position: error}, {key: deleted document}).
+
+    A written list gets the deleted documents as soon as they are gone from the backend.
+    """
+    # Child rows that still reference a key block its delete (checked through their FK index)
+    errors = foreign_keys.check_children(db_name, table_info, keys)
+
+    # The deleted documents are returned so their index entries can be removed
+    targets = list(dict.fromkeys(key for position, key in enumerate(keys) if position not in errors))
+    deleted = store.delete_many(targets) if targets else {}
+    if written is not None:
+        written.extend(deleted.values())
+    if deleted:
+        index_manager.unindex_documents(db_name, table_info, store, list(deleted.values()))
+        foreign_keys.forget_keys(db_name, table_info['name'], list(deleted))
+        table_stats.record_documents(db_name, table_info, list(deleted.values()), -1)
+
+        # Logged; the JSON mirror is updated from the log
+        if logged:
+            wal.log_changes(db_name, {table_info['name']: (store, [("del", key) for key in deleted])})
+    return errors, deleted
 
 
-            
 def create_database(db_name):
     # Load the existing catalog
     tree = load_catalog()
@@ -139,18 +225,18 @@ def create_database(db_name):
 
     root = tree.getroot()
     # Check if the database already exists in the XML catalog
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            return f"Database {db_name} already exists."
+    if get_database(db_name) is not None:
+        return f"Database {db_name} already exists."
 
     # Create new database entry in the XML catalog
     new_db = ET.Element("DataBase", {"dataBaseName": db_name})
     ET.SubElement(new_db, "Tables")
     root.append(new_db)
+    wal.log_catalog("create_database", db_name)
     save_catalog(tree)
 
-    # Create a corresponding MongoDB database
-    client[db_name]  # This line effectively creates the database in MongoDB if it doesn't exist.
+    # Create the corresponding storage (a MongoDB database is created on first write)
+    engine.create_database(db_name)
 
     return f"Database {db_name} created successfully."
 
@@ -161,25 +247,28 @@ def drop_database(db_name):
         return "Failed to load catalog."
 
     root = tree.getroot()
-    db_found = False
 
     # Check if the database exists in the XML catalog and remove it
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            root.remove(db)
-            db_found = True
-            save_catalog(tree)
-            break
-
-    if not db_found:
+    database = get_database(db_name)
+    if database is None:
         return f"Database {db_name} does not exist in catalog."
 
-    # Drop the database from MongoDB
+    table_names = list_table_names(db_name)
+    # Logged first: if the server dies after the save, recovery finishes the cleanup below
+    wal.log_catalog("drop_database", db_name, tables=table_names)
+    root.remove(database)
+    save_catalog(tree)
+    for table_name in table_names:
+        json_mirror.forget_table(db_name, table_name)
+    index_manager.drop_table_indexes(db_name)
+    foreign_keys.forget_table(db_name)
+
+    # Drop the database's data from the storage engine
     try:
-        client.drop_database(db_name)
+        engine.drop_database(db_name)
         return f"Database {db_name} dropped successfully from catalog"
     except Exception as e:
-        return f"Error dropping database from MongoDB: {str(e)}"
+        return f"Error dropping database from storage: {str(e)}"
 
 # List all databases
 def list_databases():
@@ -187,9 +276,7 @@ def list_databases():
     if tree is None:
         return "Failed to load catalog."
     
-    databases = []
-    for db in tree.findall("DataBase"):
-        databases.append(db.get("dataBaseName"))
+    databases = list_database_names()
     
     return "Databases: " + ", ".join(databases) if databases else "No databases found."
 
@@ -199,57 +286,38 @@ def list_tables(db_name):
     if tree is None:
         return "Failed to load catalog."
 
-    root = tree.getroot()
-    database = None
-
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            database = db
-            break
-
-    if not database:
+    if get_database(db_name) is None:
         return f"Database {db_name} does not exist."
 
-    tables = []
-    for tbl in database.find("Tables").findall("Table"):
-        tables.append(tbl.get("tableName"))
+    tables = list_table_names(db_name)
     
     return "Tables in " + db_name + ": " + ", ".join(tables) if tables else f"No tables found in {db_name}."
 
+def _catalog_length(column):
+    # Only a VARCHAR keeps its declared length in the catalog
+    length = column['length'] if column['type'].lower() == "varchar" else ''
+    return str(length) if isinstance(length, int) and length > 0 else ''
+
 def create_table(db_name, table_name, columns, primary_key, foreign_keys=[]):
-    print("Starting create_table...")  # comm
+    log.debug("Starting create_table %s.%s", db_name, table_name)
     tree = load_catalog()
     if tree is None:
         return "Failed to load catalog."
 
-    root = tree.getroot()
-
     # Find the db
-    database = None
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            database = db
-            break
-
+    database = get_database(db_name)
     if database is None:
         return f"Database {db_name} does not exist."
 
     # Check if the table already exists
-    for tbl in database.find("Tables").findall("Table"):
-        if tbl.get("tableName") == table_name:
-            return f"Table {table_name} already exists in database {db_name}."
-
-    # Debug: Print columns before calculating row_length
-    print("Columns before row length calculation:", columns)
-
-    # Calculate row length by summing the lengths of all attributes
-    try:
-        # Only sum positive lengths and ensure they're integers
-        row_length = sum(c['length'] for c in columns if isinstance(c['length'], int) and c['length'] > 0)  
-        # Debug: Print calculated row_length
-        print("Calculated Row Length:", row_length)
-    except Exception as e:
-        return f"Error calculating row length: {e}"
+    if get_table(db_name, table_name) is not None:
+        return f"Table {table_name} already exists in database {db_name}."
+
+    # Row length: the fixed-width slot a row takes in the local engine's .bin file,
+    # from the attributes as they are written to the catalog below
+    attributes = [{'name': c['name'], 'type': c['type'], 'length': _catalog_length(c)} for c in columns]
+    row_length = slot_layout(attributes)[1]
+    log.debug("Calculated row length: %s", row_length)
     
     # Validate foreign keys
     for fk in foreign_keys:
@@ -257,24 +325,16 @@ def create_table(db_name, table_name, columns, primary_key, foreign_keys=[]):
         ref_col = fk['ref_col']
         
         # Locate the referenced table
-        ref_table_value = None
-        ref_table_element = None
-        for tbl in database.find("Tables").findall("Table"):
-            table_name_finder = tbl.get("tableName")
-            ref_table_value = ref_table.split('(')[0]
-            if table_name_finder == ref_table_value:
-                ref_table_element = tbl
-                print(f"Found referenced table: {ref_table_value}")  # Debug print
-                break
-
-        if ref_table_element is None:
+        ref_table_value = ref_table.split('(')[0]
+        ref_table_info = get_table(db_name, ref_table_value)
+        if ref_table_info is None:
             return f"Referenced table {ref_table_value} does not exist for foreign key."
+        log.debug("Found referenced table: %s", ref_table_value)
 
         # Verify the referenced column is part of the primary key
-        ref_primary_key = ref_table_element.find("primaryKey")
-        ref_key_columns = [pk.text for pk in ref_primary_key.findall("pkAttribute")]
+        ref_key_columns = ref_table_info['primary_keys']
 
-        print(f"Referenced table {ref_table} primary keys: {ref_key_columns}")  # Debug print
+        log.debug("Referenced table %s primary keys: %s", ref_table, ref_key_columns)
 
         if ref_col not in ref_key_columns:
             return f"Referenced column {ref_col} is not a primary key in table {ref_table}."
@@ -291,27 +351,23 @@ def create_table(db_name, table_name, columns, primary_key, foreign_keys=[]):
 
     # Add columns to the table structure
     for col in columns:
-        # Ensure that base_type is set correctly and length is handled
-        base_type = col['type']
-        length_value = col['length'] if base_type.lower() == "varchar" else ''  # Only include length for varchar
-
         # Create the Attribute element with the correct type and length
         ET.SubElement(structure, "Attribute", {
             "attributeName": col['name'],
-            "type": base_type,
-            "length": str(length_value) if isinstance(length_value, int) and length_value > 0 else '',
+            "type": col['type'],
+            "length": _catalog_length(col),
             "isnull": str(col['isnull'])
         })
 
-        print(f"Added Attribute: {col['name']}, Type: {base_type}, Length: {length_value}, IsNull: {col['isnull']}")  # COMMsho
+        log.debug("Added attribute: %s, type: %s, length: %s, isnull: %s",
+                  col['name'], col['type'], col['length'], col['isnull'])
 
     # Add primary key
     primary_key_el = ET.SubElement(new_table, "primaryKey")
     for pk in primary_key:
         ET.SubElement(primary_key_el, "pkAttribute").text = pk
 
-    # Check if primary key was added
-    print(f"Primary key added: {primary_key}")  # COMM
+    log.debug("Primary key added: %s", primary_key)
 
     # Add foreign keys if there are any
     if foreign_keys:
@@ -325,9 +381,10 @@ def create_table(db_name, table_name, columns, primary_key, foreign_keys=[]):
 
     # Append the new table to the database's table list
     database.find("Tables").append(new_table)
+    wal.log_catalog("create_table", db_name, table_name)
     save_catalog(tree)
 
-    print(f"Table {table_name} created successfully in database {db_name}.")  # comm
+    log.info("Table %s created in database %s.", table_name, db_name)
     return f"Table {table_name} created successfully in database {db_name}."
 
 def drop_table(db_name, table_name):
@@ -336,262 +393,112 @@ def drop_table(db_name, table_name):
     if tree is None:
         return "Failed to load catalog."
 
-    root = tree.getroot()
-    database = None
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            database = db
-            break
-
-    if not database:
+    database = get_database(db_name)
+    if database is None:
         return f"Database '{db_name}' does not exist."
 
     # Find the table to be dropped
-    table = None
-    for tbl in database.find("Tables").findall("Table"):
-        if tbl.get("tableName") == table_name:
-            table = tbl
-            break
-
-    if not table:
+    table = get_table(db_name, table_name)
+    if table is None:
         return f"Table '{table_name}' does not exist in database '{db_name}'."
 
     # Gather primary keys of the table to be dropped
-    primary_keys = set()
-    primary_key_element = table.find("primaryKey")
-    if primary_key_element is not None:
-        primary_keys = {pk.text for pk in primary_key_element.findall("pkAttribute")}
-    else:
+    if table['element'].find("primaryKey") is None:
         return f"Error: Table '{table_name}' has no primary key defined."
+    primary_keys = set(table['primary_keys'])
 
     # Check for any foreign key references in other tables
-    for tbl in database.find("Tables").findall("Table"):
-        if tbl.get("tableName") != table_name:  # Skip the table being dropped
-            foreign_keys_element = tbl.find("foreignKeys")
-            if foreign_keys_element is not None:
-                for fk in foreign_keys_element.findall("foreignKey"):
-                    ref_table_elem = fk.find("references/refTable")
-                    ref_attribute_elem = fk.find("references/refAttribute")
-
-                    # Ensure both refTable and refAttribute are present
-                    if ref_table_elem is not None and ref_attribute_elem is not None:
-                        ref_table = ref_table_elem.text
-                        ref_column = ref_attribute_elem.text
-
-                        # Check if this foreign key references the table to be dropped
-                        if ref_table == table_name and ref_column in primary_keys:
-                            return (
-                                f"Cannot drop table '{table_name}'; it is referenced by a foreign key "
-                                f"in table '{tbl.get('tableName')}', column '{ref_column}'."
-                            )
+    for child_table, fk in get_referencing_foreign_keys(db_name, table_name):
+        ref_column = fk['ref_col']
+        if ref_column in primary_keys:
+            return (
+                f"Cannot drop table '{table_name}'; it is referenced by a foreign key "
+                f"in table '{child_table}', column '{ref_column}'."
+            )
 
     # No foreign key references found, safe to drop the table from XML catalog
-    database.find("Tables").remove(table)
+    wal.log_catalog("drop_table", db_name, table_name)
+    database.find("Tables").remove(table['element'])
     save_catalog(tree)
+    json_mirror.forget_table(db_name, table_name)
+    index_manager.drop_table_indexes(db_name, table_name)
+    foreign_keys.forget_table(db_name, table_name)
 
-    # Also drop the table (collection) from MongoDB
+    # Also drop the table's data from the storage engine
     try:
-        db = client[db_name]  # Access the database in MongoDB
-        if table_name in db.list_collection_names():
-            db.drop_collection(table_name)  # Drop the collection for the table
+        if engine.drop_table(db_name, table_name):
             return f"Table '{table_name}' dropped successfully from database '{db_name}'."
         else:
-            return f"Table '{table_name}' does not exist in MongoDB database '{db_name}'."
+            return f"Table '{table_name}' does not exist in storage for database '{db_name}'."
     except Exception as e:
-        return f"Error dropping table '{table_name}' from MongoDB: {str(e)}"
+        return f"Error dropping table '{table_name}' from storage: {str(e)}"
 
 
 
 # Create an index for a table in the specified database
-def create_index(db_name, table_name, index_name, column_name, is_unique, index_type="BTree"):
+def create_index(db_name, table_name, index_name, columns, is_unique, index_type="BTree", include=None):
     tree = load_catalog()
     if tree is None:
         return "Failed to load catalog."
 
-    root = tree.getroot()
-
-    database = None
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            database = db
-            break
-
-    if not database:
+    if get_database(db_name) is None:
         return f"Database {db_name} does not exist."
 
-    table = None
-    for tbl in database.find("Tables").findall("Table"):
-        if tbl.get("tableName") == table_name:
-            table = tbl
-            break
-
-    if not table:
+    table_info = get_table(db_name, table_name)
+    if table_info is None:
         return f"Table {table_name} does not exist in database {db_name}."
+    table = table_info['element']
 
     # Check if the index already exists or create one now
+    for index in table_info['indexes']:
+        if index['name'] == f"{index_name}.ind":
+            return f"Index {index_name} already exists on table {table_name}."
+
+    # Keys are ordered column by column, so (a, b) also serves lookups on a alone
+    if isinstance(columns, str):
+        columns = [columns]
+    include = list(include or [])
+    attributes = {attr['name']: attr for attr in table_info['structure']}
+    for column_name in columns + include:
+        if column_name not in attributes:
+            return f"Column {column_name} does not exist in table {table_name}."
+    if len(set(columns + include)) != len(columns + include):
+        return "Error: A column can appear only once in an index."
+
+    # Build the index data from the existing rows before it is published in the catalog
+    index_info = {
+        'name': f"{index_name}.ind",
+        'columns': columns,
+        'include': include,
+        'is_unique': bool(is_unique),
+        'type': index_type
+    }
+    store = engine.table(db_name, table_name)
+    index, error = index_manager.build_index(db_name, table_info, index_info, store)
+    if error:
+        return error
+
     index_files = table.find("IndexFiles")
     if index_files is None:
         index_files = ET.SubElement(table, "IndexFiles")
 
-    for index in index_files.findall("IndexFile"):
-        if index.get("indexName") == f"{index_name}.ind":
-            return f"Index {index_name} already exists on table {table_name}."
-
     new_index = ET.SubElement(index_files, "IndexFile", {
         "indexName": f"{index_name}.ind",
-        "keyLength": "30",  
+        "keyLength": str(sum(attribute_width(attributes[column_name]) for column_name in columns)),
         "isUnique": str(int(is_unique)),
         "indexType": index_type
     })
     index_attributes = ET.SubElement(new_index, "IndexAttributes")
-    ET.SubElement(index_attributes, "IAttribute").text = column_name
+    for column_name in columns:
+        ET.SubElement(index_attributes, "IAttribute").text = column_name
+    if include:
+        # Stored with every entry, so queries reading only these columns skip the rows
+        include_attributes = ET.SubElement(new_index, "IncludeAttributes")
+        for column_name in include:
+            ET.SubElement(include_attributes, "IAttribute").text = column_name
 
     save_catalog(tree)
 
-    return f"Index {index_name} on {column_name} created successfully for table {table_name}."
-
-def parse_column_definitions_manually(column_definitions):
-    columns = []
-    primary_key = []
-    foreign_keys = []  # List to store foreign keys
-    print("Enter parse function", column_definitions)
-    
-    for col in column_definitions:
-        col = col.strip()
-        
-        # Check for composite PRIMARY KEY declaration
-        if "PRIMARY KEY" in col:
-            if "(" in col and ")" in col:
-                pk_cols_part = col[col.index("(")+1:col.index(")")]  # Get the columns in parentheses
-                pk_columns = pk_cols_part.split(',')
-                primary_key.extend([pk_col.strip() for pk_col in pk_columns])  # Add all columns to PK list
-                print(f"Found composite primary key: {primary_key}")  # Debug output
-            continue  
-        
-        # Check for individual column PRIMARY KEY declaration
-        if "PRIMARY" in col and "KEY" not in col:  
-            pk_part = col.split('PRIMARY')[0].strip()
-            pk_name = pk_part.split()[0]  # column name
-            primary_key.append(pk_name)  # Add PK to the list
-            print(f"Found primary key: {pk_name}")  # COMM
-            col = pk_part.strip()  # Remove PK part for further processing
-
-        # Check for FOREIGN KEY declaration
-        if "FOREIGN KEY" in col:
-            # Extract the column name inside the parentheses
-            fk_col_part = col[col.index("(")+1:col.index(")")].strip()
-            fk_column = fk_col_part.split()[0]
-            print(f"Found foreign key: {fk_column}")  # COMM
-
-            # Find the REFERENCES part to get the referenced table and column
-            if "REFERENCES" in col:
-                ref_part = col.split("REFERENCES")[1].strip()
-                ref_table = ref_part.split()[0]  # The first part is the table name
-                ref_column = ref_part[ref_part.index("(")+1:ref_part.index(")")].strip()  # Extract referenced column
-
-                # Add foreign key information to the list
-                foreign_keys.append({
-                    'fk_col': fk_column,
-                    'ref_table': ref_table,
-                    'ref_col': ref_column
-                })
-
-                print(f"Added foreign key: {fk_column}, References: {ref_table}({ref_column})")  # comm
-            continue 
-
-        # Split on spaces and parentheses
-        parts = col.split()
-        column_name = parts[0]  # The first part is always the column name
-        
-        # Initialize data_type and length
-        data_type = ""
-        length = 0  # Default length
-        
-        if len(parts) > 1:
-            data_type = parts[1]
-            print(f"Data type found: {data_type}")  # comm
-
-            if '(' in data_type:
-                try:
-                    # Split to get the base type and the length
-                    data_type, len_part = data_type.split('(')
-                    length_str = len_part.strip(')')  # Clean up to remove the closing parenthesis
-
-                    if length_str:  # Ensure length_str is not empty
-                        length = int(length_str)  # Convert to int
-                    else:
-                        print(f"Warning: Length for {column_name} is empty. Defaulting to 0.")
-                except ValueError as e:
-                    print(f"Error parsing length for {column_name}: {e}. Setting length to 0.")
-                    length = 0  # Default to 0 in case of parsing error
-            else:
-                # If data_type is varchar but without length specified
-                if data_type.lower() == 'varchar':
-                    print(f"Warning: Length for {column_name} is not specified. Defaulting to 0.")
-                    length = 0  
-
-        # Append to columns list
-        columns.append({
-            'name': column_name,
-            'type': data_type,
-            'length': length,  # Ensure length is stored as an integer
-            'isnull': 0  # Assuming not null for simplicity; adjust as necessary
-        })
-
-        print(f"Added column: {column_name}, Type: {data_type}, Length: {length}")  # Debug output
-
-    print("From parse:", columns)  # Final columns output for debugging
-    print("Foreign keys found:", foreign_keys)  # Debug output for foreign keys
-    return columns, primary_key, foreign_keys  # Return columns, primary keys, and foreign keys
-
-def extract_column_definitions(command):
-    # Extract everything between the first opening and the last closing parenthesis
-    start = command.index("(") + 1
-    end = command.rindex(")")
-    columns_string = command[start:end].strip()
-
-    # Split the column definitions by commas, but handle cases like "varchar(5)"
-    col_defs = []
-    current_col = ""
-    inside_parentheses = False
-
-    for char in columns_string:
-        if char == "(":
-            inside_parentheses = True
-        elif char == ")":
-            inside_parentheses = False
-        
-        if char == "," and not inside_parentheses:
-            col_defs.append(current_col.strip())  
-            current_col = ""  # Reset for the next column
-        else:
-            current_col += char  # Continue building the current column
-    
-    # Append the last column 
-    if current_col:
-        col_defs.append(current_col.strip())
-
-    return col_defs
-
-# List all tables in a specified database
-def list_tables(db_name):
-    tree = load_catalog()
-    if tree is None:
-        return "Failed to load catalog."
-
-    root = tree.getroot()
-    database = None
-
-    for db in root.findall("DataBase"):
-        if db.get("dataBaseName") == db_name:
-            database = db
-            break
-
-    if not database:
-        return f"Database {db_name} does not exist."
-
-    tables = []
-    for tbl in database.find("Tables").findall("Table"):
-        tables.append(tbl.get("tableName"))
-    
-    return "Tables in " + db_name + ": " + ", ".join(tables) if tables else f"No tables found in {db_name}."
+    covered = f" including {', '.join(include)}" if include else ""
+    return (f"Index {index_name} on {', '.join(columns)}{covered} created successfully "
+            f"for table {table_name} ({len(index)} entries).")
@@ -0,0 +1,215 @@
+# foreign_keys.py
+import threading
+from collections import OrderedDict
+
+from db_catalog import get_table, get_referencing_foreign_keys
+from record_codec import key_text
+from storage_engine import get_engine
+import index_manager
+
+# Parent keys known to exist, per (db_name, table_name). Only hits are cached, so an insert
+# into the parent never makes an entry stale; deleting the parent row drops its entry.
+PARENT_KEY_CACHE_SIZE = 100000
+
+# Values of the foreign_key_checks setting
+IMMEDIATE = "IMMEDIATE"
+DEFERRED = "DEFERRED"
+
+_parent_keys = {}
+_parent_keys_lock = threading.Lock()
+
+
+def _is_null(value):
+    return value is None or value == ''
+
+
+def _column_type(table_info, column):
+    for attr in table_info['structure']:
+        if attr['name'] == column:
+            return attr['type']
+    return None
+
+
+def _cached_keys(db_name, table_name, keys):
+    with _parent_keys_lock:
+        cache = _parent_keys.get((db_name, table_name))
+        if not cache:
+            return set()
+        found = set()
+        for key in keys:
+            if key in cache:
+                cache.move_to_end(key)
+                found.add(key)
+        return found
+
+
+def _remember_keys(db_name, table_name, keys):
+    with _parent_keys_lock:
+        cache = _parent_keys.setdefault((db_name, table_name), OrderedDict())
+        for key in keys:
+            cache[key] = True
+        while len(cache) > PARENT_KEY_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def forget_keys(db_name, table_name, keys):
+    # Called after rows are deleted from a (possible) parent table
+    with _parent_keys_lock:
+        cache = _parent_keys.get((db_name, table_name))
+        if cache:
+            for key in keys:
+                cache.pop(key, None)
+
+
+def forget_table(db_name, table_name=None):
+    with _parent_keys_lock:
+        for key in list(_parent_keys):
+            if key[0] == db_name and (table_name is None or key[1] == table_name):
+                del _parent_keys[key]
+
+
+def _missing_parents(db_name, fk, values):
+    """The subset of values that no row of the referenced table has in fk['ref_col']."""
+    parent_info = get_table(db_name, fk['ref_table'])
+    if parent_info is None:
+        return set(values)
+    parent_store = get_engine().table(db_name, fk['ref_table'])
+
+    if parent_info['primary_keys'] == [fk['ref_col']]:
+        # The referenced column is the whole primary key: check the _ids, cache first
+        unknown = set(values) - _cached_keys(db_name, fk['ref_table'], values)
+        if not unknown:
+            return set()
+        existing = parent_store.existing_keys(list(unknown))
+        _remember_keys(db_name, fk['ref_table'], existing)
+        return unknown - existing
+
+    index = index_manager.find_index(db_name, parent_info, fk['ref_col'], parent_store)
+    if index is not None:
+        return {value for value in values if not index.lookup(index.make_prefix([value]))}
+
+    # Compared in the text form of the referenced column's type, as in the indexed case
+    ref_type = _column_type(parent_info, fk['ref_col'])
+    present = set()
+    for _, row in parent_store.rows(None, [fk['ref_col']]):
+        value = row.get(fk['ref_col'])
+        if not _is_null(value):
+            present.add(key_text(value, ref_type))
+    return {value for value in values if key_text(value, ref_type) not in present}
+
+
+def check_parents(db_name, table_info, rows):
+    """Check that every foreign key value of rows exists in its parent; returns {position: error}."""
+    errors = {}
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    for fk in table_info['foreign_keys']:
+        # Normalized like primary keys, so '01' finds the parent with key 1
+        values = {}
+        for position, row in enumerate(rows):
+            value = row.get(fk['fk_col'])
+            if not _is_null(value):
+                values.setdefault(key_text(value, types.get(fk['fk_col'])), []).append(position)
+        if not values:
+            continue
+
+        # A self-referencing row may point at another row of the same batch
+        if fk['ref_table'] == table_info['name']:
+            for row in rows:
+                values.pop(key_text(row.get(fk['ref_col']), types.get(fk['ref_col'])), None)
+
+        # One lookup per foreign key for the whole batch
+        for value in _missing_parents(db_name, fk, list(values)):
+            for position in values[value]:
+                errors.setdefault(position, (
+                    f"Error: Foreign key {fk['fk_col']} = {value} has no matching "
+                    f"{fk['ref_col']} in table {fk['ref_table']}."
+                ))
+    return errors
+
+
+def check_children(db_name, table_info, keys):
+    """Refuse to delete parent rows that child rows still reference; returns {position: error}."""
+    errors = {}
+    primary_keys = table_info['primary_keys']
+    for child_table, fk in get_referencing_foreign_keys(db_name, table_info['name']):
+        child_info = get_table(db_name, child_table)
+        if child_info is None or fk['ref_col'] not in primary_keys:
+            continue
+        position = primary_keys.index(fk['ref_col'])
+        child_store = get_engine().table(db_name, child_table)
+        index = index_manager.find_index(db_name, child_info, fk['fk_col'], child_store)
+
+        values = {}
+        for key_position, key in enumerate(keys):
+            parts = str(key).split('#')
+            if position < len(parts):
+                values.setdefault(parts[position], []).append(key_position)
+        if not values:
+            continue
+
+        if index is not None:
+            referenced = {value for value in values if index.lookup(index.make_prefix([value]))}
+        else:
+            # One scan of the child table for the whole batch; key parts are in the text
+            # form of the referenced column's type
+            ref_type = _column_type(table_info, fk['ref_col'])
+            referenced = set()
+            for _, row in child_store.rows(None, [fk['fk_col']]):
+                value = row.get(fk['fk_col'])
+                if not _is_null(value):
+                    referenced.add(key_text(value, ref_type))
+            referenced &= set(values)
+        for value in referenced:
+            for key_position in values[value]:
+                errors.setdefault(key_position, (
+                    f"Error: Cannot delete key {keys[key_position]} from table {table_info['name']}: "
+                    f"it is referenced by {child_table}.{fk['fk_col']}."
+                ))
+    return errors
+
+
+def referenced_tables(table_info):
+    """Parent tables an insert into this table has to read."""
+    return sorted({fk['ref_table'] for fk in table_info['foreign_keys']} - {table_info['name']})
+
+
+def referencing_tables(db_name, table_name):
+    """Child tables a delete from this table has to read."""
+    return sorted({child for child, _ in get_referencing_foreign_keys(db_name, table_name)} - {table_name})
+
+
+class DeferredChecks:
+    """Rows inserted while foreign key checks are deferred, verified together at the end of a bulk load."""
+
+    def __init__(self):
+        self.pending = {}  # (db_name, table_name) -> [(key, row)]
+
+    def add(self, db_name, table_name, keyed_rows):
+        self.pending.setdefault((db_name, table_name), []).extend(keyed_rows)
+
+    def extend(self, other):
+        for (db_name, table_name), keyed_rows in other.pending.items():
+            self.add(db_name, table_name, keyed_rows)
+
+    def tables(self, db_name):
+        """Tables the final check reads: the loaded tables and their parents."""
+        names = set()
+        for pending_db, table_name in self.pending:
+            table_info = get_table(pending_db, table_name)
+            if pending_db == db_name and table_info is not None:
+                names.add(table_name)
+                names.update(referenced_tables(table_info))
+        return sorted(names)
+
+    def verify(self):
+        """Check every pending row; returns a list of violation messages."""
+        violations = []
+        for (db_name, table_name), keyed_rows in self.pending.items():
+            table_info = get_table(db_name, table_name)
+            if table_info is None:
+                continue
+            errors = check_parents(db_name, table_info, [row for _, row in keyed_rows])
+            for position in sorted(errors):
+                violations.append(f"{table_name} key {keyed_rows[position][0]}: {errors[position]}")
+        self.pending = {}
+        return violations
@@ -0,0 +1,139 @@
+# group_commit.py
+import os
+import threading
+import time
+
+import foreign_keys
+import lock_manager
+from db_catalog import get_table
+from db_operations import insert_statements, delete_records
+
+# Single-statement INSERTs and key DELETEs from all sessions are queued per table.
+# Whichever session finds no flush in progress becomes the leader: it takes the
+# table lock once, writes everything queued with one duplicate check and one
+# backend write, and hands every waiting session its own response. Writes that
+# arrive during a flush go out together in the next one.
+GROUP_COMMIT = os.environ.get("DBMS_GROUP_COMMIT", "1") != "0"
+# How long a leader waits for more writes before flushing (0: flush what is queued)
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("DBMS_GROUP_COMMIT_WINDOW_MS", "0"))
+# Most writes flushed together; a full queue is flushed without waiting for the window
+GROUP_COMMIT_MAX_BATCH = int(os.environ.get("DBMS_GROUP_COMMIT_MAX_BATCH", "1000"))
+
+INSERT = "insert"
+DELETE = "delete"
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+class _Write:
+    __slots__ = ("kind", "payload", "response")
+
+    def __init__(self, kind, payload):
+        self.kind = kind
+        self.payload = payload  # INSERT: (rows, deferred, single); DELETE: the key
+        self.response = None
+
+
+class _TableQueue:
+    def __init__(self):
+        self.condition = threading.Condition(threading.Lock())
+        self.pending = []
+        self.flushing = False
+
+
+def _queue(db_name, table_name):
+    key = (db_name, table_name)
+    with _queues_lock:
+        queue = _queues.get(key)
+        if queue is None:
+            queue = _TableQueue()
+            _queues[key] = queue
+        return queue
+
+
+def insert(db_name, table_name, rows, deferred=None):
+    """Queue one INSERT statement and wait for its response."""
+    return _submit(db_name, table_name, _Write(INSERT, (rows, deferred, len(rows) == 1)))
+
+
+def delete(db_name, table_name, key):
+    """Queue a DELETE of one primary key and wait for its response."""
+    return _submit(db_name, table_name, _Write(DELETE, key))
+
+
+def _submit(db_name, table_name, write):
+    queue = _queue(db_name, table_name)
+    with queue.condition:
+        queue.pending.append(write)
+        if len(queue.pending) >= GROUP_COMMIT_MAX_BATCH:
+            queue.condition.notify_all()
+        # Another session's flush will pick this write up
+        while queue.flushing and write.response is None:
+            queue.condition.wait()
+        if write.response is not None:
+            return write.response
+        queue.flushing = True
+
+    try:
+        while write.response is None:
+            _flush(db_name, table_name, _take_batch(queue))
+            with queue.condition:
+                queue.condition.notify_all()
+    finally:
+        with queue.condition:
+            queue.flushing = False
+            queue.condition.notify_all()
+    return write.response
+
+
+def _take_batch(queue):
+    with queue.condition:
+        if GROUP_COMMIT_WINDOW_MS > 0:
+            deadline = time.monotonic() + GROUP_COMMIT_WINDOW_MS / 1000
+            while len(queue.pending) < GROUP_COMMIT_MAX_BATCH:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                queue.condition.wait(remaining)
+        batch = queue.pending[:GROUP_COMMIT_MAX_BATCH]
+        del queue.pending[:GROUP_COMMIT_MAX_BATCH]
+    return batch
+
+
+def _runs(batch):
+    # Consecutive writes of the same kind; runs are applied in arrival order
+    run = []
+    for write in batch:
+        if run and write.kind != run[0].kind:
+            yield run
+            run = []
+        run.append(write)
+    if run:
+        yield run
+
+
+def _flush(db_name, table_name, batch):
+    # Same locks a single INSERT or DELETE would take, held once for the whole batch
+    table_info = get_table(db_name, table_name)
+    related = set()
+    if table_info is not None:
+        if any(write.kind == INSERT for write in batch):
+            related.update(foreign_keys.referenced_tables(table_info))
+        if any(write.kind == DELETE for write in batch):
+            related.update(foreign_keys.referencing_tables(db_name, table_name))
+
+    try:
+        with lock_manager.statement_locks(db_name, sorted(related), [table_name]):
+            for run in _runs(batch):
+                if run[0].kind == INSERT:
+                    responses = insert_statements(table_name, [write.payload for write in run], db_name)
+                else:
+                    responses = delete_records(table_name, [write.payload for write in run], db_name)
+                for write, response in zip(run, responses):
+                    write.response = response
+    finally:
+        # Nobody may be left waiting on a batch that failed part way
+        for write in batch:
+            if write.response is None:
+                write.response = f"Error: The {write.kind} could not be written."
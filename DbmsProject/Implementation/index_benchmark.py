@@ -0,0 +1,194 @@
+# index_benchmark.py
+# Point and range lookup latencies with and without a BTree index: loads a table in
+# a scratch directory, times the same queries as full scans, creates an index on
+# the queried column and times them again through the on-disk B+tree.
+#
+#   python index_benchmark.py --rows 200000 --queries 500 [--engine local|memory] [--json FILE]
+#
+# The queries are a point lookup (WHERE score = v), a range (WHERE score BETWEEN
+# v AND v + range_rows - 1) and a top-N (ORDER BY score DESC LIMIT 10). Scores are
+# a permutation of 0..rows-1, so every query has a known row count, which is checked.
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from benchmark import percentile
+
+BENCH_DATABASE = "index_bench"
+BENCH_TABLE = "scores"
+TOP_N = 10
+
+
+def _prepare(engine_name, rows, seed):
+    """Start an engine in a scratch directory and load the benchmark table; returns (session, load seconds)."""
+    # The catalog, data and index files are relative to the working directory
+    os.chdir(tempfile.mkdtemp(prefix="dbms-index-bench-"))
+    # Full scans would all show up in the slow query log; only errors are kept
+    import metrics
+    metrics.configure_logging("ERROR")
+
+    # The engine has to be in place before the server modules bind it
+    import storage_engine
+    if engine_name == "local":
+        storage_engine.set_engine(storage_engine.LocalEngine(os.path.abspath("data")))
+    else:
+        from memory_mongo import MemoryMongoClient
+        storage_engine.set_engine(storage_engine.MongoEngine(client=MemoryMongoClient()))
+    from db_catalog import init_catalog
+    init_catalog()
+    from session import Session
+    session = Session()
+
+    # LOAD DATA reads from the file directory
+    from bulk_loader import FILE_DIR
+    os.makedirs(FILE_DIR, exist_ok=True)
+    scores = list(range(rows))
+    random.Random(seed).shuffle(scores)
+    with open(os.path.join(FILE_DIR, "scores.csv"), "w") as f:
+        f.write("id,score,name\n")
+        for number, score in enumerate(scores):
+            f.write(f"{number},{score},name {number}\n")
+
+    _check(session, f"CREATE DATABASE {BENCH_DATABASE}")
+    _check(session, f"USE {BENCH_DATABASE}")
+    _check(session, f"CREATE TABLE {BENCH_TABLE} (id INT PRIMARY KEY, score INT, name VARCHAR(30))")
+    started = time.perf_counter()
+    _check(session, f"LOAD DATA FROM 'scores.csv' INTO TABLE {BENCH_TABLE}")
+    return session, time.perf_counter() - started
+
+
+def _check(session, command):
+    from server_commands import process_command
+    result = process_command(command, session)
+    if str(result).startswith("Error"):
+        raise RuntimeError(f"{command}: {result}")
+    return result
+
+
+def _row_count(result):
+    # format_result ends with "(N rows)"
+    return int(result.rsplit("(", 1)[1].split()[0])
+
+
+def _time_queries(session, queries):
+    """Run (command, expected row count) pairs; returns sorted latencies in seconds."""
+    latencies = []
+    for command, expected in queries:
+        started = time.perf_counter()
+        result = _check(session, command)
+        latencies.append(time.perf_counter() - started)
+        if _row_count(result) != expected:
+            raise RuntimeError(f"{command}: expected {expected} row(s), got: {result.splitlines()[-1]}")
+    return sorted(latencies)
+
+
+def _queries(kind, count, rows, range_rows, rng):
+    queries = []
+    for _ in range(count):
+        if kind == "point":
+            value = rng.randrange(rows)
+            queries.append((f"SELECT id, name FROM {BENCH_TABLE} WHERE score = {value}", 1))
+        elif kind == "range":
+            low = rng.randrange(max(1, rows - range_rows + 1))
+            high = low + range_rows - 1
+            queries.append((f"SELECT id, name FROM {BENCH_TABLE} WHERE score BETWEEN {low} AND {high}",
+                            min(high, rows - 1) - low + 1))
+        else:
+            queries.append((f"SELECT id, score FROM {BENCH_TABLE} ORDER BY score DESC LIMIT {TOP_N}",
+                            min(TOP_N, rows)))
+    return queries
+
+
+def _stats(latencies):
+    return {
+        'count': len(latencies),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3) if latencies else 0.0
+    }
+
+
+def run_benchmark(rows=100_000, queries=200, scan_queries=10, range_rows=100, engine="local", seed=1):
+    """Run the benchmark and return the report dict."""
+    session, load_seconds = _prepare(engine, rows, seed)
+    rng = random.Random(seed)
+    kinds = ("point", "range", "top_n")
+
+    # Full scans are slow, so they only get a few queries each
+    report = {
+        'config': {'rows': rows, 'queries': queries, 'scan_queries': scan_queries,
+                   'range_rows': range_rows, 'engine': engine, 'seed': seed},
+        'load_sec': round(load_seconds, 3),
+        'queries': {}
+    }
+    for kind in kinds:
+        report['queries'][kind] = {'full_scan': _stats(_time_queries(session, _queries(kind, scan_queries, rows, range_rows, rng)))}
+
+    started = time.perf_counter()
+    _check(session, f"CREATE INDEX {BENCH_TABLE}_score ON {BENCH_TABLE} (score)")
+    report['create_index_sec'] = round(time.perf_counter() - started, 3)
+
+    for kind in kinds:
+        entry = report['queries'][kind]
+        entry['index'] = _stats(_time_queries(session, _queries(kind, queries, rows, range_rows, rng)))
+        if entry['index']['p50_ms']:
+            entry['speedup'] = round(entry['full_scan']['p50_ms'] / entry['index']['p50_ms'], 1)
+        entry['plan'] = _check(session, "EXPLAIN " + _queries(kind, 1, rows, range_rows, rng)[0][0]).splitlines()[0]
+
+    import index_manager
+    from db_catalog import get_table
+    table_info = get_table(BENCH_DATABASE, BENCH_TABLE)
+    index_info = next(index for index in table_info['indexes'] if not index.get('implicit'))
+    index = index_manager.get_index(BENCH_DATABASE, table_info, index_info, None)
+    if isinstance(index, index_manager.BTreeIndex):
+        report['btree'] = index.tree.stats()
+    return report
+
+
+def format_table(report):
+    header = ("query", "scan p50 ms", "index p50 ms", "index p95 ms", "speedup")
+    rows = []
+    for name, entry in report['queries'].items():
+        rows.append((name, entry['full_scan']['p50_ms'], entry['index']['p50_ms'], entry['index']['p95_ms'],
+                     f"{entry['speedup']}x" if 'speedup' in entry else "-"))
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    lines = ["  ".join(str(value).rjust(width) for value, width in zip(header, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    for row in rows:
+        lines.append("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+    lines.append(f"load {report['load_sec']}s, CREATE INDEX {report['create_index_sec']}s")
+    for name, entry in report['queries'].items():
+        lines.append(f"{name}: {entry['plan']}")
+    if 'btree' in report:
+        lines.append("btree: " + ", ".join(f"{key}={value}" for key, value in report['btree'].items()))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare indexed and full-scan point, range and top-N queries.")
+    parser.add_argument("--rows", type=int, default=100_000, help="rows loaded into the table")
+    parser.add_argument("--queries", type=int, default=200, help="indexed queries of each kind")
+    parser.add_argument("--scan-queries", type=int, default=10, help="full-scan queries of each kind")
+    parser.add_argument("--range-rows", type=int, default=100, help="rows matched by each range query")
+    parser.add_argument("--engine", choices=("local", "memory"), default="local",
+                        help="local data files or the in-memory MongoDB stand-in")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", metavar="FILE", help="also write the JSON report to FILE ('-' for stdout)")
+    args = parser.parse_args(argv)
+    json_path = os.path.abspath(args.json) if args.json and args.json != "-" else args.json
+
+    report = run_benchmark(args.rows, args.queries, args.scan_queries, args.range_rows, args.engine, args.seed)
+    print(format_table(report))
+    if args.json == "-":
+        print(json.dumps(report, indent=2))
+    elif json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,434 @@
+# index_manager.py
+import bisect
+import glob
+import heapq
+import logging
+import os
+import threading
+
+import btree
+import storage_engine
+from record_codec import attribute_width, cast_value, decode_row, literal_value, make_key
+
+# Live index data for every <IndexFile> in the catalog, keyed by
+# (db_name, table_name, index_name), maintained on every insert and delete.
+# BTree indexes live in page-based B+tree files next to the table's rows
+# (<DATA_DIR>/<database>/<table>.<index>.ind) and are reused after a restart;
+# the implicit primary and foreign key indexes are built in memory from the
+# table's rows the first time they are needed.
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+# Below this share of the index's size, extend() inserts entries one by one
+# instead of rewriting the whole B+tree file
+BULK_MERGE_RATIO = 0.125
+
+log = logging.getLogger("dbms.index")
+
+
+def sort_key(value):
+    # NULLs sort first, then numbers, then strings, so mixed values never fail to compare
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, str(value))
+
+
+def _value(part):
+    # The value a sort_key part was made from
+    return None if part[0] == 0 else part[1]
+
+
+# Sorts after every sort_key part: prefix + (_AFTER,) is past all keys that start with prefix
+_AFTER = (3,)
+
+
+class SortedIndex:
+    """Index entries kept as parallel lists sorted by key, giving O(log n) seeks.
+
+    Keys are tuples of sort_key parts, one per indexed column, so tuple order is
+    column-by-column order and a shorter tuple selects every key it is a prefix of.
+    INCLUDE columns are stored next to each entry, for queries the index covers.
+    """
+
+    def __init__(self, index_info, column_types, include_types=()):
+        self.name = index_info['name']
+        self.columns = index_info['columns']
+        self.include = index_info.get('include', [])
+        self.is_unique = index_info['is_unique']
+        self.column_types = column_types
+        self.include_types = include_types
+        self.keys = []
+        self.primary_keys = []
+        self.included = []  # tuples of INCLUDE values, or None without INCLUDE columns
+        self.lock = threading.RLock()
+
+    def make_key(self, row):
+        # row holds raw or typed values; the key is typed so ranges compare numerically
+        return tuple(
+            sort_key(cast_value(row.get(column), column_type))
+            for column, column_type in zip(self.columns, self.column_types)
+        )
+
+    def make_prefix(self, values):
+        # Key prefix for the first len(values) columns; a bound such as 15.5 on an INT
+        # column stays numeric, so it sorts among the numbers
+        return tuple(
+            sort_key(literal_value(value, column_type))
+            for value, column_type in zip(values, self.column_types)
+        )
+
+    def make_entry(self, row, primary_key):
+        # (key, primary key, INCLUDE values) for a row that holds every indexed column
+        included = None
+        if self.include:
+            included = tuple(cast_value(row.get(column), column_type)
+                             for column, column_type in zip(self.include, self.include_types))
+        return self.make_key(row), primary_key, included
+
+    def load(self, entries):
+        # Bulk build from unsorted make_entry() tuples
+        entries.sort(key=lambda entry: entry[:2])
+        with self.lock:
+            self.keys = [entry[0] for entry in entries]
+            self.primary_keys = [entry[1] for entry in entries]
+            self.included = [entry[2] for entry in entries]
+
+    def extend(self, entries):
+        # Bulk insert of make_entry() tuples: one merge sort instead of a list insert each
+        with self.lock:
+            merged = list(zip(self.keys, self.primary_keys, self.included))
+            merged.extend(entries)
+            merged.sort(key=lambda entry: entry[:2])
+            self.keys = [entry[0] for entry in merged]
+            self.primary_keys = [entry[1] for entry in merged]
+            self.included = [entry[2] for entry in merged]
+
+    def contains(self, key):
+        with self.lock:
+            position = bisect.bisect_left(self.keys, key)
+            return position < len(self.keys) and self.keys[position] == key
+
+    def insert(self, key, primary_key, included=None):
+        with self.lock:
+            # Equal keys stay ordered by primary key, as load() and extend() sort them
+            start = bisect.bisect_left(self.keys, key)
+            end = bisect.bisect_right(self.keys, key, start)
+            position = bisect.bisect_right(self.primary_keys, primary_key, start, end)
+            self.keys.insert(position, key)
+            self.primary_keys.insert(position, primary_key)
+            self.included.insert(position, included)
+
+    def delete(self, key, primary_key):
+        with self.lock:
+            position = bisect.bisect_left(self.keys, key)
+            end = bisect.bisect_right(self.keys, key)
+            for i in range(position, end):
+                if self.primary_keys[i] == primary_key:
+                    del self.keys[i]
+                    del self.primary_keys[i]
+                    del self.included[i]
+                    return True
+        return False
+
+    def lookup(self, key):
+        # Primary keys of all rows whose key equals key, or starts with it for a prefix
+        with self.lock:
+            start = bisect.bisect_left(self.keys, key)
+            end = bisect.bisect_left(self.keys, key + (_AFTER,))
+            return self.primary_keys[start:end]
+
+    def _bounds(self, low, high, low_inclusive, high_inclusive):
+        if low is None:
+            start = 0
+        elif low_inclusive:
+            start = bisect.bisect_left(self.keys, low)
+        else:
+            start = bisect.bisect_left(self.keys, low + (_AFTER,))
+        if high is None:
+            end = len(self.keys)
+        elif high_inclusive:
+            end = bisect.bisect_left(self.keys, high + (_AFTER,))
+        else:
+            end = bisect.bisect_left(self.keys, high)
+        return start, end
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        # Primary keys of rows with low <(=) key <(=) high; None means unbounded.
+        # Bounds may be prefixes: (a,) <= key covers every key starting with a
+        with self.lock:
+            start, end = self._bounds(low, high, low_inclusive, high_inclusive)
+            return self.primary_keys[start:end]
+
+    def entries(self, low=None, high=None, low_inclusive=True, high_inclusive=True, reverse=False):
+        """(key, primary key, INCLUDE values) for the range in key order, or reversed."""
+        with self.lock:
+            start, end = self._bounds(low, high, low_inclusive, high_inclusive)
+            entries = list(zip(self.keys[start:end], self.primary_keys[start:end], self.included[start:end]))
+        if reverse:
+            entries.reverse()
+        return iter(entries)
+
+    def range_rows(self, low=None, high=None, low_inclusive=True, high_inclusive=True, reverse=False):
+        """(primary key, {column: value}) for the range, built from the index alone."""
+        for key, primary_key, included in self.entries(low, high, low_inclusive, high_inclusive, reverse):
+            row = {column: _value(part) for column, part in zip(self.columns, key)}
+            if included is not None:
+                row.update(zip(self.include, included))
+            yield primary_key, row
+
+    # Kept in memory only: there is nothing to write, and it is rebuilt after a restart
+    reused = False
+
+    def fits(self, entry):
+        return True
+
+    def commit(self):
+        pass
+
+    def drop(self):
+        pass
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _targets(low, high, low_inclusive, high_inclusive):
+    # Range bounds as B+tree search tuples, compared with (key, primary key) entries
+    start = end = None
+    if low is not None:
+        start = (low,) if low_inclusive else (low + (_AFTER,),)
+    if high is not None:
+        end = (high + (_AFTER,),) if high_inclusive else (high,)
+    return start, end
+
+
+class BTreeIndex(SortedIndex):
+    """An index kept in its own B+tree file (see btree.py) instead of in memory.
+
+    Changes are written to the file by commit(), once per batch of inserted or
+    deleted rows. The key methods are SortedIndex's.
+    """
+
+    def __init__(self, index_info, column_types, include_types, path, page_size):
+        super().__init__(index_info, column_types, include_types)
+        # A file made for other columns is not reused
+        signature = ",".join(self.columns) + "|" + ",".join(self.include)
+        self.tree = btree.BPlusTree(path, page_size, signature)
+
+    @property
+    def reused(self):
+        return self.tree.reused
+
+    def load(self, entries):
+        entries.sort(key=lambda entry: entry[:2])
+        self.tree.bulk_load(entries)
+
+    def extend(self, entries):
+        entries.sort(key=lambda entry: entry[:2])
+        if len(entries) < len(self.tree) * BULK_MERGE_RATIO:
+            for entry in entries:
+                self.tree.insert(*entry)
+            self.tree.commit()
+            return
+        # Many new entries: merge them with the current ones into a freshly packed file
+        self.tree.commit()
+        self.tree.bulk_load(heapq.merge(self.tree.scan(), entries, key=lambda entry: entry[:2]))
+
+    def contains(self, key):
+        for _ in self.tree.scan(*_targets(key, key, True, True)):
+            return True
+        return False
+
+    def insert(self, key, primary_key, included=None):
+        self.tree.insert(key, primary_key, included)
+
+    def delete(self, key, primary_key):
+        return self.tree.delete(key, primary_key)
+
+    def lookup(self, key):
+        return [primary_key for _, primary_key, _ in self.tree.scan(*_targets(key, key, True, True))]
+
+    def range(self, low=None, high=None, low_inclusive=True, high_inclusive=True):
+        return [primary_key for _, primary_key, _ in self.entries(low, high, low_inclusive, high_inclusive)]
+
+    def entries(self, low=None, high=None, low_inclusive=True, high_inclusive=True, reverse=False):
+        # Read lazily from the file, so a LIMIT stops after the pages it needs
+        start, end = _targets(low, high, low_inclusive, high_inclusive)
+        return self.tree.scan(start, end, reverse)
+
+    def fits(self, entry):
+        return self.tree.fits(*entry)
+
+    def commit(self):
+        self.tree.commit()
+
+    def drop(self):
+        self.tree.drop()
+
+    def __len__(self):
+        return len(self.tree)
+
+
+def _column_types(table_info, columns):
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    return [types.get(column) for column in columns]
+
+
+def _index_dir(db_name):
+    # The database's data directory, next to the table files of the local engine
+    data_dir = getattr(storage_engine.get_engine(), 'data_dir', storage_engine.DATA_DIR)
+    return os.path.join(data_dir, db_name)
+
+
+def index_path(db_name, table_name, index_name):
+    # Index names already end in .ind
+    return os.path.join(_index_dir(db_name), f"{table_name}.{index_name}")
+
+
+def _page_size(table_info, index_info):
+    # Pages that hold at least four of the largest entries the declared column widths allow
+    attributes = {attr['name']: attr for attr in table_info['structure']}
+
+    def width(column):
+        attr = attributes.get(column, {})
+        return 9 if (attr.get('type') or '').upper() in ("INT", "FLOAT") else 5 + attribute_width(attr)
+
+    entry_size = (2 + sum(width(column) for column in index_info['columns'] + index_info.get('include', []))
+                  + 5 + sum(attribute_width(attributes[pk]) + 1 for pk in table_info['primary_keys']))
+    return btree.page_size_for(entry_size)
+
+
+def _make_index(db_name, table_info, index_info):
+    column_types = _column_types(table_info, index_info['columns'])
+    include_types = _column_types(table_info, index_info.get('include', []))
+    if index_info.get('implicit') or (index_info.get('type') or "BTree").upper() != "BTREE":
+        return SortedIndex(index_info, column_types, include_types)
+    path = index_path(db_name, table_info['name'], index_info['name'])
+    return BTreeIndex(index_info, column_types, include_types, path, _page_size(table_info, index_info))
+
+
+def _backfill(index, table_info, store):
+    # Fill the index from the table's rows; returns an error for a violated UNIQUE index
+    entries = []
+    for key, row in store.rows(columns=index.columns + index.include):
+        entries.append(index.make_entry(row, key))
+    index.load(entries)
+
+    if index.is_unique:
+        previous = None
+        for key, _, _ in index.entries():
+            if key == previous and sort_key(None) not in key:
+                return (f"Error: Cannot create unique index {index.name}; "
+                        f"duplicate values exist in table {table_info['name']}.")
+            previous = key
+    return None
+
+
+def build_index(db_name, table_info, index_info, store):
+    """Backfill an index from the existing rows; returns (index, error)."""
+    index = _make_index(db_name, table_info, index_info)
+    error = _backfill(index, table_info, store)
+    if error:
+        index.drop()
+        return None, error
+    with _indexes_lock:
+        _indexes[(db_name, table_info['name'], index_info['name'])] = index
+    return index, None
+
+
+def get_index(db_name, table_info, index_info, store):
+    key = (db_name, table_info['name'], index_info['name'])
+    index = _indexes.get(key)
+    if index is not None:
+        return index
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            # First use in this process (e.g. after a restart). An index file with one
+            # entry per row is used as it is; anything else is backfilled now
+            index = _make_index(db_name, table_info, index_info)
+            if not index.reused or len(index) != store.count():
+                error = _backfill(index, table_info, store)
+                if error:
+                    log.error("%s", error)
+                    index.drop()
+                    return None
+            _indexes[key] = index
+    return index
+
+
+def table_indexes(db_name, table_info, store):
+    indexes = []
+    for index_info in table_info['indexes']:
+        index = get_index(db_name, table_info, index_info, store)
+        if index is not None:
+            indexes.append(index)
+    return indexes
+
+
+def find_index(db_name, table_info, column_name, store):
+    # An index whose leading column is column_name, or None (then a scan is needed);
+    # look it up with make_prefix([value])
+    for index_info in table_info['indexes']:
+        if index_info['columns'] and index_info['columns'][0] == column_name:
+            return get_index(db_name, table_info, index_info, store)
+    return None
+
+
+def check_unique(db_name, table_info, store, rows, seen=None):
+    """Return {row_position: error} for rows that would violate a UNIQUE index,
+    or whose entry is too large for the pages of an index file.
+
+    seen maps index names to the keys of rows written but not yet added to the index
+    (a bulk load adds them at the end); it is updated with the keys of these rows.
+    """
+    errors = {}
+    for index in table_indexes(db_name, table_info, store):
+        for position, row in enumerate(rows):
+            primary_key = make_key(row, table_info)
+            if not index.fits(index.make_entry(row, primary_key)):
+                errors.setdefault(position, f"Error: Values too long for index {index.name}.")
+        if not index.is_unique:
+            continue
+        batch_keys = set() if seen is None else seen.setdefault(index.name, set())
+        for position, row in enumerate(rows):
+            key = index.make_key(row)
+            if any(part == sort_key(None) for part in key):
+                continue  # NULLs never collide
+            if index.contains(key) or key in batch_keys:
+                errors.setdefault(position, (
+                    f"Error: Duplicate value for unique index {index.name} "
+                    f"on column(s) {', '.join(index.columns)}."
+                ))
+            batch_keys.add(key)
+    return errors
+
+
+def index_documents(db_name, table_info, store, documents):
+    # Keep every index of the table in sync with newly inserted documents
+    for index in table_indexes(db_name, table_info, store):
+        for document in documents:
+            index.insert(*index.make_entry(decode_row(document, table_info, index.columns + index.include), document["_id"]))
+        index.commit()
+
+
+def unindex_documents(db_name, table_info, store, documents):
+    # Remove deleted documents from every index of the table
+    for index in table_indexes(db_name, table_info, store):
+        for document in documents:
+            index.delete(index.make_key(decode_row(document, table_info, index.columns)), document["_id"])
+        index.commit()
+
+
+def drop_table_indexes(db_name, table_name=None):
+    # Forget the indexes of one table, or of a whole database when table_name is None,
+    # and delete their files, including those of indexes this process never opened
+    with _indexes_lock:
+        for key in list(_indexes.keys()):
+            if key[0] == db_name and (table_name is None or key[1] == table_name):
+                _indexes.pop(key).drop()
+    pattern = "*.ind*" if table_name is None else f"{glob.escape(table_name)}.*.ind*"
+    for path in glob.glob(os.path.join(_index_dir(db_name), pattern)):
+        os.remove(path)
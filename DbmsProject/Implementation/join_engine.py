@@ -0,0 +1,297 @@
+# join_engine.py
+from db_catalog import get_table
+from db_operations import engine
+import index_manager
+from record_codec import make_key
+from sql_parser import Select, conjuncts, describe_predicate, predicate_columns
+from query_engine import plan_select, fetch_rows, explain_plan, evaluate
+
+# Outer rows are probed against the inner table this many at a time (one $in query per batch)
+PROBE_BATCH_SIZE = 1000
+
+
+def _resolve_column(reference, tables):
+    # "table.column" or an unqualified column that exists in exactly one table
+    if '.' in reference:
+        table_name, column = reference.split('.', 1)
+        if table_name not in tables or column not in tables[table_name]['attributes']:
+            raise ValueError(f"Unknown column {reference}.")
+        return table_name, column
+    owners = [name for name, info in tables.items() if reference in info['attributes']]
+    if not owners:
+        raise ValueError(f"Unknown column {reference}.")
+    if len(owners) > 1:
+        raise ValueError(f"Column {reference} is ambiguous; qualify it with a table name.")
+    return owners[0], reference
+
+
+def _qualify(predicate, tables):
+    if predicate is None:
+        return None
+    if predicate[0] == 'cmp':
+        table_name, column = _resolve_column(predicate[1], tables)
+        return ('cmp', f"{table_name}.{column}", predicate[2], predicate[3])
+    return (predicate[0], [_qualify(branch, tables) for branch in predicate[1]])
+
+
+def _unqualify(predicate):
+    if predicate is None:
+        return None
+    if predicate[0] == 'cmp':
+        return ('cmp', predicate[1].split('.', 1)[1], predicate[2], predicate[3])
+    return (predicate[0], [_unqualify(branch) for branch in predicate[1]])
+
+
+def _combine(predicates):
+    if not predicates:
+        return None
+    return predicates[0] if len(predicates) == 1 else ('and', predicates)
+
+
+def _prepare(db_name, query):
+    """Resolve tables, join edges, pushed-down filters and the join order."""
+    table_names = query.tables()
+    if len(set(table_names)) != len(table_names):
+        raise ValueError("Each table may appear only once in a join.")
+
+    tables = {}
+    for name in table_names:
+        table_info = get_table(db_name, name)
+        if table_info is None:
+            raise ValueError(f"Table '{name}' does not exist in database '{db_name}'.")
+        tables[name] = table_info
+
+    edges = []
+    for join in query.joins:
+        left = _resolve_column(join.left, tables)
+        right = _resolve_column(join.right, tables)
+        if left[0] == right[0]:
+            raise ValueError(f"Join condition {join.left} = {join.right} must compare two tables.")
+        edges.append((left, right))
+
+    # Conjuncts that touch a single table are applied while reading that table
+    pushed = {name: [] for name in table_names}
+    residual = []
+    for predicate in conjuncts(_qualify(query.where, tables)):
+        owners = {column.split('.', 1)[0] for column in predicate_columns(predicate, set())}
+        if len(owners) == 1:
+            pushed[owners.pop()].append(predicate)
+        else:
+            residual.append(predicate)
+
+    if query.columns == ["*"]:
+        labels = [f"{name}.{attr}" for name in table_names for attr in tables[name]['attributes']]
+        output = labels
+    else:
+        labels = query.columns
+        output = ["%s.%s" % _resolve_column(column, tables) for column in labels]
+
+    context = {
+        'db_name': db_name,
+        'tables': tables,
+        'edges': edges,
+        'plans': {},
+        'stores': {},
+        'cardinality': {},
+        'residual': _combine(residual),
+        'labels': labels,
+        'output': output
+    }
+
+    # Plan each table's own access path with its pushed-down filter
+    for name in table_names:
+        store = engine.table(db_name, name)
+        single = Select(["*"], name, [], _unqualify(_combine(pushed[name])))
+        plan = plan_select(db_name, single, store)
+        context['plans'][name] = plan
+        context['stores'][name] = store
+        # Rows left after the table's own filter, if ANALYZE TABLE statistics can tell
+        if plan['type'] == 'pk_lookup':
+            context['cardinality'][name] = 1
+        elif 'estimated_rows' in plan:
+            context['cardinality'][name] = max(1, round(plan['estimated_rows']))
+        else:
+            context['cardinality'][name] = store.count()
+
+    # Greedy order: start from the smallest input, then always join the smallest connected table
+    order = [min(table_names, key=lambda name: context['cardinality'][name])]
+    while len(order) < len(table_names):
+        connected = [
+            name for name in table_names if name not in order
+            and any(_edge_between(edge, name, order) for edge in edges)
+        ]
+        if not connected:
+            missing = [name for name in table_names if name not in order]
+            raise ValueError(f"Missing join condition for table(s) {', '.join(missing)}.")
+        order.append(min(connected, key=lambda name: context['cardinality'][name]))
+    context['order'] = order
+    return context
+
+
+def _edge_between(edge, inner, joined):
+    (left_table, _), (right_table, _) = edge
+    return (left_table == inner and right_table in joined) or (right_table == inner and left_table in joined)
+
+
+def _step_keys(context, inner, joined):
+    # [(outer "t.c", inner column)] for every edge linking inner to the tables joined so far
+    keys = []
+    for edge in context['edges']:
+        if not _edge_between(edge, inner, joined):
+            continue
+        (left_table, left_column), (right_table, right_column) = edge
+        if left_table == inner:
+            keys.append((f"{right_table}.{right_column}", left_column))
+        else:
+            keys.append((f"{left_table}.{left_column}", right_column))
+    return keys
+
+
+def _inner_access(context, inner, keys):
+    """How the inner side can be probed: ('primary key', None), ('index', index) or None."""
+    table_info = context['tables'][inner]
+    inner_columns = {column for _, column in keys}
+    primary_keys = table_info['primary_keys']
+    if primary_keys and set(primary_keys) <= inner_columns:
+        return ('primary key', None)
+    store = context['stores'][inner]
+    for _, column in keys:
+        index = index_manager.find_index(context['db_name'], table_info, column, store)
+        if index is not None:
+            return ('index', index)
+    return None
+
+
+def _read_table(context, name, rows=None):
+    """Filter a table's rows and re-key them as "table.column"."""
+    plan = context['plans'][name]
+    table_info = context['tables'][name]
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    if rows is None:
+        rows = fetch_rows(plan, context['stores'][name])
+    for _, row in rows:
+        if evaluate(plan['filter'], row, types):
+            yield {f"{name}.{column}": value for column, value in row.items()}
+
+
+def _hash_join(context, outer_rows, inner, keys):
+    outer_columns = [outer for outer, _ in keys]
+    inner_columns = [f"{inner}.{column}" for _, column in keys]
+
+    def key_of(row, columns):
+        key = tuple(row.get(column) for column in columns)
+        return None if any(value is None for value in key) else key
+
+    results = []
+    if len(outer_rows) < context['cardinality'][inner]:
+        # Build on the (smaller) outer rows and stream the inner table past them
+        table = {}
+        for row in outer_rows:
+            key = key_of(row, outer_columns)
+            if key is not None:
+                table.setdefault(key, []).append(row)
+        for inner_row in _read_table(context, inner):
+            for outer_row in table.get(key_of(inner_row, inner_columns), ()):
+                results.append({**outer_row, **inner_row})
+    else:
+        table = {}
+        for inner_row in _read_table(context, inner):
+            key = key_of(inner_row, inner_columns)
+            if key is not None:
+                table.setdefault(key, []).append(inner_row)
+        for outer_row in outer_rows:
+            for inner_row in table.get(key_of(outer_row, outer_columns), ()):
+                results.append({**outer_row, **inner_row})
+    return results
+
+
+def _index_nested_loop_join(context, outer_rows, inner, keys, access):
+    table_info = context['tables'][inner]
+    store = context['stores'][inner]
+    inner_columns = [f"{inner}.{column}" for _, column in keys]
+    results = []
+
+    for start in range(0, len(outer_rows), PROBE_BATCH_SIZE):
+        batch = outer_rows[start:start + PROBE_BATCH_SIZE]
+        probes = {}
+        for row in batch:
+            values = tuple(row.get(outer) for outer, _ in keys)
+            if all(value is not None for value in values):
+                probes.setdefault(values, []).append(row)
+        if not probes:
+            continue
+
+        # Collect the _ids to fetch, either straight from the key or from the index
+        ids = set()
+        if access[0] == 'primary key':
+            for values in probes:
+                by_column = {column: value for (_, column), value in zip(keys, values)}
+                ids.add(make_key(by_column, table_info))
+        else:
+            index = access[1]
+            column = index.columns[0]
+            position = [inner_column for _, inner_column in keys].index(column)
+            for values in probes:
+                ids.update(index.lookup(index.make_prefix([str(values[position])])))
+        if not ids:
+            continue
+
+        for inner_row in _read_table(context, inner, store.rows(list(ids))):
+            values = tuple(inner_row.get(column) for column in inner_columns)
+            for outer_row in probes.get(values, ()):
+                results.append({**outer_row, **inner_row})
+    return results
+
+
+def execute_join(db_name, query):
+    """Run a multi-way equi-join and return (column labels, list of row tuples)."""
+    context = _prepare(db_name, query)
+    order = context['order']
+    rows = list(_read_table(context, order[0]))
+
+    for position in range(1, len(order)):
+        inner = order[position]
+        keys = _step_keys(context, inner, order[:position])
+        access = _inner_access(context, inner, keys)
+        # Probing pays off while the outer side is smaller than the inner table
+        if access is not None and len(rows) <= context['cardinality'][inner]:
+            rows = _index_nested_loop_join(context, rows, inner, keys, access)
+        else:
+            rows = _hash_join(context, rows, inner, keys)
+
+    types = {}
+    for name, table_info in context['tables'].items():
+        for attr in table_info['structure']:
+            types[f"{name}.{attr['name']}"] = attr['type']
+    result = []
+    for row in rows:
+        if evaluate(context['residual'], row, types):
+            result.append(tuple(row.get(column) for column in context['output']))
+    return context['labels'], result
+
+
+def explain_join(db_name, query):
+    context = _prepare(db_name, query)
+    order = context['order']
+    cardinality = context['cardinality']
+    lines = ["JOIN ORDER: " + " -> ".join(f"{name} (~{cardinality[name]} rows)" for name in order)]
+    lines.append("  1. " + explain_plan(context['plans'][order[0]]).replace("\n", "\n     "))
+
+    estimated_rows = cardinality[order[0]]
+    for position in range(1, len(order)):
+        inner = order[position]
+        keys = _step_keys(context, inner, order[:position])
+        access = _inner_access(context, inner, keys)
+        condition = " AND ".join(f"{outer} = {inner}.{column}" for outer, column in keys)
+        if access is not None and estimated_rows <= cardinality[inner]:
+            using = "primary key" if access[0] == 'primary key' else access[1].name
+            lines.append(f"  {position + 1}. INDEX NESTED LOOP JOIN {inner} ON {condition} using {using}")
+        else:
+            lines.append(f"  {position + 1}. HASH JOIN {inner} ON {condition}")
+            lines.append("     inner: " + explain_plan(context['plans'][inner]).replace("\n", "\n     "))
+        estimated_rows = max(estimated_rows, cardinality[inner])
+
+    if context['residual'] is not None:
+        lines.append(f"  filter: {describe_predicate(context['residual'])}")
+    lines.append(f"  projection: {', '.join(context['output'])}")
+    return "\n".join(lines)
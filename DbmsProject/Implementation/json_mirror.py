@@ -0,0 +1,190 @@
+# json_mirror.py
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+import metrics
+from record_codec import text_record
+
+log = logging.getLogger("dbms.json_mirror")
+
+# A table is re-snapshotted to <database>.<table>.json once it has pending changes older
+# than MIRROR_INTERVAL seconds, or as soon as MIRROR_CHANGE_THRESHOLD changes pile up.
+MIRROR_INTERVAL = 5.0
+MIRROR_CHANGE_THRESHOLD = 1000
+
+_tables = {}  # (db_name, table_name) -> mirror state (see _get_state)
+_tables_lock = threading.Lock()
+_wakeup = threading.Event()
+_compactor = None
+
+
+def snapshot_path(db_name, table_name):
+    return f"{db_name}.{table_name}.json"
+
+
+def changelog_path(db_name, table_name):
+    return f"{db_name}.{table_name}.changes.jsonl"
+
+
+def _get_state(db_name, table_name, store=None):
+    with _tables_lock:
+        state = _tables.get((db_name, table_name))
+        if state is None:
+            # Changes left over from a previous run still count as pending
+            pending = 0
+            if os.path.exists(changelog_path(db_name, table_name)):
+                with open(changelog_path(db_name, table_name), "r") as log_file:
+                    pending = sum(1 for _ in log_file)
+            state = {
+                'store': store,
+                'lock': threading.Lock(),
+                'compact_lock': threading.Lock(),
+                'pending': pending,
+                'first_pending': time.time() if pending else None
+            }
+            _tables[(db_name, table_name)] = state
+        elif store is not None:
+            state['store'] = store
+    return state
+
+
+def _append_changes(store, db_name, table_name, entries):
+    if not entries:
+        return
+    _ensure_compactor()
+    state = _get_state(db_name, table_name, store)
+    lines = "".join(json.dumps(entry) + "\n" for entry in entries)
+    with state['lock']:
+        with open(changelog_path(db_name, table_name), "a") as log_file:
+            log_file.write(lines)
+        if not state['pending']:
+            state['first_pending'] = time.time()
+        state['pending'] += len(entries)
+        if state['pending'] >= MIRROR_CHANGE_THRESHOLD:
+            _wakeup.set()
+
+
+@metrics.timed("mirror")
+def record_changes(store, db_name, table_name, changes):
+    # ("put", document) / ("del", key) pairs in the order they were applied, in one append;
+    # called by the redo log (wal) once they are durable
+    _append_changes(store, db_name, table_name, [
+        dict(text_record(item, store.table_info), op="put") if op == "put" else {"op": "del", "key": item}
+        for op, item in changes
+    ])
+
+
+def write_snapshot(store, json_file_path):
+    """Stream the table into a JSON array and atomically replace the mirror file."""
+    tmp_path = json_file_path + ".tmp"
+    with open(tmp_path, "w") as json_file:
+        json_file.write("[")
+        first = True
+        for document in store.scan_documents():
+            # json.dumps and one write per record is much faster than json.dump's many small writes
+            json_file.write(("\n    " if first else ",\n    ") + json.dumps(document))
+            first = False
+        json_file.write("\n]" if not first else "]")
+        json_file.flush()
+        os.fsync(json_file.fileno())
+    os.replace(tmp_path, json_file_path)
+
+
+def compact_table(db_name, table_name):
+    state = _get_state(db_name, table_name)
+    if state['store'] is None:
+        return
+    with state['compact_lock']:
+        _compact(db_name, table_name, state)
+
+
+def rebuild_table(store, db_name, table_name):
+    # Snapshot the table right away, e.g. after a bulk load that bypassed the change log
+    state = _get_state(db_name, table_name, store)
+    with state['compact_lock']:
+        _compact(db_name, table_name, state)
+
+
+def _compact(db_name, table_name, state):
+    # Everything logged before this offset is already applied to the backend,
+    # so the snapshot taken below is guaranteed to contain it
+    with state['lock']:
+        log_path = changelog_path(db_name, table_name)
+        offset = os.path.getsize(log_path) if os.path.exists(log_path) else 0
+        compacted = state['pending']
+
+    write_snapshot(state['store'], snapshot_path(db_name, table_name))
+
+    # Drop the part of the change log that the snapshot now covers. Entries
+    # appended meanwhile are kept; replaying them over the snapshot is idempotent.
+    with state['lock']:
+        remaining = ""
+        if os.path.exists(log_path):
+            with open(log_path, "r") as log_file:
+                log_file.seek(offset)
+                remaining = log_file.read()
+        if remaining:
+            tmp_path = log_path + ".tmp"
+            with open(tmp_path, "w") as log_file:
+                log_file.write(remaining)
+            os.replace(tmp_path, log_path)
+        elif os.path.exists(log_path):
+            os.remove(log_path)
+        state['pending'] = max(0, state['pending'] - compacted)
+        state['first_pending'] = time.time() if state['pending'] else None
+
+
+def forget_table(db_name, table_name):
+    # Called when a table is dropped; its change log no longer applies
+    with _tables_lock:
+        state = _tables.pop((db_name, table_name), None)
+    if state is not None:
+        with state['lock']:
+            if os.path.exists(changelog_path(db_name, table_name)):
+                os.remove(changelog_path(db_name, table_name))
+
+
+def flush_all():
+    # Snapshot every table that still has pending changes
+    with _tables_lock:
+        tables = [key for key, state in _tables.items() if state['pending']]
+    for db_name, table_name in tables:
+        try:
+            compact_table(db_name, table_name)
+        except Exception as e:
+            log.error("Error compacting mirror for %s.%s: %s", db_name, table_name, e)
+
+
+def _compactor_loop():
+    while True:
+        _wakeup.wait(timeout=MIRROR_INTERVAL)
+        _wakeup.clear()
+        now = time.time()
+        with _tables_lock:
+            due = [
+                key for key, state in _tables.items()
+                if state['pending'] and (
+                    state['pending'] >= MIRROR_CHANGE_THRESHOLD
+                    or now - state['first_pending'] >= MIRROR_INTERVAL
+                )
+            ]
+        for db_name, table_name in due:
+            try:
+                compact_table(db_name, table_name)
+            except Exception as e:
+                log.error("Error compacting mirror for %s.%s: %s", db_name, table_name, e)
+
+
+def _ensure_compactor():
+    global _compactor
+    if _compactor is not None:
+        return
+    with _tables_lock:
+        if _compactor is None:
+            _compactor = threading.Thread(target=_compactor_loop, name="json-mirror-compactor", daemon=True)
+            _compactor.start()
+            atexit.register(flush_all)
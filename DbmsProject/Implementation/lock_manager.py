@@ -0,0 +1,102 @@
+# lock_manager.py
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+SHARED = "S"
+EXCLUSIVE = "X"
+
+
+class ReadWriteLock:
+    """Many readers or one writer; waiting writers block new readers so DDL is not starved."""
+
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = False
+        self._waiting_writers = 0
+
+    def acquire_shared(self):
+        with self._condition:
+            while self._writer or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+
+    def release_shared(self):
+        with self._condition:
+            self._readers -= 1
+            if not self._readers:
+                self._condition.notify_all()
+
+    def acquire_exclusive(self):
+        with self._condition:
+            self._waiting_writers += 1
+            try:
+                while self._writer or self._readers:
+                    self._condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = True
+
+    def release_exclusive(self):
+        with self._condition:
+            self._writer = False
+            self._condition.notify_all()
+
+    def acquire(self, mode):
+        if mode == EXCLUSIVE:
+            self.acquire_exclusive()
+        else:
+            self.acquire_shared()
+
+    def release(self, mode):
+        if mode == EXCLUSIVE:
+            self.release_exclusive()
+        else:
+            self.release_shared()
+
+
+# One lock for the catalog, one per (db_name, table_name) for the table's data
+catalog_lock = ReadWriteLock()
+_table_locks = {}
+_table_locks_guard = threading.Lock()
+
+
+def table_lock(db_name, table_name):
+    key = (db_name, table_name)
+    with _table_locks_guard:
+        lock = _table_locks.get(key)
+        if lock is None:
+            lock = ReadWriteLock()
+            _table_locks[key] = lock
+        return lock
+
+
+@contextmanager
+def statement_locks(db_name=None, shared_tables=(), exclusive_tables=(), catalog=None):
+    """Hold every lock a statement needs for its whole duration.
+
+    Table locks are taken in sorted order, then the catalog lock, so two
+    statements can never wait on each other in a cycle.
+    """
+    modes = {}
+    for table_name in shared_tables:
+        modes[table_name] = SHARED
+    for table_name in exclusive_tables:
+        modes[table_name] = EXCLUSIVE
+
+    acquired = []
+    try:
+        with metrics.phase("locks"):
+            for table_name in sorted(modes):
+                lock = table_lock(db_name, table_name)
+                lock.acquire(modes[table_name])
+                acquired.append((lock, modes[table_name]))
+            if catalog is not None:
+                catalog_lock.acquire(catalog)
+                acquired.append((catalog_lock, catalog))
+        yield
+    finally:
+        for lock, mode in reversed(acquired):
+            lock.release(mode)
@@ -1,21 +1,68 @@
 # main_server.py
-import socket
-import threading
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from server_handler import handle_client
+from db_catalog import init_catalog
+from protocol import write_message
+import metrics
+import wal
 
 HOST = '127.0.0.1'
 PORT = 65431
+# Connections beyond this are turned away with an error message
+MAX_CONNECTIONS = int(os.environ.get("DBMS_MAX_CONNECTIONS", "10000"))
+BACKLOG = int(os.environ.get("DBMS_LISTEN_BACKLOG", "1024"))  # pending connects the OS queues
+EXECUTOR_WORKERS = int(os.environ.get("DBMS_EXECUTOR_WORKERS", "32"))  # threads running database calls
+
+log = logging.getLogger("dbms.server")
+
+async def serve(host=HOST, port=PORT, max_connections=MAX_CONNECTIONS, ready=None):
+    # Parse the catalog once; every command afterwards uses the in-memory copy
+    if init_catalog() is None:
+        log.error("Failed to load catalog.")
+        return
+    # Writes acknowledged before a crash are replayed from the log
+    wal.recover()
+
+    executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="db")
+    active = {'count': 0}
+
+    async def on_connect(reader, writer):
+        if active['count'] >= max_connections:
+            try:
+                await write_message(writer, "Error: Server is at its connection limit. Try again later.")
+            except ConnectionError:
+                pass
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+            return
+        active['count'] += 1
+        try:
+            await handle_client(reader, writer, executor)
+        finally:
+            active['count'] -= 1
+
+    server = await asyncio.start_server(on_connect, host, port, backlog=BACKLOG)
+    log.info("Server started and listening on %s:%s", host, port)
+    if ready is not None:
+        ready.set()
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
 
 def start_server():
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    server.bind((HOST, PORT))
-    server.listen(5)
-    print(f"Server started and listening on {HOST}:{PORT}")
-
-    while True:
-        conn, addr = server.accept()
-        thread = threading.Thread(target=handle_client, args=(conn, addr))
-        thread.start()
+    metrics.configure_logging()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        log.info("Server stopped.")
 
 if __name__ == "__main__":
     start_server()
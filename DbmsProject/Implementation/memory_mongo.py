@@ -0,0 +1,280 @@
+# memory_mongo.py
+# In-process stand-in for pymongo.MongoClient, covering the calls MongoEngine makes.
+# Used by benchmark.py so the server can be measured without a MongoDB instance;
+# exceptions are pymongo's own, so MongoTable handles them unchanged.
+import copy
+import threading
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY_CODE = 11000
+
+
+def _matches(document, query):
+    for field, condition in (query or {}).items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            for operator, argument in condition.items():
+                if operator == "$in" and value not in argument:
+                    return False
+                if operator == "$exists" and (field in document) != bool(argument):
+                    return False
+        elif value != condition:
+            return False
+    return True
+
+
+def _project(document, projection):
+    if not projection:
+        return copy.copy(document)
+    result = {}
+    if projection.get("_id", 1) and "_id" in document:
+        result["_id"] = document["_id"]
+    for field, include in projection.items():
+        if include and field != "_id" and field in document:
+            result[field] = document[field]
+    return result
+
+
+def _evaluate(expression, document):
+    # The few aggregation expressions MongoTable builds: field paths, $split,
+    # $arrayElemAt, $toLong and $toDouble
+    if isinstance(expression, str) and expression.startswith("$"):
+        return document.get(expression[1:])
+    if isinstance(expression, dict):
+        operator, arguments = next(iter(expression.items()))
+        if operator == "$split":
+            return _evaluate(arguments[0], document).split(arguments[1])
+        if operator == "$arrayElemAt":
+            values = _evaluate(arguments[0], document)
+            return values[arguments[1]] if arguments[1] < len(values) else None
+        if operator == "$toLong":
+            return int(_evaluate(arguments, document))
+        if operator == "$toDouble":
+            return float(_evaluate(arguments, document))
+        return {field: _evaluate(value, document) for field, value in expression.items()}
+    return expression
+
+
+def _accumulate(operator, values):
+    values = [value for value in values if value is not None]
+    if operator == "$sum":
+        return sum(values)
+    if not values:
+        return None
+    if operator == "$avg":
+        return sum(values) / len(values)
+    if operator == "$min":
+        return min(values)
+    if operator == "$max":
+        return max(values)
+    raise NotImplementedError(f"memory_mongo does not support {operator}.")
+
+
+class MemoryCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def limit(self, count):
+        if count:
+            self.documents = self.documents[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __iter__(self):
+        return iter(self.documents)
+
+
+class MemoryResult:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class MemoryCollection:
+    def __init__(self, name):
+        self.name = name
+        self.documents = {}
+        self.created = False  # like MongoDB, a collection exists once something was written to it
+        self.lock = threading.Lock()
+
+    def _select(self, query):
+        # _id equality and $in go straight to the dict instead of scanning
+        condition = (query or {}).get("_id")
+        if condition is not None and not isinstance(condition, dict):
+            candidates = [self.documents[condition]] if condition in self.documents else []
+        elif isinstance(condition, dict) and set(condition) == {"$in"}:
+            candidates = [self.documents[key] for key in condition["$in"] if key in self.documents]
+        else:
+            candidates = list(self.documents.values())
+        return [document for document in candidates if _matches(document, query)]
+
+    def find(self, query=None, projection=None):
+        with self.lock:
+            return MemoryCursor([_project(document, projection) for document in self._select(query)])
+
+    def find_one(self, query=None, projection=None):
+        with self.lock:
+            found = self._select(query)
+            return _project(found[0], projection) if found else None
+
+    def _insert(self, document):
+        if "_id" not in document:
+            raise ValueError("memory_mongo documents need an _id.")
+        if document["_id"] in self.documents:
+            return False
+        self.documents[document["_id"]] = copy.copy(document)
+        self.created = True
+        return True
+
+    def insert_one(self, document):
+        with self.lock:
+            if not self._insert(document):
+                raise DuplicateKeyError(f"E11000 duplicate key error _id: {document['_id']}")
+        return MemoryResult(inserted_id=document["_id"])
+
+    def insert_many(self, documents, ordered=True):
+        write_errors = []
+        inserted = 0
+        with self.lock:
+            for index, document in enumerate(documents):
+                if self._insert(document):
+                    inserted += 1
+                    continue
+                write_errors.append({"index": index, "code": DUPLICATE_KEY_CODE, "errmsg": "E11000 duplicate key error"})
+                if ordered:
+                    break
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": inserted})
+        return MemoryResult(inserted_ids=[document["_id"] for document in documents])
+
+    def find_one_and_delete(self, query, projection=None):
+        with self.lock:
+            found = self._select(query)
+            if not found:
+                return None
+            del self.documents[found[0]["_id"]]
+            return _project(found[0], projection)
+
+    def delete_one(self, query):
+        with self.lock:
+            found = self._select(query)
+            if found:
+                del self.documents[found[0]["_id"]]
+            return MemoryResult(deleted_count=len(found[:1]))
+
+    def delete_many(self, query):
+        with self.lock:
+            found = self._select(query)
+            for document in found:
+                del self.documents[document["_id"]]
+            return MemoryResult(deleted_count=len(found))
+
+    def bulk_write(self, requests, ordered=True):
+        # InsertOne / DeleteOne / ReplaceOne, read through the same private fields pymongo uses
+        write_errors = []
+        counts = {"inserted": 0, "deleted": 0, "modified": 0}
+        with self.lock:
+            for index, request in enumerate(requests):
+                kind = type(request).__name__
+                if kind == "InsertOne":
+                    if self._insert(request._doc):
+                        counts["inserted"] += 1
+                        continue
+                    write_errors.append({"index": index, "code": DUPLICATE_KEY_CODE, "errmsg": "E11000 duplicate key error"})
+                    if ordered:
+                        break
+                elif kind == "DeleteOne":
+                    found = self._select(request._filter)
+                    if found:
+                        del self.documents[found[0]["_id"]]
+                        counts["deleted"] += 1
+                elif kind == "ReplaceOne":
+                    found = self._select(request._filter)
+                    if found:
+                        self.documents[found[0]["_id"]] = copy.copy(request._doc)
+                        counts["modified"] += 1
+                else:
+                    raise NotImplementedError(f"memory_mongo does not support {kind}.")
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": counts["inserted"],
+                                  "nRemoved": counts["deleted"]})
+        return MemoryResult(inserted_count=counts["inserted"], deleted_count=counts["deleted"],
+                            modified_count=counts["modified"])
+
+    def aggregate(self, pipeline):
+        # $match and $group stages only
+        with self.lock:
+            documents = list(self.documents.values())
+        for stage in pipeline:
+            operator, argument = next(iter(stage.items()))
+            if operator == "$match":
+                documents = [document for document in documents if _matches(document, argument)]
+            elif operator == "$group":
+                groups = {}
+                for document in documents:
+                    key = _evaluate(argument["_id"], document)
+                    groups.setdefault(repr(key), (key, []))[1].append(document)
+                documents = []
+                for key, members in groups.values():
+                    result = {"_id": key}
+                    for field, accumulator in argument.items():
+                        if field != "_id":
+                            (name, expression), = accumulator.items()
+                            result[field] = _accumulate(name, [_evaluate(expression, member) for member in members])
+                    documents.append(result)
+            else:
+                raise NotImplementedError(f"memory_mongo does not support the {operator} stage.")
+        return MemoryCursor(documents)
+
+    def estimated_document_count(self):
+        return len(self.documents)
+
+    def count_documents(self, query):
+        with self.lock:
+            return len(self._select(query))
+
+
+class MemoryDatabase:
+    def __init__(self, name):
+        self.name = name
+        self.collections = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            collection = self.collections.get(name)
+            if collection is None:
+                collection = MemoryCollection(name)
+                self.collections[name] = collection
+            return collection
+
+    def list_collection_names(self):
+        with self.lock:
+            return [name for name, collection in self.collections.items() if collection.created]
+
+    def drop_collection(self, name):
+        with self.lock:
+            self.collections.pop(name, None)
+
+
+class MemoryMongoClient:
+    def __init__(self):
+        self.databases = {}
+        self.lock = threading.Lock()
+
+    def __getitem__(self, name):
+        with self.lock:
+            database = self.databases.get(name)
+            if database is None:
+                database = MemoryDatabase(name)
+                self.databases[name] = database
+            return database
+
+    def drop_database(self, name):
+        with self.lock:
+            self.databases.pop(name, None)
+
+    def close(self):
+        pass
@@ -0,0 +1,276 @@
+# metrics.py
+import functools
+import logging
+import math
+import os
+import threading
+import time
+
+# Logging goes through the standard logging module ("dbms.*" loggers); debug
+# messages are formatted lazily, so they cost next to nothing below the level.
+LOG_LEVEL = os.environ.get("DBMS_LOG_LEVEL", "INFO")
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+# Per-command counters and latency histograms, split into phases
+METRICS_ENABLED = os.environ.get("DBMS_METRICS", "1") != "0"
+PHASES = ("parse", "locks", "catalog", "backend", "mirror", "wal")
+
+# Commands slower than this are written to the slow-query log (0 logs everything, None disables it)
+SLOW_QUERY_MS = float(os.environ.get("DBMS_SLOW_QUERY_MS", "200"))
+SLOW_QUERY_LOG = os.environ.get("DBMS_SLOW_QUERY_LOG")  # a file; by default the normal log
+
+slow_query_log = logging.getLogger("dbms.slow_query")
+
+
+def configure_logging(level=None):
+    """Set up the root handler and, if configured, a separate slow-query log file."""
+    logging.basicConfig(level=(level or LOG_LEVEL).upper(), format=LOG_FORMAT)
+    if SLOW_QUERY_LOG and not slow_query_log.handlers:
+        handler = logging.FileHandler(SLOW_QUERY_LOG)
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        slow_query_log.addHandler(handler)
+        slow_query_log.propagate = False
+
+
+def set_slow_query_threshold(milliseconds):
+    global SLOW_QUERY_MS
+    SLOW_QUERY_MS = milliseconds
+
+
+class Histogram:
+    """Latency counts in power-of-two microsecond buckets (1 us .. ~67 s)."""
+
+    BOUNDS = [2 ** i for i in range(27)]
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        # Bucket i holds values in (2**(i-1), 2**i] microseconds
+        bucket = min(len(self.BOUNDS), max(0, math.ceil(seconds * 1e6) - 1).bit_length())
+        self.buckets[bucket] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket holding the given rank, capped at the largest value seen
+        if not self.count:
+            return 0.0
+        rank = max(1, int(fraction * self.count + 0.5))
+        seen = 0
+        for bucket, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                if bucket >= len(self.BOUNDS):
+                    return self.max
+                return min(self.BOUNDS[bucket] / 1e6, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class _Trace:
+    # Time spent in each phase by the command running on this thread
+    __slots__ = ("phases", "active")
+
+    def __init__(self):
+        self.phases = {}
+        self.active = False
+
+
+class _Phase:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.trace.active = True
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self.started
+        self.trace.active = False
+        self.trace.phases[self.name] = self.trace.phases.get(self.name, 0.0) + elapsed
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+_local = threading.local()
+_stats = {}  # command type -> {'count', 'errors', 'latency': Histogram, 'phases': {phase: Histogram}}
+_counters = {}  # event name -> count (e.g. row cache hits and misses)
+_stats_lock = threading.Lock()
+
+
+def phase(name):
+    """Context manager charging its time to a phase of the current command.
+
+    Outside a traced command, or inside another phase (the outer one already
+    counts the time), it does nothing.
+    """
+    trace = getattr(_local, "trace", None)
+    if trace is None or trace.active:
+        return _NO_PHASE
+    return _Phase(trace, name)
+
+
+def timed(name):
+    """Decorator form of phase()."""
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def timed_iter(name, iterable):
+    # For lazy results (e.g. cursors): only the time spent producing items is charged
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return iterable
+    return _timed_iter(name, iter(iterable))
+
+
+def _timed_iter(name, iterator):
+    while True:
+        with phase(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+def begin_command():
+    if METRICS_ENABLED:
+        _local.trace = _Trace()
+        return time.perf_counter()
+    return None
+
+
+def end_command(started, command_type, command, failed):
+    """Record a finished command's latency and phases; log it if it was slow."""
+    trace = getattr(_local, "trace", None)
+    _local.trace = None
+    if started is None or trace is None:
+        return
+    elapsed = time.perf_counter() - started
+
+    with _stats_lock:
+        entry = _stats.get(command_type)
+        if entry is None:
+            entry = {'count': 0, 'errors': 0, 'latency': Histogram(), 'phases': {}}
+            _stats[command_type] = entry
+        entry['count'] += 1
+        if failed:
+            entry['errors'] += 1
+        entry['latency'].add(elapsed)
+        for name, seconds in trace.phases.items():
+            histogram = entry['phases'].get(name)
+            if histogram is None:
+                histogram = entry['phases'][name] = Histogram()
+            histogram.add(seconds)
+
+    if SLOW_QUERY_MS is not None and elapsed * 1000 >= SLOW_QUERY_MS:
+        breakdown = " ".join(f"{name}={trace.phases[name] * 1000:.2f}ms" for name in PHASES if name in trace.phases)
+        slow_query_log.warning("%.2fms %s [%s] %s", elapsed * 1000, command_type, breakdown, command)
+
+
+def increment(name, amount=1):
+    if METRICS_ENABLED:
+        with _stats_lock:
+            _counters[name] = _counters.get(name, 0) + amount
+
+
+def counters():
+    with _stats_lock:
+        return dict(_counters)
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+        _counters.clear()
+
+
+def snapshot():
+    """Current counters as plain data: {command type: {count, errors, *_ms, phases}}."""
+    def milliseconds(value):
+        return round(value * 1000, 3)
+
+    result = {}
+    with _stats_lock:
+        for command_type, entry in sorted(_stats.items()):
+            latency = entry['latency']
+            result[command_type] = {
+                'count': entry['count'],
+                'errors': entry['errors'],
+                'avg_ms': milliseconds(latency.mean()),
+                'p50_ms': milliseconds(latency.percentile(0.50)),
+                'p95_ms': milliseconds(latency.percentile(0.95)),
+                'p99_ms': milliseconds(latency.percentile(0.99)),
+                'max_ms': milliseconds(latency.max),
+                'phases': {
+                    name: {'avg_ms': milliseconds(histogram.mean()), 'p95_ms': milliseconds(histogram.percentile(0.95))}
+                    for name, histogram in entry['phases'].items()
+                }
+            }
+    return result
+
+
+def _table(header, rows):
+    widths = [max(len(str(value)) for value in column) for column in zip(header, *rows)]
+    lines = ["  ".join(str(value).rjust(width) for value, width in zip(header, widths))]
+    lines.append("  ".join("-" * width for width in widths))
+    for row in rows:
+        lines.append("  ".join(str(value).rjust(width) for value, width in zip(row, widths)))
+    return lines
+
+
+def format_stats():
+    """The SHOW STATS output: latency per command type, then the average time per phase."""
+    stats = snapshot()
+    if not stats:
+        return "No commands recorded yet." if METRICS_ENABLED else "Metrics are disabled (DBMS_METRICS=0)."
+
+    latency_rows = [
+        (command_type, entry['count'], entry['errors'], entry['avg_ms'], entry['p50_ms'],
+         entry['p95_ms'], entry['p99_ms'], entry['max_ms'])
+        for command_type, entry in stats.items()
+    ]
+    lines = _table(("command", "count", "errors", "avg ms", "p50 ms", "p95 ms", "p99 ms", "max ms"), latency_rows)
+
+    phase_rows = [
+        (command_type,) + tuple(
+            entry['phases'][name]['avg_ms'] if name in entry['phases'] else "-" for name in PHASES
+        )
+        for command_type, entry in stats.items()
+    ]
+    lines.append("")
+    lines.append("average ms per phase")
+    lines.extend(_table(("command",) + PHASES, phase_rows))
+    events = counters()
+    if events:
+        lines.append("")
+        lines.extend(_table(("event", "count"), sorted(events.items())))
+    if SLOW_QUERY_MS is not None:
+        lines.append(f"slow query threshold: {SLOW_QUERY_MS:g} ms")
+    return "\n".join(lines)
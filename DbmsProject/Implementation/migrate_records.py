@@ -0,0 +1,25 @@
+# migrate_records.py
+# Rewrites rows stored with the old '#'-joined value string into the typed binary
+# format of record_codec. Old rows stay readable, so this can run at any time.
+import sys
+from db_catalog import init_catalog, list_database_names, list_table_names
+from storage_engine import get_engine
+
+def migrate_all(db_names=None):
+    engine = get_engine()
+    total = 0
+    for db_name in db_names or list_database_names():
+        for table_name in list_table_names(db_name):
+            store = engine.table(db_name, table_name)
+            if store is None:
+                continue
+            migrated = store.migrate()
+            total += migrated
+            print(f"{db_name}.{table_name}: {migrated} row(s) migrated.")
+    return total
+
+if __name__ == "__main__":
+    if init_catalog() is None:
+        print("Failed to load catalog.")
+        sys.exit(1)
+    print(f"Done: {migrate_all(sys.argv[1:])} row(s) migrated.")
@@ -0,0 +1,81 @@
+# protocol.py
+import asyncio
+import struct
+
+# Every message is a 4-byte big-endian length, a 4-byte tag and that many UTF-8 bytes.
+# A response carries the tag of the command it answers, so a client can pipeline commands.
+HEADER = struct.Struct("!II")
+MAX_MESSAGE_SIZE = 64 * 1024 * 1024
+
+
+def encode_message(text, tag=0):
+    data = text.encode('utf-8')
+    if len(data) > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {len(data)} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit.")
+    return HEADER.pack(len(data), tag) + data
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            if remaining == size:
+                return None  # clean close between messages
+            raise ConnectionError("Connection closed in the middle of a message.")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock, text, tag=0):
+    sock.sendall(encode_message(text, tag))
+
+
+def send_messages(sock, messages):
+    """Send several (tag, text) messages with a single write."""
+    sock.sendall(b"".join(encode_message(text, tag) for tag, text in messages))
+
+
+def recv_message(sock):
+    """Read one framed message from a blocking socket; None when the peer closed."""
+    message = recv_tagged_message(sock)
+    return None if message is None else message[1]
+
+
+def recv_tagged_message(sock):
+    """Read one framed message as (tag, text); None when the peer closed."""
+    header = _recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    length, tag = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit.")
+    body = _recv_exactly(sock, length) if length else b""
+    if body is None:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    return tag, body.decode('utf-8')
+
+
+async def read_message(reader):
+    """Read one framed message from an asyncio stream as (tag, text); None when the peer closed."""
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Connection closed in the middle of a message.")
+    length, tag = HEADER.unpack(header)
+    if length > MAX_MESSAGE_SIZE:
+        raise ValueError(f"Message of {length} bytes exceeds the {MAX_MESSAGE_SIZE} byte limit.")
+    try:
+        body = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    return tag, body.decode('utf-8')
+
+
+async def write_message(writer, text, tag=0):
+    writer.write(encode_message(text, tag))
+    await writer.drain()
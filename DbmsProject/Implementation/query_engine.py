@@ -0,0 +1,430 @@
+# query_engine.py
+import heapq
+import itertools
+
+from db_catalog import get_table
+from db_operations import engine
+from record_codec import cast_value, literal_value, make_key
+from sql_parser import conjuncts, describe_predicate, predicate_columns
+import index_manager
+import table_stats
+
+# With statistics, an index seek expected to return more than this fraction of the
+# table is replaced by a full scan (fetching that many rows by key costs more)
+INDEX_SEEK_MAX_SELECTIVITY = 0.3
+# Rows fetched by key per backend call when they have to come back in index order
+ORDERED_FETCH_BATCH = 256
+
+
+def query_limit(query):
+    """The query's LIMIT as a number, or None without one."""
+    if query.limit is None:
+        return None
+    try:
+        limit = int(query.limit)
+    except (TypeError, ValueError):
+        raise ValueError(f"LIMIT needs a whole number but found '{query.limit}'.")
+    if limit < 0:
+        raise ValueError("LIMIT cannot be negative.")
+    return limit
+
+
+def _seekable(column, literal, types):
+    # A number on a numeric column, or anything on a text one
+    if (types.get(column) or '').upper() not in ("INT", "FLOAT"):
+        return True
+    return isinstance(literal_value(literal, types.get(column)), (int, float))
+
+
+def _index_order(order_by, index_columns, prefix, equalities):
+    """Whether reading the index after its equality prefix gives ORDER BY order:
+    None if not, else whether it has to be read backwards."""
+    # Columns pinned by an equality hold one value in every row and do not change the order
+    wanted = [(column, descending) for column, descending in order_by if column not in equalities]
+    if not wanted:
+        return False
+    if len({descending for _, descending in wanted}) > 1:
+        return None
+    if [column for column, _ in wanted] != index_columns[len(prefix):len(prefix) + len(wanted)]:
+        return None
+    return wanted[0][1]
+
+
+def plan_select(db_name, query, store):
+    """Pick an access path: primary-key lookup, index seek, ordered index scan or full scan."""
+    table_info = get_table(db_name, query.table)
+    if table_info is None:
+        raise ValueError(f"Table '{query.table}' does not exist in database '{db_name}'.")
+
+    attributes = table_info['attributes']
+    columns = attributes if query.columns == ["*"] else query.columns
+    order_by = query.order_by
+    referenced = set(columns) | predicate_columns(query.where, set()) | {column for column, _ in order_by}
+    unknown = [c for c in referenced if c not in attributes]
+    if unknown:
+        raise ValueError(f"Unknown column(s) {', '.join(sorted(unknown))} in table '{query.table}'.")
+
+    plan = {
+        'table': query.table,
+        'table_info': table_info,
+        'columns': columns,
+        'filter': query.where,
+        'order_by': order_by,
+        'limit': query_limit(query),
+        'ordered': not order_by,  # whether rows already come out in ORDER BY order
+        'reverse': False
+    }
+    # Only literals that cast to the column's type can become keys or index bounds;
+    # the others (e.g. 'abc' against an INT column) are left to the filter
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    where_conjuncts = [predicate for predicate in conjuncts(query.where)
+                       if predicate[0] != 'cmp' or _seekable(predicate[1], predicate[3], types)]
+    equalities = {}
+    for predicate in where_conjuncts:
+        if predicate[0] == 'cmp' and predicate[2] == "=":
+            equalities.setdefault(predicate[1], predicate[3])
+
+    # Row estimates from ANALYZE TABLE statistics, when the table has them
+    stats = table_stats.get_stats(db_name, table_info)
+    if stats is not None:
+        plan['estimated_rows'] = stats.row_count * stats.selectivity(query.where, types)
+
+    # 1. Every primary key column is pinned by an equality: single _id lookup
+    primary_keys = table_info['primary_keys']
+    if primary_keys and all(pk in equalities for pk in primary_keys):
+        plan['type'] = 'pk_lookup'
+        plan['key'] = make_key(equalities, table_info)
+        plan['ordered'] = True  # at most one row
+        return plan
+
+    # 2. Equalities on the leading column(s) of an index, optionally followed by range
+    # bounds on the next one: index seek. Without statistics the index matching the
+    # most columns wins (the first one on a tie); with them the most selective one,
+    # unless even that would read a large part of the table without covering the query
+    ranges = {}
+    for predicate in where_conjuncts:
+        if predicate[0] == 'cmp' and predicate[2] in ("<", "<=", ">", ">="):
+            ranges.setdefault(predicate[1], []).append(predicate)
+    needed = referenced
+    best = None
+    for index_info in table_info['indexes']:
+        prefix = []
+        for column in index_info['columns']:
+            if column not in equalities:
+                break
+            prefix.append(column)
+        range_column = None
+        if len(prefix) < len(index_info['columns']) and index_info['columns'][len(prefix)] in ranges:
+            range_column = index_info['columns'][len(prefix)]
+        if not prefix and range_column is None:
+            continue
+        covering = needed <= set(index_info['columns']) | set(index_info['include']) | set(primary_keys)
+        if stats is not None:
+            matched = [('cmp', column, "=", equalities[column]) for column in prefix]
+            matched.extend(ranges.get(range_column, []))
+            rank = (stats.selectivity(('and', matched), types), not covering)
+        else:
+            rank = (-len(prefix), range_column is None, not covering)
+        if best is None or rank < best[0]:
+            best = (rank, index_info, prefix, range_column, covering)
+    if best is not None:
+        rank, index_info, prefix, range_column, covering = best
+        if stats is None or covering or rank[0] <= INDEX_SEEK_MAX_SELECTIVITY:
+            index = index_manager.get_index(db_name, table_info, index_info, store)
+            if index is not None:
+                _index_seek(plan, index, prefix, range_column, equalities, ranges, covering)
+                reverse = _index_order(order_by, index_info['columns'], prefix, equalities)
+                if order_by and reverse is not None:
+                    plan['ordered'], plan['reverse'] = True, reverse
+                return plan
+        else:
+            plan['skipped_index'] = (index_info['name'], rank[0])
+
+    # 3. ORDER BY the leading column(s) of an index: read the whole index in order
+    # instead of sorting. With a LIMIT only the first rows are ever read (top-N);
+    # without one this only pays off when the index covers the query
+    if order_by:
+        for index_info in table_info['indexes']:
+            reverse = _index_order(order_by, index_info['columns'], [], equalities)
+            covering = needed <= set(index_info['columns']) | set(index_info['include']) | set(primary_keys)
+            if reverse is None or (plan['limit'] is None and not covering):
+                continue
+            index = index_manager.get_index(db_name, table_info, index_info, store)
+            if index is not None:
+                _index_seek(plan, index, [], None, equalities, ranges, covering)
+                plan['type'] = 'index_scan'
+                plan['ordered'], plan['reverse'] = True, reverse
+                return plan
+
+    # 4. Nothing usable: scan the table, decoding only the columns the query needs
+    plan['type'] = 'full_scan'
+    return plan
+
+
+def _index_seek(plan, index, prefix, range_column, equalities, ranges, covering):
+    plan['type'] = 'index_seek'
+    plan['index'] = index
+    plan['prefix_columns'] = prefix
+    plan['prefix'] = [equalities[column] for column in prefix]
+    plan['column'] = range_column
+    plan['low'] = plan['high'] = None
+    plan['low_inclusive'] = plan['high_inclusive'] = True
+    for _, _, operator, literal in ranges.get(range_column, []):
+        if operator in (">", ">="):
+            plan['low'], plan['low_inclusive'] = literal, operator == ">="
+        else:
+            plan['high'], plan['high_inclusive'] = literal, operator == "<="
+    # Every column the query reads is in the index: the rows are never fetched
+    plan['covering'] = covering
+    return plan
+
+
+def _describe_order(order_by):
+    return ", ".join(f"{column} DESC" if descending else column for column, descending in order_by)
+
+
+def explain_plan(plan):
+    table = plan['table']
+    if plan['type'] == 'pk_lookup':
+        access = f"PRIMARY KEY LOOKUP on {table} (_id = {plan['key']!r})"
+    elif plan['type'] == 'index_seek':
+        bounds = [f"{column} = {value!r}" for column, value in zip(plan['prefix_columns'], plan['prefix'])]
+        if plan['low'] is not None:
+            bounds.append(f"{plan['column']} {'>=' if plan['low_inclusive'] else '>'} {plan['low']!r}")
+        if plan['high'] is not None:
+            bounds.append(f"{plan['column']} {'<=' if plan['high_inclusive'] else '<'} {plan['high']!r}")
+        access = f"INDEX SEEK on {table} using {plan['index'].name} ({' AND '.join(bounds)})"
+    elif plan['type'] == 'index_scan':
+        access = f"INDEX SCAN on {table} using {plan['index'].name} (in key order)"
+    else:
+        access = f"FULL SCAN on {table}"
+    if plan['type'] in ('index_seek', 'index_scan'):
+        if plan['reverse']:
+            access += " backward"
+        if plan['covering']:
+            access += " covering"
+    lines = [access]
+    if plan['filter'] is not None:
+        lines.append(f"  filter: {describe_predicate(plan['filter'])}")
+    lines.extend(explain_order(plan['order_by'], plan['limit'], plan['ordered']))
+    lines.append(f"  projection: {', '.join(plan['columns'])}")
+    if 'skipped_index' in plan:
+        name, selectivity = plan['skipped_index']
+        lines.append(f"  index {name} not used: ~{selectivity:.0%} of the rows match")
+    if 'estimated_rows' in plan:
+        lines.append(f"  estimated rows: {plan['estimated_rows']:.0f} (from statistics)")
+    return "\n".join(lines)
+
+
+def explain_order(order_by, limit, ordered=False):
+    lines = []
+    if order_by and ordered:
+        lines.append(f"  order: {_describe_order(order_by)} (no sort needed)")
+    elif order_by and limit is not None:
+        lines.append(f"  top-{limit} sort: {_describe_order(order_by)}")
+    elif order_by:
+        lines.append(f"  sort: {_describe_order(order_by)}")
+    if limit is not None:
+        lines.append(f"  limit: {limit}")
+    return lines
+
+
+def _compare(left, operator, right):
+    # NULL never matches; mismatched types compare as strings
+    if left is None or right is None:
+        return False
+    if type(left) != type(right) and not (isinstance(left, (int, float)) and isinstance(right, (int, float))):
+        left, right = str(left), str(right)
+    if operator == "=":
+        return left == right
+    if operator == "!=":
+        return left != right
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
+
+
+def evaluate(predicate, row, types):
+    if predicate is None:
+        return True
+    if predicate[0] == 'cmp':
+        _, column, operator, literal = predicate
+        return _compare(row.get(column), operator, literal_value(literal, types.get(column)))
+    if predicate[0] == 'and':
+        return all(evaluate(branch, row, types) for branch in predicate[1])
+    return any(evaluate(branch, row, types) for branch in predicate[1])
+
+
+def _index_bound(index, prefix, literal):
+    # Key prefix for the equality values plus one range bound; None when unbounded
+    if literal is None:
+        return index.make_prefix(prefix) if prefix else None
+    return index.make_prefix(prefix + [str(literal)])
+
+
+def _covered_rows(plan, bounds):
+    # Rows rebuilt from index entries; primary key columns come from the _id
+    table_info = plan['table_info']
+    primary_keys = table_info['primary_keys']
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    for key, row in plan['index'].range_rows(*bounds, reverse=plan['reverse']):
+        parts = str(key).split('#')
+        for position, pk in enumerate(primary_keys):
+            if pk not in row:
+                row[pk] = cast_value(parts[position] if position < len(parts) else '', types.get(pk))
+        yield key, row
+
+
+def _ordered_rows(store, entries, columns, batch_size):
+    # Rows fetched by key a batch at a time, but yielded in the order of the index entries
+    while True:
+        keys = [primary_key for _, primary_key, _ in itertools.islice(entries, batch_size)]
+        if not keys:
+            return
+        found = dict(store.rows(keys, columns))
+        for key in keys:
+            if key in found:
+                yield key, found[key]
+        batch_size = ORDERED_FETCH_BATCH
+
+
+def fetch_rows(plan, store):
+    """Yield the (key, row) pairs the plan's access path produces."""
+    columns = sorted(set(plan['columns']) | predicate_columns(plan['filter'], set())
+                     | {column for column, _ in plan['order_by']})
+    if plan['type'] == 'pk_lookup':
+        yield from store.rows([plan['key']], columns)
+    elif plan['type'] in ('index_seek', 'index_scan'):
+        index = plan['index']
+        prefix = [str(value) for value in plan['prefix']]
+        bounds = (
+            _index_bound(index, prefix, plan['low']),
+            _index_bound(index, prefix, plan['high']),
+            plan['low_inclusive'] or plan['low'] is None,
+            plan['high_inclusive'] or plan['high'] is None
+        )
+        if plan['covering']:
+            yield from _covered_rows(plan, bounds)
+            return
+        if plan['order_by']:
+            # A LIMIT needs no more rows than it keeps, unless the filter drops some
+            batch_size = min(plan['limit'] or ORDERED_FETCH_BATCH, ORDERED_FETCH_BATCH) or 1
+            yield from _ordered_rows(store, index.entries(*bounds, reverse=plan['reverse']), columns, batch_size)
+            return
+        primary_keys = index.range(*bounds)
+        if primary_keys:
+            yield from store.rows(primary_keys, columns)
+    else:
+        yield from store.rows(None, columns)
+
+
+def sort_rows(rows, order_by, limit, value):
+    """rows in ORDER BY order; with a LIMIT only the top rows are kept, in a heap."""
+    if len({descending for _, descending in order_by}) == 1:
+        def key(row):
+            return [index_manager.sort_key(value(row, column)) for column, _ in order_by]
+        if limit is not None:
+            return (heapq.nlargest if order_by[0][1] else heapq.nsmallest)(limit, rows, key=key)
+        return sorted(rows, key=key, reverse=order_by[0][1])
+    # Mixed directions: one stable sort per column, the last ORDER BY column first
+    rows = list(rows)
+    for column, descending in reversed(order_by):
+        rows.sort(key=lambda row: index_manager.sort_key(value(row, column)), reverse=descending)
+    return rows if limit is None else rows[:limit]
+
+
+def iterate_plan(plan, store):
+    """Yield the plan's result row tuples one at a time."""
+    table_info = plan['table_info']
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    rows = (row for _, row in fetch_rows(plan, store) if evaluate(plan['filter'], row, types))
+    if not plan['ordered']:
+        rows = sort_rows(rows, plan['order_by'], plan['limit'], lambda row, column: row.get(column))
+    elif plan['limit'] is not None:
+        rows = itertools.islice(rows, plan['limit'])
+    for row in rows:
+        yield tuple(row.get(column) for column in plan['columns'])
+
+
+def order_result(columns, rows, order_by, limit):
+    """Apply ORDER BY and LIMIT to a finished result (joins and aggregates)."""
+    if order_by:
+        positions = {}
+        for column, _ in order_by:
+            # t.column or column, whichever way the select list names it
+            matches = [position for position, name in enumerate(columns)
+                       if name == column or name.split('.')[-1] == column or column.split('.')[-1] == name]
+            if len(matches) != 1:
+                raise ValueError(f"ORDER BY {column} must name one column of the select list.")
+            positions[column] = matches[0]
+        rows = sort_rows(rows, order_by, limit, lambda row, column: row[positions[column]])
+    return rows if limit is None else rows[:limit]
+
+
+def execute_plan(plan, store):
+    """Run a plan and return (column names, list of row tuples)."""
+    return plan['columns'], list(iterate_plan(plan, store))
+
+
+def format_result(columns, rows):
+    def show(value):
+        return "NULL" if value is None else str(value)
+
+    lines = [" | ".join(columns)]
+    for row in rows:
+        lines.append(" | ".join(show(value) for value in row))
+    lines.append(f"({len(rows)} row{'s' if len(rows) != 1 else ''})")
+    return "\n".join(lines)
+
+
+def select_records(db_name, query, transaction=None):
+    if not db_name:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    try:
+        columns, rows = open_select(db_name, query, transaction)
+        rows = list(rows)
+    except ValueError as e:
+        return f"Error: {e}"
+    except Exception as e:
+        return f"Error executing query: {str(e)}"
+    return format_result(columns, rows)
+
+
+def open_select(db_name, query, transaction=None):
+    """(column names, row iterator) for a query; single-table results are produced lazily."""
+    if query.is_aggregate() or query.joins:
+        if query.is_aggregate():
+            from aggregation import execute_aggregate
+            columns, rows = execute_aggregate(db_name, query, transaction)
+        else:
+            from join_engine import execute_join
+            columns, rows = execute_join(db_name, query)
+        return columns, iter(order_result(columns, rows, query.order_by, query_limit(query)))
+    store = engine.table(db_name, query.table)
+    if transaction is not None and transaction.db_name == db_name:
+        # Key lookups see the transaction's own uncommitted writes
+        store = transaction.view(query.table, store)
+    plan = plan_select(db_name, query, store)
+    return plan['columns'], iterate_plan(plan, store)
+
+
+def explain_select(db_name, query):
+    if not db_name:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    try:
+        if query.is_aggregate() or query.joins:
+            if query.is_aggregate():
+                from aggregation import explain_aggregate
+                text = explain_aggregate(db_name, query)
+            else:
+                from join_engine import explain_join
+                text = explain_join(db_name, query)
+            return "\n".join([text] + explain_order(query.order_by, query_limit(query)))
+        plan = plan_select(db_name, query, engine.table(db_name, query.table))
+    except ValueError as e:
+        return f"Error: {e}"
+    return explain_plan(plan)
@@ -0,0 +1,228 @@
+# record_codec.py
+import math
+import struct
+
+# Default widths (in bytes) for types that carry no explicit length in the catalog
+TYPE_WIDTHS = {
+    "INT": 4,
+    "FLOAT": 8,
+    "DATE": 10,
+    "BIT": 1
+}
+DEFAULT_WIDTH = 30
+
+# Stored rows are {_id: "pk1#pk2", row: <bytes>}. The row bytes are a format version byte,
+# a null bitmap over the non-key columns, then every non-NULL non-key column in schema
+# order: INT as an 8-byte int, FLOAT as an 8-byte double, anything else as a 2-byte
+# length and UTF-8 text. Older documents keep their '#'-joined "value" string and are
+# still read (and rewritten by migrate_records.py).
+CODEC_VERSION = 1
+_INT = struct.Struct("<q")
+_FLOAT = struct.Struct("<d")
+_LENGTH = struct.Struct("<H")
+
+
+def attribute_width(attr):
+    # Varchars use their declared length; other types a fixed default
+    length = attr.get('length')
+    if length:
+        return int(length)
+    return TYPE_WIDTHS.get((attr.get('type') or '').upper(), DEFAULT_WIDTH)
+
+
+def cast_value(value, attr_type):
+    """Convert a raw string value to the Python type of the catalog attribute ('' is NULL)."""
+    if value is None or value == '':
+        return None
+    attr_type = (attr_type or '').upper()
+    try:
+        if attr_type == "INT":
+            return int(value)
+        if attr_type == "FLOAT":
+            return float(value)
+    except (TypeError, ValueError):
+        pass
+    return value
+
+
+class RowCodec:
+    """Binary layout of one table's rows, derived from its catalog Structure."""
+
+    def __init__(self, table_info):
+        self.primary_keys = table_info['primary_keys']
+        self.types = {attr['name']: (attr['type'] or '').upper() for attr in table_info['structure']}
+        # Text columns hold at most their declared width in bytes, on every engine
+        self.widths = {attr['name']: attribute_width(attr) for attr in table_info['structure']
+                       if self.types[attr['name']] not in ("INT", "FLOAT")}
+        self.columns = [name for name in table_info['attributes'] if name not in self.primary_keys]
+        self.kinds = [self.types[name] if self.types[name] in ("INT", "FLOAT") else "TEXT" for name in self.columns]
+        self.positions = {name: position for position, name in enumerate(self.columns)}
+        self.bitmap_size = (len(self.columns) + 7) // 8
+
+    def typed(self, column, value):
+        # Cast a raw value for storage; a value that does not fit the column type is an error
+        if value is None or value == '':
+            return None
+        kind = self.types.get(column)
+        try:
+            if kind == "INT":
+                return int(value)
+            if kind == "FLOAT":
+                return float(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"Value '{value}' is not a valid {kind} for column {column}.")
+        value = str(value)
+        width = self.widths.get(column)
+        if width is not None and len(value.encode('utf-8')) > width:
+            raise ValueError(f"Value for column {column} is longer than {width} bytes.")
+        return value
+
+    def encode(self, values):
+        bitmap = bytearray(self.bitmap_size)
+        parts = [bytes((CODEC_VERSION,)), None]
+        for position, (column, kind) in enumerate(zip(self.columns, self.kinds)):
+            value = self.typed(column, values.get(column))
+            if value is None:
+                bitmap[position >> 3] |= 1 << (position & 7)
+            elif kind == "INT":
+                try:
+                    parts.append(_INT.pack(value))
+                except struct.error:
+                    raise ValueError(f"Value '{value}' is out of range for INT column {column}.")
+            elif kind == "FLOAT":
+                parts.append(_FLOAT.pack(value))
+            else:
+                encoded = value.encode('utf-8')
+                if len(encoded) > 0xFFFF:
+                    raise ValueError(f"Value for column {column} is longer than 65535 bytes.")
+                parts.append(_LENGTH.pack(len(encoded)))
+                parts.append(encoded)
+        parts[1] = bytes(bitmap)
+        return b"".join(parts)
+
+    def decode(self, data, columns=None):
+        """Decode the non-key columns; with columns given, the others are skipped, not decoded."""
+        data = bytes(data)
+        if data[0] != CODEC_VERSION:
+            raise ValueError(f"Unsupported row format version {data[0]}.")
+        wanted = None if columns is None else {self.positions[c] for c in columns if c in self.positions}
+        last = len(self.columns) - 1 if wanted is None else max(wanted, default=-1)
+
+        row = {}
+        offset = 1 + self.bitmap_size
+        for position in range(last + 1):
+            kind = self.kinds[position]
+            take = wanted is None or position in wanted
+            if data[1 + (position >> 3)] & (1 << (position & 7)):
+                if take:
+                    row[self.columns[position]] = None
+                continue
+            if kind == "INT":
+                if take:
+                    row[self.columns[position]] = _INT.unpack_from(data, offset)[0]
+                offset += 8
+            elif kind == "FLOAT":
+                if take:
+                    row[self.columns[position]] = _FLOAT.unpack_from(data, offset)[0]
+                offset += 8
+            else:
+                (length,) = _LENGTH.unpack_from(data, offset)
+                offset += 2
+                if take:
+                    row[self.columns[position]] = data[offset:offset + length].decode('utf-8')
+                offset += length
+        return row
+
+
+def codec_for(table_info):
+    # Built once per catalog version of the table and kept on its table_info
+    codec = table_info.get('codec')
+    if codec is None:
+        codec = RowCodec(table_info)
+        table_info['codec'] = codec
+    return codec
+
+
+def literal_value(value, attr_type):
+    """Cast a query literal for comparison with a column. Unlike cast_value, any number
+    is kept as one on an INT column (15.5 stays 15.5) so comparisons stay numeric."""
+    typed = cast_value(value, attr_type)
+    if isinstance(typed, str) and (attr_type or '').upper() == "INT":
+        try:
+            number = float(typed)
+        except ValueError:
+            return typed
+        if not math.isfinite(number):
+            return typed
+        typed = int(number) if number.is_integer() else number
+    return typed
+
+
+def key_text(value, attr_type):
+    """The text a primary key value is stored under: that of the typed value, so '01',
+    ' 1' and 1 are the same INT key ('' for a missing value)."""
+    typed = literal_value(value, attr_type)
+    return '' if typed is None else str(typed)
+
+
+def make_key(values, table_info):
+    """The _id of the row whose primary key columns have these values."""
+    codec = codec_for(table_info)
+    return '#'.join(key_text(values.get(pk), codec.types.get(pk)) for pk in codec.primary_keys)
+
+
+def build_document(values, table_info):
+    """Build the stored document for one row; returns (document, error)."""
+    primary_keys = table_info['primary_keys']
+    codec = codec_for(table_info)
+
+    # Separate primary key
+    primary_key_values = [values[pk] for pk in primary_keys if pk in values and values[pk] not in (None, '')]
+    if len(primary_key_values) != len(primary_keys):
+        return None, f"Error: Missing primary key value(s) for table '{table_info['name']}'."
+
+    try:
+        key_parts = []
+        for pk, value in zip(primary_keys, primary_key_values):
+            part = str(codec.typed(pk, value))
+            if '#' in part:
+                raise ValueError(f"Primary key value '{part}' for column {pk} may not contain '#'.")
+            key_parts.append(part)
+        row = codec.encode(values)
+    except ValueError as e:
+        return None, f"Error: {e}"
+
+    # composite key, from the typed values so equal keys are always stored the same way
+    return {"_id": '#'.join(key_parts), "row": row}, None
+
+
+def decode_row(document, table_info, columns=None):
+    """Turn a stored document into {column: typed value}, optionally only for some columns."""
+    codec = codec_for(table_info)
+    primary_keys = table_info['primary_keys']
+    key_parts = str(document["_id"]).split('#')
+
+    row = {}
+    for i, pk in enumerate(primary_keys):
+        if columns is None or pk in columns:
+            row[pk] = cast_value(key_parts[i] if i < len(key_parts) else '', codec.types.get(pk))
+
+    if "row" in document:
+        row.update(codec.decode(document["row"], columns))
+    else:
+        # Legacy '#'-joined value string
+        value = document.get("value", "")
+        value_parts = value.split('#') if value != "" else []
+        for i, attr in enumerate(codec.columns):
+            if columns is None or attr in columns:
+                row[attr] = cast_value(value_parts[i] if i < len(value_parts) else '', codec.types.get(attr))
+    return row
+
+
+def text_record(document, table_info):
+    """The {key, value} form of a document written to the JSON mirror files."""
+    if "row" not in document:
+        return {"key": document["_id"], "value": document.get("value", "")}
+    row = codec_for(table_info).decode(document["row"])
+    values = ['' if row.get(attr) is None else str(row[attr]) for attr in codec_for(table_info).columns]
+    return {"key": document["_id"], "value": '#'.join(values)}
@@ -0,0 +1,112 @@
+# row_cache.py
+# Primary-key row cache for the MongoDB engine. Each (database, table) keeps an LRU of
+# recently read or written documents, and of keys known to have no row, so duplicate
+# checks and point lookups on hot keys need no round trip. Every write goes through
+# the table's store, which keeps the cache exact: inserted documents are added,
+# deleted keys are remembered as absent, and dropping a table or database forgets
+# its cache. Like the table locks, this assumes the server is the only writer.
+import os
+import threading
+from collections import OrderedDict
+
+import metrics
+
+# Memory per table, estimated from key and row sizes (0 disables the cache)
+ROW_CACHE_BYTES = int(os.environ.get("DBMS_ROW_CACHE_BYTES", str(16 << 20)))
+ENTRY_OVERHEAD = 160  # rough bytes an entry costs beyond its key and row
+# Lookups and writes of more keys than this (bulk loads) are not cached, so they
+# do not push the hot rows out; a group commit batch still fits
+ROW_CACHE_MAX_BATCH = int(os.environ.get("DBMS_ROW_CACHE_MAX_BATCH", "1000"))
+
+ABSENT = "absent"    # the key has no row
+PRESENT = "present"  # the key has a row that was not fetched (duplicate checks only read keys)
+
+_caches = {}  # (db_name, table_name) -> RowCache
+_caches_lock = threading.Lock()
+
+
+def _size(key, entry):
+    if isinstance(entry, dict):
+        return ENTRY_OVERHEAD + len(str(key)) + len(entry.get("row") or entry.get("value") or "")
+    return ENTRY_OVERHEAD + len(str(key))
+
+
+class RowCache:
+    """LRU of key -> document, PRESENT or ABSENT, bounded by an estimate of its memory use."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, keys, need_document):
+        """({key: cached entry}, keys the backend has to answer); counts hits and misses."""
+        found = {}
+        missing = []
+        with self.lock:
+            for key in keys:
+                entry = self.entries.get(key)
+                if entry is None or (need_document and entry is PRESENT):
+                    missing.append(key)
+                    continue
+                self.entries.move_to_end(key)
+                found[key] = entry
+        negative = sum(1 for entry in found.values() if entry is ABSENT)
+        if found:
+            metrics.increment("row cache hits", len(found))
+        if negative:
+            metrics.increment("row cache hits (absent keys)", negative)
+        if missing:
+            metrics.increment("row cache misses", len(missing))
+        return found, missing
+
+    def put(self, key, entry):
+        size = _size(key, entry)
+        evicted = 0
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= _size(key, old)
+            if size > self.limit:
+                return
+            self.entries[key] = entry
+            self.size += size
+            while self.size > self.limit:
+                old_key, old = self.entries.popitem(last=False)
+                self.size -= _size(old_key, old)
+                evicted += 1
+        if evicted:
+            metrics.increment("row cache evictions", evicted)
+
+    def discard(self, key):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= _size(key, old)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+
+def table_cache(db_name, table_name):
+    """The table's cache, or None when caching is disabled."""
+    if ROW_CACHE_BYTES <= 0:
+        return None
+    key = (db_name, table_name)
+    cache = _caches.get(key)
+    if cache is None:
+        with _caches_lock:
+            cache = _caches.get(key)
+            if cache is None:
+                cache = _caches[key] = RowCache(ROW_CACHE_BYTES)
+    return cache
+
+
+def forget(db_name, table_name=None):
+    """Drop the cache of a table, or of every table of a database."""
+    with _caches_lock:
+        for key in [key for key in _caches if key[0] == db_name and table_name in (None, key[1])]:
+            _caches.pop(key).clear()
@@ -1,156 +1,357 @@
 # server_commands.py
+import logging
 
 from db_operations import (
     create_database, insert_record, delete_record, list_tables, drop_database, 
-    create_table, drop_table, extract_column_definitions, create_index, 
-    list_databases, parse_column_definitions_manually
-    #, convert_type
+    create_table, drop_table, create_index, list_databases, insert_records
 )
+from query_engine import select_records, explain_select
+from db_catalog import list_table_names, get_table
+import foreign_keys
+import group_commit
+from bulk_loader import load_file
+from table_export import export_table
+from table_stats import analyze_table
+from cursors import open_cursor, fetch_cursor, close_cursor, cursor_tables
+from session import Session
+from transaction import Transaction
+import lock_manager
+from lock_manager import SHARED, EXCLUSIVE
+import metrics
+from record_codec import make_key
+import wal
+from sql_parser import (
+    parse_statement, ShowDatabases, ShowTables, ShowStats, UseDatabase, CreateDatabase,
+    DropDatabase, CreateTable, DropTable, CreateIndex, Insert, Delete, Select, Explain,
+    SetOption, Begin, Commit, Rollback, LoadData, ExportTable, OpenCursor, FetchCursor, CloseCursor,
+    AnalyzeTable, conjuncts
+)
+
+log = logging.getLogger("dbms.commands")
+
+# Used when process_command is called without a session (e.g. from scripts)
+default_session = Session()
+
+NO_DATABASE = "No database selected. Use 'USE <database_name>' to select a database."
+NO_TRANSACTION = "Error: No transaction in progress."
+
+# Catalog changes and bulk loads bypass the write set and cannot be undone by ROLLBACK,
+# so they are refused inside a transaction
+_NOT_IN_TRANSACTION = (CreateDatabase, DropDatabase, CreateTable, DropTable, CreateIndex, LoadData)
 
-current_database = None
+# Statements that write to the log; they are answered once their records are on disk.
+# CREATE INDEX is not logged: the catalog save that completes it is already synced
+_LOGGED = (Insert, Delete, Commit, CreateDatabase, DropDatabase, CreateTable, DropTable)
 
-def process_command(command):
-    global current_database
-    tokens = command.strip().split()
-    
-    if not tokens:
+def process_command(command, session=None):
+    if session is None:
+        session = default_session
+    if not command.strip():
         return "Invalid command."
 
-    cmd = tokens[0].upper()
+    started = metrics.begin_command()
+    command_type = "INVALID"
+    response = None
+    try:
+        try:
+            with metrics.phase("parse"):
+                statement = parse_statement(command)
+        except ValueError as e:
+            response = f"Error: {e}"
+            return response
+        command_type = statement.command
+
+        try:
+            db_name, shared_tables, exclusive_tables, catalog = statement_lock_set(statement, session)
+            logged = isinstance(statement, _LOGGED) and (session.transaction is None or isinstance(statement, Commit))
+            with lock_manager.statement_locks(db_name, shared_tables, exclusive_tables, catalog):
+                response = execute_command(statement, session)
+        except Exception as e:
+            # Only this statement fails; the rest of a pipelined batch and the connection go on
+            log.exception("Error executing %s", command)
+            response = f"Error: {e}"
+            return response
+        # Synced after the locks are released, so other sessions' writes can share the fsync
+        if logged:
+            try:
+                wal.sync()
+            except OSError as e:
+                response = f"Error: The write could not be made durable: {e}"
+        return response
+    finally:
+        failed = response is None or response.startswith("Error")
+        metrics.end_command(started, command_type, command, failed)
+
+def statement_lock_set(statement, session):
+    """Work out which locks a statement needs: (db_name, shared tables, exclusive tables, catalog mode)."""
+    db_name = session.current_database
+
+    if isinstance(statement, (ShowDatabases, ShowTables)):
+        return db_name, (), (), SHARED
+    if isinstance(statement, ShowStats):
+        return db_name, (), (), None
+    if isinstance(statement, CreateDatabase):
+        return statement.database, (), (), EXCLUSIVE
+    if isinstance(statement, DropDatabase):
+        # Dropping a database touches every one of its tables
+        return statement.database, (), list_table_names(statement.database), EXCLUSIVE
+    if isinstance(statement, (CreateTable, DropTable, CreateIndex)):
+        return db_name, (), [statement.table], EXCLUSIVE
+    if isinstance(statement, (Insert, Delete)) and session.transaction is not None:
+        # Only buffered until COMMIT
+        return db_name, (), (), None
+    if isinstance(statement, Commit) and session.transaction is not None:
+        shared_tables, exclusive_tables = session.transaction.lock_tables()
+        return session.transaction.db_name, shared_tables, exclusive_tables, None
+    if isinstance(statement, (Insert, Delete)) and group_commit.GROUP_COMMIT:
+        # The batch that carries the write takes the table locks when it is flushed
+        return db_name, (), (), None
+    if isinstance(statement, LoadData):
+        # The whole load runs under one exclusive table lock, like a large INSERT
+        table_info = get_table(db_name, statement.table) if db_name else None
+        related = foreign_keys.referenced_tables(table_info) if table_info is not None else ()
+        return db_name, related, [statement.table], None
+    if isinstance(statement, (Insert, Delete)):
+        # Foreign key checks read the parent (insert) or child (delete) tables; taking those
+        # locks up front, in the same sorted order as everything else, avoids deadlocks
+        table_info = get_table(db_name, statement.table) if db_name else None
+        if table_info is None:
+            return db_name, (), [statement.table], None
+        if isinstance(statement, Insert):
+            related = foreign_keys.referenced_tables(table_info)
+        else:
+            related = foreign_keys.referencing_tables(db_name, statement.table)
+        return db_name, related, [statement.table], None
+    if isinstance(statement, Select):
+        return db_name, statement.tables(), (), None
+    if isinstance(statement, ExportTable):
+        return db_name, [statement.table], (), None
+    if isinstance(statement, AnalyzeTable):
+        # Only the Statistics of this table change, so other statements may keep reading the catalog
+        return db_name, [statement.table], (), SHARED
+    if isinstance(statement, OpenCursor):
+        return db_name, statement.select.tables(), (), None
+    if isinstance(statement, FetchCursor):
+        # Rows are read from the backend by FETCH, under the same locks a SELECT takes
+        cursor_db, tables = cursor_tables(session, statement.name)
+        return cursor_db, tables, (), None
+    if isinstance(statement, Explain):
+        return db_name, statement.statement.tables(), (), None
+    if isinstance(statement, SetOption) and session.deferred_foreign_keys is not None:
+        return db_name, session.deferred_foreign_keys.tables(db_name), (), None
+    return db_name, (), (), None
+
+def execute_command(statement, session):
+    if session.transaction is not None and isinstance(statement, _NOT_IN_TRANSACTION):
+        return f"Error: {statement.command} is not allowed inside a transaction. COMMIT or ROLLBACK first."
 
     # Show databases
-    if cmd == "SHOW" and len(tokens) > 1 and tokens[1].upper() == "DATABASES":
+    if isinstance(statement, ShowDatabases):
         return list_databases()
 
+    # Command counters and latencies
+    elif isinstance(statement, ShowStats):
+        return metrics.format_stats()
+
     # Use database
-    elif cmd == "USE" and len(tokens) > 1:
-        current_database = tokens[1]  # Set the current active database
-        return f"Switched to database {tokens[1]}."
+    elif isinstance(statement, UseDatabase):
+        if session.transaction is not None and statement.database != session.transaction.db_name:
+            return "Error: Cannot switch databases inside a transaction. COMMIT or ROLLBACK first."
+        session.current_database = statement.database  # Set the current active database for this session only
+        return f"Switched to database {statement.database}."
 
     # Show tables
-    elif cmd == "SHOW" and len(tokens) > 1 and tokens[1].upper() == "TABLES":
-        if current_database:
-            return list_tables(current_database)
+    elif isinstance(statement, ShowTables):
+        if session.current_database:
+            return list_tables(session.current_database)
         else:
-            return "No database selected. Use 'USE <database_name>' to select a database."
+            return NO_DATABASE
 
     # Create database
-    elif cmd == "CREATE" and len(tokens) > 2 and tokens[1].upper() == "DATABASE":
-        return create_database(tokens[2])
+    elif isinstance(statement, CreateDatabase):
+        return create_database(statement.database)
 
     # Drop database
-    elif cmd == "DROP" and len(tokens) > 2 and tokens[1].upper() == "DATABASE":
-        return drop_database(tokens[2])
+    elif isinstance(statement, DropDatabase):
+        return drop_database(statement.database)
 
     # Create table
-    elif cmd == "CREATE" and len(tokens) > 3 and tokens[1].upper() == "TABLE":
-        if current_database:
-            table_name = tokens[2]  # Expecting table name
-            # Get the column definitions from the command
-            if "(" in command and ")" in command:
-                col_defs = extract_column_definitions(command) 
-                columns, primary_key, foreign_key = parse_column_definitions_manually(col_defs)
-
-                # Print columns just before table creation
-                print("Final Columns for Creation:", columns)
-
-            # Verify if foreign keys exist in the defined columns
-                defined_columns = {col['name'] for col in columns}  # Create a set of column names
-                for fk in foreign_key:
-                    if fk['fk_col'] not in defined_columns:
-                        return f"Can't assign nonexistent field '{fk['fk_col']}' as foreign key."
-                    
-           # Check if all primary keys exist in the columns
-            for pk in primary_key:
-                if not any(col['name'] == pk for col in columns):
-                    return f"Error: Primary key '{pk}' does not exist in column definitions."
-                
-             # For composite keys, we need to check if all parts exist
-            if isinstance(primary_key, list):
-                for pk in primary_key:
-                    if not any(col['name'] == pk for col in columns):
-                        return f"Error: Primary key '{pk}' does not exist in column definitions."
-                       
-                return create_table(current_database, table_name, columns, primary_key, foreign_key)
-            else:
-                return "Invalid syntax for column definitions."
-        else:
-            return "No database selected. Use 'USE <database_name>' to select a database."
+    elif isinstance(statement, CreateTable):
+        if not session.current_database:
+            return NO_DATABASE
+        columns = statement.columns
+        if not columns:
+            return "Invalid syntax for column definitions."
+
+        # Verify if foreign keys exist in the defined columns
+        defined_columns = {col['name'] for col in columns}
+        for fk in statement.foreign_keys:
+            if fk['fk_col'] not in defined_columns:
+                return f"Can't assign nonexistent field '{fk['fk_col']}' as foreign key."
+
+        # Check if all primary keys (one or several for a composite key) exist in the columns
+        for pk in statement.primary_key:
+            if pk not in defined_columns:
+                return f"Error: Primary key '{pk}' does not exist in column definitions."
+
+        return create_table(session.current_database, statement.table, columns, statement.primary_key, statement.foreign_keys)
 
     # Drop table
-    elif cmd == "DROP" and len(tokens) > 2 and tokens[1].upper() == "TABLE":
-        if current_database:
-            return drop_table(current_database, tokens[2])
+    elif isinstance(statement, DropTable):
+        if session.current_database:
+            return drop_table(session.current_database, statement.table)
         else:
-            return "No database selected. Use 'USE <database_name>' to select a database."
+            return NO_DATABASE
 
     # Create index
-    elif cmd == "CREATE" and len(tokens) > 5 and tokens[1].upper() == "INDEX" and tokens[3].upper() == "ON":
-        if current_database:
-            index_name = tokens[2]  # Index name
-            table_name = tokens[4]  # Table name
+    elif isinstance(statement, CreateIndex):
+        if not session.current_database:
+            return NO_DATABASE
+        return create_index(session.current_database, statement.table, statement.name, statement.columns,
+                            int(statement.unique), include=statement.include)
 
-            try:
-                column_part = command[command.index("(")+1:command.index(")")]
-                column_name = column_part.strip() 
+    # Insert one or more rows
+    elif isinstance(statement, Insert):
+        rows = []
+        for value_items in statement.rows:
+            if len(value_items) != len(statement.columns):
+                return "Error: Number of values does not match number of columns."
+            rows.append(dict(zip(statement.columns, value_items)))
 
-            except ValueError:
-                return "Invalid syntax. Make sure the column name is inside parentheses."
+        if session.transaction is not None:
+            return session.transaction.insert(statement.table, rows)
+        if group_commit.GROUP_COMMIT and session.current_database:
+            return group_commit.insert(session.current_database, statement.table, rows, session.deferred_foreign_keys)
+        if len(rows) == 1:
+            return insert_record(statement.table, rows[0], session.current_database, session.deferred_foreign_keys)
+        return insert_records(statement.table, rows, session.current_database, session.deferred_foreign_keys)
 
-            if not column_name:
-                return "Invalid column name syntax. Make sure it's in parentheses."
+    # Delete by primary key
+    elif isinstance(statement, Delete):
+        primary_key_value, error = delete_key(statement, session.current_database)
+        if error:
+            return error
+        if session.transaction is not None:
+            return session.transaction.delete(statement.table, primary_key_value)
+        if group_commit.GROUP_COMMIT and session.current_database:
+            return group_commit.delete(session.current_database, statement.table, primary_key_value)
+        return delete_record(statement.table, primary_key_value, session.current_database)
 
-            # Check for UNIQUE keyword
-            is_unique = 1 if "UNIQUE" in tokens else 0
+    # Bulk load from a CSV or JSON file on the server
+    elif isinstance(statement, LoadData):
+        return load_file(session.current_database, statement.table, statement.path,
+                         statement.file_format, deferred=session.deferred_foreign_keys)
 
-            # Call the function to create the index
-            return create_index(current_database, table_name, index_name, column_name, is_unique)
-        else:
-            return "No database selected. Use 'USE <database_name>' to select a database."
-
-    if cmd == "INSERT" and len(tokens) > 2 and tokens[1].upper() == "INTO":
-        table_name = tokens[2]
-        
-        # Extract values after "VALUES" keyword
-        if "VALUES" in command.upper():
-            values_part = command.upper().split("VALUES")[1].strip()
-            values_part = values_part[1:-1]  # Remove surrounding parentheses
-            value_items = values_part.split(",")
-            columns, values = {}, {}
-
-            # Extract column names from the table
-            table_columns = command[command.index("(") + 1:command.index(")")].split(",")
-            for i, col in enumerate(table_columns):
-                col_name = col.strip()
-                values[col_name] = value_items[i].strip().strip("'\"")  # Remove quotes
-
-            return insert_record(table_name, values, current_database)
-
-
-    # Inside the `process_command` function:
-    elif cmd == "DELETE" and len(tokens) > 2 and tokens[1].upper() == "FROM":
-        collection_name = tokens[2]
-        primary_key_value = None
-
-        # Check if a WHERE clause exists
-        if "WHERE" in command.upper():
-            where_part = command.split("WHERE")[1].strip()
-            condition_items = where_part.split("AND")
-
-            # Assuming only primary key condition is allowed
-            if len(condition_items) == 1:
-                col, val = condition_items[0].split("=")
-                col = col.strip()
-                primary_key_value = val.strip().strip("'\"")  # Strip quotes from the value
-
-                # Check if column is the primary key
-                if col.lower() != "key":
-                    return "Error: Only primary key deletion is allowed."
-            else:
-                return "Error: Multiple conditions not allowed. Use only the primary key in WHERE."
-
-        # Execute the delete command
-        if primary_key_value is not None:
-            return delete_record(collection_name, primary_key_value, current_database)
-        else:
-            return "Error: Invalid DELETE syntax. Specify a primary key in WHERE clause."
+    # Select rows, optionally filtered by a WHERE clause
+    elif isinstance(statement, Select):
+        return select_records(session.current_database, statement, session.transaction)
+
+    # Server-side cursors: OPEN runs the query, FETCH returns its rows a batch at a time
+    elif isinstance(statement, OpenCursor):
+        return open_cursor(session, statement.name, statement.select)
+
+    elif isinstance(statement, FetchCursor):
+        return fetch_cursor(session, statement.name, statement.count)
+
+    elif isinstance(statement, CloseCursor):
+        return close_cursor(session, statement.name)
+
+    # Collect planner statistics into the catalog
+    elif isinstance(statement, AnalyzeTable):
+        return analyze_table(session.current_database, statement.table)
+
+    # Stream a whole table to a file on the server
+    elif isinstance(statement, ExportTable):
+        return export_table(session.current_database, statement.table, statement.path, statement.file_format)
+
+    # Show the access path the planner picks for a SELECT
+    elif isinstance(statement, Explain):
+        return explain_select(session.current_database, statement.statement)
+
+    # Session settings
+    elif isinstance(statement, SetOption):
+        return set_option(statement, session)
+
+    # Transactions: writes are buffered in the session until COMMIT
+    elif isinstance(statement, Begin):
+        if session.transaction is not None:
+            return "Error: A transaction is already in progress."
+        if not session.current_database:
+            return NO_DATABASE
+        session.transaction = Transaction(session.current_database)
+        return f"Transaction started in database {session.current_database}."
+
+    elif isinstance(statement, Commit):
+        if session.transaction is None:
+            return NO_TRANSACTION
+        # Committed or rolled back, the transaction is over either way
+        transaction, session.transaction = session.transaction, None
+        return transaction.commit(session.deferred_foreign_keys)
+
+    elif isinstance(statement, Rollback):
+        if session.transaction is None:
+            return NO_TRANSACTION
+        transaction, session.transaction = session.transaction, None
+        return f"Transaction rolled back; {len(transaction.writes)} buffered statement(s) discarded."
+
+    return "Invalid command."
+
+def set_option(statement, session):
+    name = statement.name.lower()
+    value = str(statement.value).upper()
+    if name == "foreign_key_checks":
+        # DEFERRED collects inserted rows and checks them all when switched back to IMMEDIATE
+        if value == foreign_keys.DEFERRED:
+            if session.deferred_foreign_keys is None:
+                session.deferred_foreign_keys = foreign_keys.DeferredChecks()
+            session.settings[name] = foreign_keys.DEFERRED
+            return "Foreign key checks deferred until SET foreign_key_checks = IMMEDIATE."
+        if value in (foreign_keys.IMMEDIATE, "ON", "1"):
+            deferred, session.deferred_foreign_keys = session.deferred_foreign_keys, None
+            session.settings[name] = foreign_keys.IMMEDIATE
+            violations = deferred.verify() if deferred is not None else []
+            if violations:
+                return "\n".join([f"Error: {len(violations)} deferred foreign key violation(s):"] + violations)
+            return "Foreign key checks are immediate."
+        return f"Error: foreign_key_checks must be IMMEDIATE or DEFERRED, not '{statement.value}'."
+    if name == "slow_query_ms":
+        # Server-wide: commands at least this slow go to the slow-query log; OFF disables it
+        if value == "OFF":
+            metrics.set_slow_query_threshold(None)
+            return "Slow-query log disabled."
+        try:
+            threshold = float(statement.value)
+        except ValueError:
+            return f"Error: slow_query_ms must be a number of milliseconds or OFF, not '{statement.value}'."
+        metrics.set_slow_query_threshold(threshold)
+        return f"Slow-query threshold set to {threshold:g} ms."
+    return f"Error: Unknown setting '{statement.name}'."
+
+def delete_key(statement, db_name):
+    """The _id a DELETE targets: WHERE key = v, or an equality on every primary key column."""
+    if statement.where is None:
+        return None, "Error: Invalid DELETE syntax. Specify a primary key in WHERE clause."
+
+    equalities = {}
+    for predicate in conjuncts(statement.where):
+        if predicate[0] != 'cmp' or predicate[2] != "=" or predicate[1] in equalities:
+            return None, "Error: Only primary key deletion is allowed."
+        equalities[predicate[1]] = predicate[3]
+
+    if not db_name:
+        return None, NO_DATABASE
+    table_info = get_table(db_name, statement.table)
+    if table_info is None:
+        return None, f"Table '{statement.table}' or database '{db_name}' does not exist in the catalog."
+
+    if len(equalities) == 1 and next(iter(equalities)).lower() == "key":
+        # The stored form of each part, as for an equality on the primary key columns
+        value = next(iter(equalities.values()))
+        parts = str(value).split('#') if value is not None else [None]
+        if len(parts) != len(table_info['primary_keys']):
+            return str(value), None
+        return make_key(dict(zip(table_info['primary_keys'], parts)), table_info), None
+
+    if set(equalities) != set(table_info['primary_keys']):
+        return None, "Error: Only primary key deletion is allowed."
+    return make_key(equalities, table_info), None
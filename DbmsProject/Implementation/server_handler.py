@@ -1,22 +1,77 @@
 # server_handler.py
-import socket
+import asyncio
+import logging
 from server_commands import process_command
+from protocol import read_message, write_message, encode_message
+from session import Session
 
-def handle_client(conn, addr):
-    print(f"Connection from {addr} has been established.")
-    conn.sendall("Welcome to the Mini DBMS server!".encode('utf-8'))
-    
-    while True:
+# Commands a client may have in flight before the server stops reading from its socket
+PIPELINE_DEPTH = 256
+# Buffered response bytes after which the server waits for the client to catch up
+WRITE_BUFFER_LIMIT = 1024 * 1024
+
+log = logging.getLogger("dbms.server")
+
+def run_commands(commands, session):
+    # Pipelined commands run in order in one executor call
+    responses = []
+    for command in commands:
+        response = process_command(command, session)
+        responses.append(response if response is not None else "Invalid command.")
+    return responses
+
+async def handle_client(reader, writer, executor):
+    addr = writer.get_extra_info("peername")
+    log.info("Connection from %s has been established.", addr)
+    loop = asyncio.get_running_loop()
+    session = Session(addr)  # USE and other settings only affect this connection
+    pending = asyncio.Queue(maxsize=PIPELINE_DEPTH)
+
+    async def read_commands():
+        # Keep reading while earlier commands run; None marks the end of the stream
         try:
-            command = conn.recv(1024).decode('utf-8')
-            if not command:
+            while True:
+                message = await read_message(reader)
+                await pending.put(message)
+                if message is None:
+                    return
+        except (ConnectionError, ValueError) as e:
+            log.warning("Connection from %s: %s", addr, e)
+            await pending.put(None)
+
+    reader_task = asyncio.create_task(read_commands())
+    try:
+        await write_message(writer, "Welcome to the Mini DBMS server!")
+        closed = False
+        while not closed:
+            batch = [await pending.get()]
+            while not pending.empty():
+                batch.append(pending.get_nowait())
+            if None in batch:
+                closed = True
+                batch = batch[:batch.index(None)]
+            if not batch:
                 break
-            print(f"Received command: {command}")
-            response = process_command(command)
-            conn.sendall(response.encode('utf-8'))
-        except Exception as e:
-            print(f"Error: {e}")
-            break
-    
-    conn.close()
-    print(f"Connection from {addr} has been closed.")
+
+            if log.isEnabledFor(logging.DEBUG):
+                for tag, command in batch:
+                    log.debug("Received command from %s: %s", addr, command)
+            # Database work blocks, so it runs on the executor instead of the event loop
+            responses = await loop.run_in_executor(executor, run_commands, [command for _, command in batch], session)
+            for (tag, _), response in zip(batch, responses):
+                writer.write(encode_message(response, tag))
+            # Flush once per batch, or earlier if the client is not reading its responses
+            if pending.empty() or writer.transport.get_write_buffer_size() > WRITE_BUFFER_LIMIT:
+                await writer.drain()
+        await writer.drain()
+    except (ConnectionError, ValueError) as e:
+        log.warning("Connection from %s: %s", addr, e)
+    finally:
+        reader_task.cancel()
+        session.close()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+    log.info("Connection from %s has been closed.", addr)
@@ -0,0 +1,19 @@
+# session.py
+
+class Session:
+    """Per-connection state: the database selected with USE and other settings."""
+
+    def __init__(self, addr=None):
+        self.addr = addr
+        self.current_database = None
+        self.settings = {}
+        self.deferred_foreign_keys = None  # DeferredChecks while SET foreign_key_checks = DEFERRED
+        self.transaction = None  # Transaction between BEGIN and COMMIT/ROLLBACK
+        self.cursors = {}  # name -> Cursor opened with OPEN
+
+    def close(self):
+        # The connection is gone: release open cursors and drop any unfinished transaction
+        for cursor in self.cursors.values():
+            cursor.close()
+        self.cursors.clear()
+        self.transaction = None
@@ -0,0 +1,718 @@
+# sql_parser.py
+import re
+import threading
+from collections import OrderedDict
+
+# Parsed DML templates kept in memory, keyed on the command text with its literals taken out
+STATEMENT_CACHE_SIZE = 512
+
+# Quoted strings and numbers; each one becomes a "?" placeholder in the normalized text
+_LITERAL_PATTERN = re.compile(r"""
+    '(?:[^']|'')*'
+  | "(?:[^"]|"")*"
+  | (?<![A-Za-z0-9_.])-?\d+(?:\.\d+)?(?![A-Za-z0-9_.])
+""", re.VERBOSE)
+
+_TOKEN_PATTERN = re.compile(r"""
+    \s*(?:
+        (?P<param>\?)
+      | (?P<operator><=|>=|<>|!=|=|<|>)
+      | (?P<punct>[(),*;])
+      | (?P<word>[A-Za-z_][A-Za-z0-9_.]*)
+    )""", re.VERBOSE)
+
+
+class Param:
+    """Placeholder for the n-th literal of a command inside a cached template."""
+
+    __slots__ = ("position",)
+
+    def __init__(self, position):
+        self.position = position
+
+    def __repr__(self):
+        return f"?{self.position}"
+
+
+def _bind(value, literals):
+    if isinstance(value, Param):
+        return literals[value.position]
+    if isinstance(value, list):
+        return [_bind(item, literals) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_bind(item, literals) for item in value)
+    if isinstance(value, Statement):
+        bound = value.__class__.__new__(value.__class__)
+        bound.__dict__ = {name: _bind(item, literals) for name, item in value.__dict__.items()}
+        return bound
+    return value
+
+
+class Statement:
+    command = None  # the command type reported by SHOW STATS
+
+    def bind(self, literals):
+        """Copy of this statement with every Param replaced by its literal."""
+        return _bind(self, literals)
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={value!r}" for name, value in self.__dict__.items())
+        return f"{self.__class__.__name__}({fields})"
+
+
+class ShowDatabases(Statement):
+    command = "SHOW DATABASES"
+
+
+class ShowTables(Statement):
+    command = "SHOW TABLES"
+
+
+class ShowStats(Statement):
+    command = "SHOW STATS"
+
+
+class UseDatabase(Statement):
+    command = "USE"
+
+    def __init__(self, database):
+        self.database = database
+
+
+class CreateDatabase(Statement):
+    command = "CREATE DATABASE"
+
+    def __init__(self, database):
+        self.database = database
+
+
+class DropDatabase(Statement):
+    command = "DROP DATABASE"
+
+    def __init__(self, database):
+        self.database = database
+
+
+class CreateTable(Statement):
+    command = "CREATE TABLE"
+
+    def __init__(self, table, columns, primary_key, foreign_keys):
+        self.table = table
+        self.columns = columns            # [{name, type, length, isnull}]
+        self.primary_key = primary_key    # [column]
+        self.foreign_keys = foreign_keys  # [{fk_col, ref_table, ref_col}]
+
+
+class DropTable(Statement):
+    command = "DROP TABLE"
+
+    def __init__(self, table):
+        self.table = table
+
+
+class CreateIndex(Statement):
+    command = "CREATE INDEX"
+
+    def __init__(self, name, table, columns, unique, include=None):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.unique = unique
+        self.include = include or []
+
+
+class Insert(Statement):
+    command = "INSERT"
+
+    def __init__(self, table, columns, rows):
+        self.table = table
+        self.columns = columns
+        self.rows = rows  # one list of raw values per VALUES tuple
+
+
+class Delete(Statement):
+    command = "DELETE"
+
+    def __init__(self, table, where):
+        self.table = table
+        self.where = where
+
+
+class Join(Statement):
+    command = "JOIN"
+
+    def __init__(self, table, left, right):
+        self.table = table
+        self.left = left
+        self.right = right
+
+
+# Aggregate functions allowed in a select list, written as (function, column or "*")
+AGGREGATES = ("COUNT", "SUM", "AVG", "MIN", "MAX")
+
+
+class Select(Statement):
+    command = "SELECT"
+
+    def __init__(self, columns, table, joins, where, group_by=None, order_by=None, limit=None):
+        self.columns = columns
+        self.table = table
+        self.joins = joins
+        self.where = where
+        self.group_by = group_by or []
+        self.order_by = order_by or []  # [(column or aggregate label, descending)]
+        self.limit = limit  # the LIMIT literal, checked to be a whole number when the query runs
+
+    def tables(self):
+        return [self.table] + [join.table for join in self.joins]
+
+    def is_aggregate(self):
+        return bool(self.group_by) or any(isinstance(column, tuple) for column in self.columns)
+
+
+class SetOption(Statement):
+    command = "SET"
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+
+class Explain(Statement):
+    command = "EXPLAIN"
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+class LoadData(Statement):
+    command = "LOAD DATA"
+
+    def __init__(self, path, table, file_format=None):
+        self.path = path
+        self.table = table
+        self.file_format = file_format
+
+
+class AnalyzeTable(Statement):
+    command = "ANALYZE"
+
+    def __init__(self, table):
+        self.table = table
+
+
+class ExportTable(Statement):
+    command = "EXPORT"
+
+    def __init__(self, table, path, file_format=None):
+        self.table = table
+        self.path = path
+        self.file_format = file_format
+
+
+# Cursor name used when OPEN, FETCH or CLOSE do not name one
+DEFAULT_CURSOR = "default"
+
+
+class OpenCursor(Statement):
+    command = "OPEN"
+
+    def __init__(self, name, select):
+        self.name = name
+        self.select = select
+
+
+class FetchCursor(Statement):
+    command = "FETCH"
+
+    def __init__(self, name, count=None):
+        self.name = name
+        self.count = count
+
+
+class CloseCursor(Statement):
+    command = "CLOSE"
+
+    def __init__(self, name):
+        self.name = name
+
+
+class Begin(Statement):
+    command = "BEGIN"
+
+
+class Commit(Statement):
+    command = "COMMIT"
+
+
+class Rollback(Statement):
+    command = "ROLLBACK"
+
+
+# Only statements that are typically repeated with different values are worth caching
+_CACHEABLE = (Insert, Delete, Select, Explain)
+
+
+def extract_literals(command):
+    """Return (normalized text, literal values) for a command."""
+    literals = []
+
+    def replace(match):
+        text = match.group(0)
+        if text[0] in ("'", '"'):
+            text = text[1:-1].replace(text[0] * 2, text[0])
+        literals.append(text)
+        return "?"
+
+    normalized = _LITERAL_PATTERN.sub(replace, command)
+    return " ".join(normalized.split()), literals
+
+
+def tokenize(text):
+    """Split normalized text into (kind, value) tokens in one pass; literals are ("param", Param)."""
+    tokens = []
+    position = 0
+    params = 0
+    text = text.rstrip()
+    while position < len(text):
+        match = _TOKEN_PATTERN.match(text, position)
+        if not match:
+            raise ValueError(f"Unexpected character '{text[position:].strip()[:1]}' in command.")
+        position = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == "param":
+            value = Param(params)
+            params += 1
+        tokens.append((kind, value))
+    return tokens
+
+
+class _Parser:
+    """Recursive-descent parser over the tokens of one statement."""
+
+    def __init__(self, tokens, literals):
+        self.tokens = tokens
+        self.literals = literals
+        self.position = 0
+
+    # ----- token helpers -----
+
+    def peek(self, offset=0):
+        position = self.position + offset
+        return self.tokens[position] if position < len(self.tokens) else (None, None)
+
+    def at_keyword(self, *keywords, offset=0):
+        kind, value = self.peek(offset)
+        return kind == "word" and value.upper() in keywords
+
+    def accept_keyword(self, keyword):
+        if self.at_keyword(keyword):
+            self.position += 1
+            return True
+        return False
+
+    def expect_keyword(self, keyword):
+        if not self.accept_keyword(keyword):
+            raise ValueError(f"Expected {keyword} but found {self.found()}.")
+
+    def accept(self, kind, value=None):
+        token_kind, token_value = self.peek()
+        if token_kind == kind and (value is None or token_value == value):
+            self.position += 1
+            return True
+        return False
+
+    def expect(self, kind, value=None):
+        if not self.accept(kind, value):
+            raise ValueError(f"Expected '{value or kind}' but found {self.found()}.")
+        return self.tokens[self.position - 1][1]
+
+    def found(self):
+        kind, value = self.peek()
+        if kind is None:
+            return "end of command"
+        if kind == "param":
+            return f"'{self.literals[value.position]}'"
+        return f"'{value}'"
+
+    def identifier(self, what="name"):
+        kind, value = self.peek()
+        if kind != "word":
+            raise ValueError(f"Expected {what} but found {self.found()}.")
+        self.position += 1
+        return value
+
+    def identifier_list(self, what="column name"):
+        self.expect("punct", "(")
+        names = [self.identifier(what)]
+        while self.accept("punct", ","):
+            names.append(self.identifier(what))
+        self.expect("punct", ")")
+        return names
+
+    def value(self):
+        # A literal (kept as a Param so the template can be reused), NULL or a bare word
+        kind, value = self.peek()
+        if kind == "param":
+            self.position += 1
+            return value
+        if kind == "word":
+            self.position += 1
+            return '' if value.upper() == "NULL" else value
+        raise ValueError(f"Expected a value but found {self.found()}.")
+
+    def string(self, what="a quoted string"):
+        # A quoted literal, kept as a Param like value()
+        kind, value = self.peek()
+        if kind != "param":
+            raise ValueError(f"Expected {what} but found {self.found()}.")
+        self.position += 1
+        return value
+
+    def integer(self):
+        kind, value = self.peek()
+        if kind != "param":
+            raise ValueError(f"Expected a number but found {self.found()}.")
+        self.position += 1
+        try:
+            return int(self.literals[value.position])
+        except ValueError:
+            raise ValueError(f"Expected a whole number but found '{self.literals[value.position]}'.")
+
+    def finish(self):
+        self.accept("punct", ";")
+        if self.peek()[0] is not None:
+            raise ValueError(f"Unexpected {self.found()} at end of command.")
+
+    # ----- statements -----
+
+    def statement(self):
+        if self.accept_keyword("SHOW"):
+            if self.accept_keyword("DATABASES"):
+                return ShowDatabases()
+            if self.accept_keyword("STATS"):
+                return ShowStats()
+            self.expect_keyword("TABLES")
+            return ShowTables()
+        if self.accept_keyword("USE"):
+            return UseDatabase(self.identifier("database name"))
+        if self.accept_keyword("CREATE"):
+            return self.create()
+        if self.accept_keyword("DROP"):
+            if self.accept_keyword("DATABASE"):
+                return DropDatabase(self.identifier("database name"))
+            self.expect_keyword("TABLE")
+            return DropTable(self.identifier("table name"))
+        if self.accept_keyword("INSERT"):
+            return self.insert()
+        if self.accept_keyword("DELETE"):
+            return self.delete()
+        if self.at_keyword("SELECT"):
+            return self.select()
+        if self.accept_keyword("EXPLAIN"):
+            return Explain(self.select())
+        if self.accept_keyword("LOAD"):
+            # LOAD DATA FROM 'file' INTO TABLE table [FORMAT CSV|JSON|JSONL]
+            self.expect_keyword("DATA")
+            self.expect_keyword("FROM")
+            path = self.string("a quoted file name")
+            self.expect_keyword("INTO")
+            self.expect_keyword("TABLE")
+            table = self.identifier("table name")
+            file_format = self.identifier("file format").upper() if self.accept_keyword("FORMAT") else None
+            return LoadData(path, table, file_format)
+        if self.accept_keyword("ANALYZE"):
+            # ANALYZE TABLE table
+            self.expect_keyword("TABLE")
+            return AnalyzeTable(self.identifier("table name"))
+        if self.accept_keyword("EXPORT"):
+            # EXPORT TABLE table TO 'file' [FORMAT CSV|JSON|JSONL]
+            self.expect_keyword("TABLE")
+            table = self.identifier("table name")
+            self.expect_keyword("TO")
+            path = self.string("a quoted file name")
+            file_format = self.identifier("file format").upper() if self.accept_keyword("FORMAT") else None
+            return ExportTable(table, path, file_format)
+        if self.accept_keyword("OPEN"):
+            # OPEN [cursor] FOR SELECT ...
+            name = DEFAULT_CURSOR if self.at_keyword("FOR") else self.identifier("cursor name")
+            self.expect_keyword("FOR")
+            return OpenCursor(name, self.select())
+        if self.accept_keyword("FETCH"):
+            # FETCH [count] [FROM cursor]
+            count = self.integer() if self.peek()[0] == "param" else None
+            name = self.identifier("cursor name") if self.accept_keyword("FROM") else DEFAULT_CURSOR
+            return FetchCursor(name, count)
+        if self.accept_keyword("CLOSE"):
+            # CLOSE [cursor]
+            return CloseCursor(self.identifier("cursor name") if self.peek()[0] == "word" else DEFAULT_CURSOR)
+        if self.accept_keyword("BEGIN"):
+            self.accept_keyword("TRANSACTION")
+            return Begin()
+        if self.accept_keyword("START"):
+            self.expect_keyword("TRANSACTION")
+            return Begin()
+        if self.accept_keyword("COMMIT"):
+            return Commit()
+        if self.accept_keyword("ROLLBACK"):
+            return Rollback()
+        if self.accept_keyword("SET"):
+            # SET name = value
+            name = self.identifier("setting name")
+            self.expect("operator", "=")
+            return SetOption(name, self.value())
+        raise ValueError(f"Unknown command {self.found()}.")
+
+    def create(self):
+        if self.accept_keyword("DATABASE"):
+            return CreateDatabase(self.identifier("database name"))
+        if self.accept_keyword("TABLE"):
+            return self.create_table()
+        # CREATE [UNIQUE] INDEX name ON table (columns) [INCLUDE (columns)] [UNIQUE]
+        unique = self.accept_keyword("UNIQUE")
+        self.expect_keyword("INDEX")
+        name = self.identifier("index name")
+        self.expect_keyword("ON")
+        table = self.identifier("table name")
+        columns = self.identifier_list()
+        include = self.identifier_list() if self.accept_keyword("INCLUDE") else []
+        unique = self.accept_keyword("UNIQUE") or unique
+        return CreateIndex(name, table, columns, unique, include)
+
+    def create_table(self):
+        table = self.identifier("table name")
+        columns = []
+        primary_key = []
+        foreign_keys = []
+        self.expect("punct", "(")
+        while True:
+            if self.at_keyword("PRIMARY") and self.at_keyword("KEY", offset=1):
+                self.position += 2
+                primary_key.extend(self.identifier_list())
+            elif self.at_keyword("FOREIGN"):
+                self.position += 1
+                self.expect_keyword("KEY")
+                fk_columns = self.identifier_list()
+                self.expect_keyword("REFERENCES")
+                ref_table = self.identifier("table name")
+                ref_columns = self.identifier_list()
+                if len(fk_columns) != 1 or len(ref_columns) != 1:
+                    raise ValueError("A foreign key must reference exactly one column.")
+                foreign_keys.append({'fk_col': fk_columns[0], 'ref_table': ref_table, 'ref_col': ref_columns[0]})
+            else:
+                columns.append(self.column_definition(primary_key))
+            if not self.accept("punct", ","):
+                break
+        self.expect("punct", ")")
+        return CreateTable(table, columns, primary_key, foreign_keys)
+
+    def column_definition(self, primary_key):
+        # name type[(length)] [PRIMARY [KEY]] [NOT NULL | NULL]
+        name = self.identifier("column name")
+        data_type = self.identifier("column type")
+        length = 0
+        if self.accept("punct", "("):
+            length = self.integer()
+            self.expect("punct", ")")
+        isnull = 0
+        while True:
+            if self.accept_keyword("PRIMARY"):
+                self.accept_keyword("KEY")
+                primary_key.append(name)
+            elif self.accept_keyword("NOT"):
+                self.expect_keyword("NULL")
+                isnull = 0
+            elif self.accept_keyword("NULL"):
+                isnull = 1
+            else:
+                break
+        return {'name': name, 'type': data_type, 'length': length, 'isnull': isnull}
+
+    def insert(self):
+        # INSERT INTO table (columns) VALUES (values)[, (values) ...]
+        self.expect_keyword("INTO")
+        table = self.identifier("table name")
+        columns = self.identifier_list()
+        self.expect_keyword("VALUES")
+        rows = []
+        while True:
+            self.expect("punct", "(")
+            row = [self.value()]
+            while self.accept("punct", ","):
+                row.append(self.value())
+            self.expect("punct", ")")
+            rows.append(row)
+            if not self.accept("punct", ","):
+                break
+        return Insert(table, columns, rows)
+
+    def delete(self):
+        self.expect_keyword("FROM")
+        table = self.identifier("table name")
+        where = self.parse_or() if self.accept_keyword("WHERE") else None
+        return Delete(table, where)
+
+    def select_item(self):
+        # A column name, or an aggregate call such as COUNT(*) or SUM(column) as (function, column)
+        name = self.identifier("column name")
+        if not self.accept("punct", "("):
+            return name
+        function = name.upper()
+        if function not in AGGREGATES:
+            raise ValueError(f"Unknown function {name}; expected one of {', '.join(AGGREGATES)}.")
+        if self.accept("punct", "*"):
+            if function != "COUNT":
+                raise ValueError(f"{function}(*) is not allowed; only COUNT(*) is.")
+            argument = "*"
+        else:
+            argument = self.identifier("column name")
+        self.expect("punct", ")")
+        return (function, argument)
+
+    def select(self):
+        # SELECT cols FROM table [[INNER] JOIN table ON a.x = b.y ...] [WHERE ...] [GROUP BY cols]
+        #   [ORDER BY col [ASC|DESC], ...] [LIMIT n]
+        self.expect_keyword("SELECT")
+        columns = []
+        while True:
+            if self.accept("punct", "*"):
+                columns.append("*")
+            else:
+                columns.append(self.select_item())
+            if not self.accept("punct", ","):
+                break
+        self.expect_keyword("FROM")
+        table = self.identifier("table name")
+
+        joins = []
+        while self.accept_keyword("INNER") or self.at_keyword("JOIN"):
+            self.expect_keyword("JOIN")
+            join_table = self.identifier("table name")
+            self.expect_keyword("ON")
+            left = self.identifier("column name")
+            if self.expect("operator") != "=":
+                raise ValueError("Only equality join conditions are supported.")
+            right = self.identifier("column name")
+            joins.append(Join(join_table, left, right))
+
+        where = self.parse_or() if self.accept_keyword("WHERE") else None
+        group_by = []
+        if self.accept_keyword("GROUP"):
+            self.expect_keyword("BY")
+            group_by.append(self.identifier("column name"))
+            while self.accept("punct", ","):
+                group_by.append(self.identifier("column name"))
+        if "*" in columns and (group_by or any(isinstance(column, tuple) for column in columns)):
+            raise ValueError("SELECT * cannot be combined with aggregates or GROUP BY.")
+
+        order_by = []
+        if self.accept_keyword("ORDER"):
+            self.expect_keyword("BY")
+            while True:
+                item = self.select_item()
+                if isinstance(item, tuple):
+                    item = f"{item[0]}({item[1]})"  # ordered by the aggregate's output column
+                descending = self.accept_keyword("DESC")
+                if not descending:
+                    self.accept_keyword("ASC")
+                order_by.append((item, descending))
+                if not self.accept("punct", ","):
+                    break
+        # Kept as a literal, so the cached template serves every LIMIT value
+        limit = self.string("a row count") if self.accept_keyword("LIMIT") else None
+        return Select(columns, table, joins, where, group_by, order_by, limit)
+
+    # Predicates are tuples: ('cmp', column, operator, literal), ('and', [...]) or ('or', [...])
+    def parse_or(self):
+        branches = [self.parse_and()]
+        while self.accept_keyword("OR"):
+            branches.append(self.parse_and())
+        return branches[0] if len(branches) == 1 else ('or', branches)
+
+    def parse_and(self):
+        branches = [self.parse_comparison()]
+        while self.accept_keyword("AND"):
+            branches.append(self.parse_comparison())
+        return branches[0] if len(branches) == 1 else ('and', branches)
+
+    def parse_comparison(self):
+        if self.accept("punct", "("):
+            predicate = self.parse_or()
+            self.expect("punct", ")")
+            return predicate
+        column = self.identifier("column name")
+        if self.accept_keyword("BETWEEN"):
+            # column BETWEEN low AND high, both ends included
+            low = self.value()
+            self.expect_keyword("AND")
+            return ('and', [('cmp', column, ">=", low), ('cmp', column, "<=", self.value())])
+        if self.peek()[0] != "operator":
+            raise ValueError(f"Expected a comparison after '{column}' but found {self.found()}.")
+        operator = self.expect("operator")
+        return ('cmp', column, "!=" if operator == "<>" else operator, self.value())
+
+
+def conjuncts(predicate):
+    """The predicates ANDed together at the top of a WHERE clause."""
+    if predicate is None:
+        return []
+    if predicate[0] == 'and':
+        result = []
+        for branch in predicate[1]:
+            result.extend(conjuncts(branch))
+        return result
+    return [predicate]
+
+
+def predicate_columns(predicate, columns):
+    """Add every column a predicate compares to columns; returns columns."""
+    if predicate is None:
+        return columns
+    if predicate[0] == 'cmp':
+        columns.add(predicate[1])
+    else:
+        for branch in predicate[1]:
+            predicate_columns(branch, columns)
+    return columns
+
+
+def describe_predicate(predicate):
+    """A predicate as text, for EXPLAIN."""
+    if predicate is None:
+        return "true"
+    if predicate[0] == 'cmp':
+        return f"{predicate[1]} {predicate[2]} {predicate[3]!r}"
+    joiner = " AND " if predicate[0] == 'and' else " OR "
+    return "(" + joiner.join(describe_predicate(branch) for branch in predicate[1]) + ")"
+
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def parse_statement(command):
+    """Parse one SQL command into a statement object, reusing cached templates."""
+    normalized, literals = extract_literals(command)
+    if not normalized:
+        raise ValueError("Empty command.")
+
+    with _cache_lock:
+        template = _cache.get(normalized)
+        if template is not None:
+            _cache.move_to_end(normalized)
+    if template is None:
+        parser = _Parser(tokenize(normalized), literals)
+        template = parser.statement()
+        parser.finish()
+        if isinstance(template, _CACHEABLE):
+            with _cache_lock:
+                _cache[normalized] = template
+                if len(_cache) > STATEMENT_CACHE_SIZE:
+                    _cache.popitem(last=False)
+    return template.bind(literals)
+
+
+def clear_statement_cache():
+    with _cache_lock:
+        _cache.clear()
@@ -0,0 +1,648 @@
+# storage_engine.py
+import mmap
+import os
+import shutil
+import struct
+import threading
+from collections import OrderedDict
+
+import metrics
+import row_cache
+from db_catalog import get_table
+from record_codec import attribute_width, build_document, cast_value, decode_row, make_key, text_record
+
+# "mongo" stores rows in MongoDB collections; "local" keeps them in the
+# catalog's fixed-width <table>.bin files under DATA_DIR, with no server needed.
+STORAGE_ENGINE = os.environ.get("DBMS_STORAGE_ENGINE", "mongo")
+MONGO_URI = os.environ.get("DBMS_MONGO_URI", "mongodb://localhost:27017/")
+DATA_DIR = os.environ.get("DBMS_DATA_DIR", "data")
+PAGE_SIZE = 4096
+PAGE_CACHE_PAGES = 256  # pages kept in memory per table
+# Rows fetched per round trip (MongoDB) or per locked slot run (local) by full scans,
+# which stream instead of materializing the table
+CURSOR_BATCH_SIZE = int(os.environ.get("DBMS_CURSOR_BATCH_SIZE", "1000"))
+
+DUPLICATE_KEY_ERROR = "Error: Record with this primary key already exists."
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+class StorageEngine:
+    """Interface every engine implements. Rows are written as {_id, row}
+    documents (see record_codec) and read back as (key, {column: typed value})."""
+
+    name = None
+
+    def table(self, db_name, table_name):
+        raise NotImplementedError
+
+    def create_database(self, db_name):
+        pass
+
+    def drop_table(self, db_name, table_name):
+        raise NotImplementedError
+
+    def drop_database(self, db_name):
+        raise NotImplementedError
+
+    def flush(self):
+        # Make every completed write durable (a WAL checkpoint relies on it)
+        pass
+
+
+class TableStore:
+    """Data of one table, as handed out by StorageEngine.table()."""
+
+    def existing_keys(self, keys):
+        # The subset of keys already stored
+        raise NotImplementedError
+
+    def insert_many(self, documents):
+        # Unordered insert; returns {position: error message} for rows that failed
+        raise NotImplementedError
+
+    def delete(self, key):
+        # Removes the row and returns its document, or None when it does not exist
+        raise NotImplementedError
+
+    def delete_many(self, keys):
+        # Removes several rows; returns {key: deleted document} for the keys that existed
+        deleted = {}
+        for key in keys:
+            document = self.delete(key)
+            if document is not None:
+                deleted[key] = document
+        return deleted
+
+    def get_document(self, key):
+        raise NotImplementedError
+
+    def scan_documents(self):
+        # Every row as a {key, value} text record (used by the JSON mirror)
+        raise NotImplementedError
+
+    def rows(self, keys=None, columns=None):
+        # (key, row) pairs for the given keys, or for the whole table when keys is None.
+        # When columns is given, rows only need to contain those columns.
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    # Whether aggregate_keys() can group and aggregate on primary key components in the backend
+    key_aggregation = False
+
+    def aggregate_keys(self, group_positions, aggregates):
+        # [(group key parts as stored text, [aggregate values])]; aggregates are
+        # (function, key position or None for COUNT(*), "INT"|"FLOAT"|"TEXT")
+        raise NotImplementedError
+
+    def migrate(self, batch_size=1000):
+        # Rewrite rows still in an older record format; returns how many were rewritten
+        return 0
+
+
+class MongoTable(TableStore):
+    key_aggregation = True
+
+    def __init__(self, collection, table_info, cache=None):
+        self.collection = collection
+        self.table_info = table_info
+        self.cache = cache  # row_cache.RowCache shared by every store of this table, or None
+
+    def _lookup(self, keys, need_document):
+        if self.cache is None:
+            return {}, list(keys)
+        return self.cache.lookup(keys, need_document)
+
+    def _remember(self, keys):
+        # Whether results for these keys go into the cache (not for bulk loads)
+        return self.cache is not None and len(keys) <= row_cache.ROW_CACHE_MAX_BATCH
+
+    def existing_keys(self, keys):
+        found, missing = self._lookup(keys, False)
+        existing = {key for key, entry in found.items() if entry is not row_cache.ABSENT}
+        if not missing:
+            return existing
+        with metrics.phase("backend"):
+            if len(missing) == 1:
+                stored = {missing[0]} if self.collection.find_one({"_id": missing[0]}, {"_id": 1}) else set()
+            else:
+                stored = {doc["_id"] for doc in self.collection.find({"_id": {"$in": missing}}, {"_id": 1})}
+        if self._remember(missing):
+            for key in missing:
+                self.cache.put(key, row_cache.PRESENT if key in stored else row_cache.ABSENT)
+        return existing | stored
+
+    def insert_many(self, documents):
+        errors = self._insert_many(documents)
+        if self.cache is not None:
+            remember = self._remember(documents)
+            for position, document in enumerate(documents):
+                if not remember:
+                    self.cache.discard(document["_id"])
+                elif position not in errors:
+                    self.cache.put(document["_id"], dict(document))
+                elif errors[position] == DUPLICATE_KEY_ERROR:
+                    self.cache.put(document["_id"], row_cache.PRESENT)
+                else:
+                    self.cache.discard(document["_id"])
+        return errors
+
+    @metrics.timed("backend")
+    def _insert_many(self, documents):
+        from pymongo.errors import BulkWriteError, DuplicateKeyError
+        if len(documents) == 1:
+            try:
+                self.collection.insert_one(documents[0])
+            except DuplicateKeyError:
+                return {0: DUPLICATE_KEY_ERROR}
+            return {}
+        try:
+            self.collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            errors = {}
+            for write_error in e.details.get("writeErrors", []):
+                if write_error.get("code") == 11000:
+                    errors[write_error["index"]] = DUPLICATE_KEY_ERROR
+                else:
+                    errors[write_error["index"]] = f"Error inserting record: {write_error.get('errmsg')}"
+            return errors
+        return {}
+
+    def delete(self, key):
+        return self.delete_many([key]).get(key)
+
+    def delete_many(self, keys):
+        # One read for the documents (their index entries must be removed) and one delete;
+        # callers hold the table's exclusive lock, so nothing changes in between
+        found, _ = self._lookup(keys, False)
+        keys = [key for key in dict.fromkeys(keys) if found.get(key) is not row_cache.ABSENT]
+        if not keys:
+            return {}
+        with metrics.phase("backend"):
+            if len(keys) == 1:
+                document = self.collection.find_one_and_delete({"_id": keys[0]})
+                documents = {keys[0]: document} if document is not None else {}
+            else:
+                documents = {doc["_id"]: doc for doc in self.collection.find({"_id": {"$in": keys}})}
+                if documents:
+                    self.collection.delete_many({"_id": {"$in": list(documents)}})
+        if self.cache is not None:
+            remember = self._remember(keys)
+            for key in keys:
+                if remember:
+                    self.cache.put(key, row_cache.ABSENT)
+                else:
+                    self.cache.discard(key)
+        return documents
+
+    def get_document(self, key):
+        found, _ = self._lookup([key], True)
+        if key in found:
+            return None if found[key] is row_cache.ABSENT else found[key]
+        with metrics.phase("backend"):
+            document = self.collection.find_one({"_id": key})
+        if self.cache is not None:
+            self.cache.put(key, document if document is not None else row_cache.ABSENT)
+        return document
+
+    def scan_documents(self):
+        for document in metrics.timed_iter("backend", self.collection.find({}).batch_size(CURSOR_BATCH_SIZE)):
+            yield text_record(document, self.table_info)
+
+    def rows(self, keys=None, columns=None):
+        projection = {"_id": 1, "row": 1, "value": 1}
+        if keys is None:
+            # Full scans bypass the cache, so they do not push the hot rows out
+            documents = self.collection.find({}, projection).batch_size(CURSOR_BATCH_SIZE)
+            for document in metrics.timed_iter("backend", documents):
+                yield document["_id"], decode_row(document, self.table_info, columns)
+            return
+
+        found, missing = self._lookup(list(dict.fromkeys(keys)), True)
+        if len(missing) == 1:
+            with metrics.phase("backend"):
+                document = self.collection.find_one({"_id": missing[0]}, projection)
+            documents = [document] if document is not None else []
+        elif missing:
+            documents = self.collection.find({"_id": {"$in": missing}}, projection)
+        else:
+            documents = []
+        # Only fetching from the cursor counts as backend time, not decoding
+        for document in metrics.timed_iter("backend", documents):
+            found[document["_id"]] = document
+        if self._remember(missing):
+            for key in missing:
+                self.cache.put(key, found.get(key, row_cache.ABSENT))
+        for key, document in found.items():
+            if document is not row_cache.ABSENT:
+                yield key, decode_row(document, self.table_info, columns)
+
+    @metrics.timed("backend")
+    def count(self):
+        return self.collection.estimated_document_count()
+
+    @metrics.timed("backend")
+    def aggregate_keys(self, group_positions, aggregates):
+        # The other columns are packed into "row", so the pipeline only sees the _id:
+        # split it on '#' and group on its parts; one document per group comes back
+        parts = {"$split": ["$_id", "#"]}
+
+        def part(position, kind):
+            value = {"$arrayElemAt": [parts, position]}
+            if kind == "INT":
+                return {"$toLong": value}
+            if kind == "FLOAT":
+                return {"$toDouble": value}
+            return value
+
+        group = {"_id": {f"k{n}": part(position, "TEXT") for n, position in enumerate(group_positions)} or None}
+        for n, (function, position, kind) in enumerate(aggregates):
+            if function == "COUNT":
+                group[f"a{n}"] = {"$sum": 1}
+            else:
+                group[f"a{n}"] = {"$" + function.lower(): part(position, kind)}
+        results = []
+        for document in self.collection.aggregate([{"$group": group}]):
+            key = document["_id"] or {}
+            results.append((tuple(key.get(f"k{n}") for n in range(len(group_positions))),
+                            [document[f"a{n}"] for n in range(len(aggregates))]))
+        return results
+
+    def migrate(self, batch_size=1000):
+        """Re-encode documents written with the old '#'-joined value string, a batch at a time."""
+        from pymongo import ReplaceOne
+        migrated = 0
+        while True:
+            batch = list(self.collection.find({"row": {"$exists": False}}).limit(batch_size))
+            if not batch:
+                return migrated
+            requests = []
+            for document in batch:
+                new_document, error = build_document(decode_row(document, self.table_info), self.table_info)
+                if error:
+                    raise ValueError(f"Cannot migrate row {document['_id']}: {error}")
+                requests.append(ReplaceOne({"_id": document["_id"]}, new_document))
+            self.collection.bulk_write(requests, ordered=False)
+            migrated += len(requests)
+            if self.cache is not None:
+                self.cache.clear()
+
+
+class MongoEngine(StorageEngine):
+    name = "mongo"
+
+    def __init__(self, uri=MONGO_URI, client=None):
+        if client is None:
+            from pymongo import MongoClient
+            client = MongoClient(uri)
+        self.client = client
+
+    def table(self, db_name, table_name):
+        table_info = get_table(db_name, table_name)
+        if table_info is None:
+            return None
+        return MongoTable(self.client[db_name][table_name], table_info, row_cache.table_cache(db_name, table_name))
+
+    def create_database(self, db_name):
+        self.client[db_name]  # MongoDB creates the database on first write
+
+    def drop_table(self, db_name, table_name):
+        row_cache.forget(db_name, table_name)
+        db = self.client[db_name]
+        if table_name in db.list_collection_names():
+            db.drop_collection(table_name)
+            return True
+        return False
+
+    def drop_database(self, db_name):
+        row_cache.forget(db_name)
+        self.client.drop_database(db_name)
+
+
+def slot_layout(structure):
+    """(columns with their kind, offset and size, slot size) for a table's attributes.
+
+    The slot size is also what CREATE TABLE writes to the catalog as rowLength.
+    """
+    columns = []
+    offset = 1 + (len(structure) + 7) // 8
+    for position, attr in enumerate(structure):
+        attr_type = (attr['type'] or '').upper()
+        if attr_type == "INT":
+            kind, size = "q", 8
+        elif attr_type == "FLOAT":
+            kind, size = "d", 8
+        else:
+            kind, size = "s", 2 + attribute_width(attr)
+        columns.append({
+            'name': attr['name'], 'type': attr['type'], 'kind': kind,
+            'offset': offset, 'size': size, 'position': position
+        })
+        offset += size
+    return columns, offset
+
+
+class LocalTable(TableStore):
+    """Fixed-width slotted rows in <table>.bin.
+
+    Each slot is: a status byte (0 free, 1 used), a null bitmap, then every
+    column at a fixed offset (INT as 8-byte int, FLOAT as 8-byte double,
+    anything else as a 2-byte length plus the attribute's declared width).
+    Slots never straddle a page; reads go through an LRU page cache over a
+    memory map of the file, and deleted slots are reused from a free list.
+    """
+
+    def __init__(self, path, table_info):
+        self.path = path
+        self.table_info = table_info
+        self.lock = threading.RLock()
+        self.primary_keys = table_info['primary_keys']
+
+        self.columns, self.slot_size = slot_layout(table_info['structure'])
+        self.column_by_name = {column['name']: column for column in self.columns}
+        self.slots_per_page = max(1, PAGE_SIZE // self.slot_size)
+        self.page_size = max(PAGE_SIZE, self.slot_size)
+
+        self.page_cache = OrderedDict()
+        self.slots = {}      # key -> slot number
+        self.free_slots = []
+        self.slot_count = 0  # slots in the file (used or free)
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        self.file = open(path, "r+b")
+        self.map = None
+        self._remap()
+        self._load_slots()
+
+    def _remap(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        size = os.path.getsize(self.path)
+        if size:
+            self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+
+    def _slot_offset(self, slot):
+        page, index = divmod(slot, self.slots_per_page)
+        return page, page * self.page_size + index * self.slot_size
+
+    def _page(self, page):
+        data = self.page_cache.get(page)
+        if data is not None:
+            self.page_cache.move_to_end(page)
+            return data
+        start = page * self.page_size
+        data = bytes(self.map[start:start + self.page_size])
+        self.page_cache[page] = data
+        if len(self.page_cache) > PAGE_CACHE_PAGES:
+            self.page_cache.popitem(last=False)
+        return data
+
+    def _read_slot(self, slot):
+        page, offset = self._slot_offset(slot)
+        start = offset - page * self.page_size
+        return self._page(page)[start:start + self.slot_size]
+
+    def _load_slots(self):
+        pages = os.path.getsize(self.path) // self.page_size
+        self.slot_count = pages * self.slots_per_page
+        for slot in range(self.slot_count):
+            data = self._read_slot(slot)
+            if data[0] == 1:
+                self.slots[self._key_of(data)] = slot
+            else:
+                self.free_slots.append(slot)
+        self.free_slots.reverse()  # pop() hands out the lowest slot first
+
+    def _unpack_column(self, data, column):
+        if data[1 + column['position'] // 8] & (1 << (column['position'] % 8)):
+            return None
+        start = column['offset']
+        if column['kind'] == "q":
+            return struct.unpack_from("<q", data, start)[0]
+        if column['kind'] == "d":
+            return struct.unpack_from("<d", data, start)[0]
+        (length,) = struct.unpack_from("<H", data, start)
+        return data[start + 2:start + 2 + length].decode('utf-8')
+
+    def _key_of(self, data):
+        # Normalized like the keys build_document makes, so they match after a restart
+        return make_key({pk: self._unpack_column(data, self.column_by_name[pk]) for pk in self.primary_keys},
+                        self.table_info)
+
+    def _pack(self, row):
+        data = bytearray(self.slot_size)
+        data[0] = 1
+        for column in self.columns:
+            value = cast_value(row.get(column['name']), column['type'])
+            if value is None:
+                data[1 + column['position'] // 8] |= 1 << (column['position'] % 8)
+                continue
+            if column['kind'] == "q":
+                if not isinstance(value, int):
+                    raise ValueError(f"Invalid INT value '{value}' for column {column['name']}.")
+                struct.pack_into("<q", data, column['offset'], value)
+            elif column['kind'] == "d":
+                if not isinstance(value, (int, float)):
+                    raise ValueError(f"Invalid FLOAT value '{value}' for column {column['name']}.")
+                struct.pack_into("<d", data, column['offset'], float(value))
+            else:
+                encoded = str(value).encode('utf-8')
+                if len(encoded) > column['size'] - 2:
+                    raise ValueError(f"Value for column {column['name']} is longer than {column['size'] - 2} bytes.")
+                struct.pack_into("<H", data, column['offset'], len(encoded))
+                data[column['offset'] + 2:column['offset'] + 2 + len(encoded)] = encoded
+        return bytes(data)
+
+    def _write_slot(self, slot, data):
+        page, offset = self._slot_offset(slot)
+        if slot >= self.slot_count:
+            # Grow the file by one whole page and map it
+            self.file.seek(0, os.SEEK_END)
+            self.file.write(b"\0" * self.page_size)
+            self.file.flush()
+            new_slots = range(self.slot_count, self.slot_count + self.slots_per_page)
+            self.slot_count += self.slots_per_page
+            self.free_slots.extend(reversed([s for s in new_slots if s != slot]))
+            self._remap()
+        os.pwrite(self.file.fileno(), data, offset)
+        self.page_cache.pop(page, None)
+
+    def _row_from_slot(self, data, columns=None):
+        selected = self.columns if columns is None else [self.column_by_name[c] for c in columns]
+        return {column['name']: self._unpack_column(data, column) for column in selected}
+
+    @metrics.timed("backend")
+    def existing_keys(self, keys):
+        with self.lock:
+            return {key for key in keys if key in self.slots}
+
+    @metrics.timed("backend")
+    def insert_many(self, documents):
+        errors = {}
+        with self.lock:
+            for position, document in enumerate(documents):
+                key = document["_id"]
+                if key in self.slots:
+                    errors[position] = DUPLICATE_KEY_ERROR
+                    continue
+                try:
+                    data = self._pack(decode_row(document, self.table_info))
+                except ValueError as e:
+                    errors[position] = f"Error inserting record: {e}"
+                    continue
+                slot = self.free_slots.pop() if self.free_slots else self.slot_count
+                self._write_slot(slot, data)
+                self.slots[key] = slot
+        return errors
+
+    @metrics.timed("backend")
+    def delete(self, key):
+        with self.lock:
+            slot = self.slots.pop(key, None)
+            if slot is None:
+                return None
+            row = self._row_from_slot(self._read_slot(slot))
+            self._write_slot(slot, b"\0")
+            self.free_slots.append(slot)
+        return _document_from_row(row, self.table_info)
+
+    @metrics.timed("backend")
+    def get_document(self, key):
+        for _, row in self.rows([key]):
+            return _document_from_row(row, self.table_info)
+        return None
+
+    def scan_documents(self):
+        for _, row in self.rows():
+            yield text_record(_document_from_row(row, self.table_info), self.table_info)
+
+    def rows(self, keys=None, columns=None):
+        # Only the requested columns are unpacked from their fixed offsets
+        if columns is not None:
+            columns = [c for c in columns if c in self.column_by_name]
+        if keys is None:
+            return metrics.timed_iter("backend", self._scan(columns))
+        with metrics.phase("backend"), self.lock:
+            slots = [(key, self.slots[key]) for key in keys if key in self.slots]
+            result = [(key, self._row_from_slot(self._read_slot(slot), columns)) for key, slot in slots]
+        return iter(result)
+
+    def _scan(self, columns):
+        # Walk the file in slot order, CURSOR_BATCH_SIZE slots per lock hold, so a full
+        # scan needs constant memory and does not block writers for its whole length
+        slot = 0
+        while True:
+            with self.lock:
+                end = min(slot + CURSOR_BATCH_SIZE, self.slot_count)
+                batch = []
+                for current in range(slot, end):
+                    data = self._read_slot(current)
+                    if data[0] == 1:
+                        batch.append((self._key_of(data), self._row_from_slot(data, columns)))
+                finished = end >= self.slot_count
+            yield from batch
+            if finished:
+                return
+            slot = end
+
+    @metrics.timed("backend")
+    def count(self):
+        return len(self.slots)
+
+    def flush(self):
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            if self.map is not None:
+                self.map.close()
+                self.map = None
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.file.close()
+
+
+def _document_from_row(row, table_info):
+    document, _ = build_document(row, table_info)
+    return document
+
+
+class LocalEngine(StorageEngine):
+    name = "local"
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def _path(self, db_name, table_info):
+        return os.path.join(self.data_dir, db_name, table_info['file_name'] or f"{table_info['name']}.bin")
+
+    def table(self, db_name, table_name):
+        table_info = get_table(db_name, table_name)
+        if table_info is None:
+            return None
+        with self.lock:
+            store = self.tables.get((db_name, table_name))
+            if store is None:
+                store = LocalTable(self._path(db_name, table_info), table_info)
+                self.tables[(db_name, table_name)] = store
+            else:
+                store.table_info = table_info  # pick up index changes
+            return store
+
+    def create_database(self, db_name):
+        os.makedirs(os.path.join(self.data_dir, db_name), exist_ok=True)
+
+    def drop_table(self, db_name, table_name):
+        with self.lock:
+            store = self.tables.pop((db_name, table_name), None)
+        path = os.path.join(self.data_dir, db_name, f"{table_name}.bin")
+        if store is not None:
+            store.close()
+            path = store.path
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def drop_database(self, db_name):
+        with self.lock:
+            for key in [key for key in self.tables if key[0] == db_name]:
+                self.tables.pop(key).close()
+        shutil.rmtree(os.path.join(self.data_dir, db_name), ignore_errors=True)
+
+    def flush(self):
+        # Rows are written with pwrite and reach the disk here, at WAL checkpoints
+        with self.lock:
+            stores = list(self.tables.values())
+        for store in stores:
+            store.flush()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                if STORAGE_ENGINE == "local":
+                    _engine = LocalEngine()
+                elif STORAGE_ENGINE == "mongo":
+                    _engine = MongoEngine()
+                else:
+                    raise ValueError(f"Unknown storage engine '{STORAGE_ENGINE}'.")
+    return _engine
+
+
+def set_engine(engine):
+    # Swap the engine (e.g. a MongoEngine around another client)
+    global _engine
+    _engine = engine
@@ -0,0 +1,68 @@
+# table_export.py
+# Writes a whole table to a CSV, JSON or JSON lines file (gzip-compressed for names
+# ending in .gz) for EXPORT TABLE. Rows are streamed from the storage engine and
+# written as they arrive, so memory use does not grow with the table. The output
+# goes to a temporary file that replaces the target only once it is complete.
+# Every format can be read back with LOAD DATA. Like LOAD DATA, it only writes under
+# the file directory (bulk_loader.FILE_DIR); client paths are relative to it.
+import csv
+import json
+import os
+import time
+
+from bulk_loader import FILE_DIR, detect_format, open_text, resolve_path
+from db_catalog import get_table
+from db_operations import engine
+
+
+def _write_rows(file, file_format, columns, rows):
+    count = 0
+    if file_format == "CSV":
+        writer = csv.writer(file)
+        writer.writerow(columns)
+        for _, row in rows:
+            writer.writerow(['' if row.get(column) is None else row[column] for column in columns])
+            count += 1
+    elif file_format == "JSONL":
+        for _, row in rows:
+            file.write(json.dumps({column: row.get(column) for column in columns}) + "\n")
+            count += 1
+    else:
+        file.write("[")
+        for _, row in rows:
+            file.write(",\n    " if count else "\n    ")
+            file.write(json.dumps({column: row.get(column) for column in columns}))
+            count += 1
+        file.write("\n]\n" if count else "]\n")
+    return count
+
+
+def export_table(db_name, table_name, path, file_format=None):
+    """Export every row of a table to a file; returns the summary message."""
+    if not db_name:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    table_info = get_table(db_name, table_name)
+    if table_info is None:
+        return f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."
+    try:
+        file_format = detect_format(path, file_format)
+        full_path = resolve_path(path)
+    except ValueError as e:
+        return f"Error: {e}"
+
+    columns = table_info['attributes']
+    temporary_path = f"{full_path}.{os.getpid()}.tmp"
+    started = time.perf_counter()
+    try:
+        os.makedirs(FILE_DIR, exist_ok=True)
+        with open_text(temporary_path, "w", compressed=path.lower().endswith(".gz")) as file:
+            count = _write_rows(file, file_format, columns, engine.table(db_name, table_name).rows(None, columns))
+        os.replace(temporary_path, full_path)
+    except Exception as e:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        return f"Error exporting table {table_name} to {path}: {str(e)}"
+    elapsed = time.perf_counter() - started
+    rate = count / elapsed if elapsed > 0 else 0.0
+    return (f"Exported {count} row(s) from table {table_name} to {path} "
+            f"in {elapsed:.2f}s ({rate:.0f} rows/sec).")
@@ -0,0 +1,322 @@
+# table_stats.py
+# Data statistics for the planner, collected by ANALYZE TABLE and stored in the
+# catalog next to the table's Structure:
+#
+#   <Statistics rowCount="1000" analyzedAt="2026-10-16T12:00:00">
+#     <ColumnStatistics attributeName="age" distinctCount="12" nullFraction="0.05">
+#       <Bucket lowerBound="18" upperBound="19" rowCount="163" distinctCount="2" upperCount="91"/>
+#       ...
+#
+# Histograms are equi-depth: every bucket holds about the same number of rows, and
+# a value never spans two buckets. upperCount is the frequency of the bucket's upper
+# bound, which keeps heavily repeated values visible. Each IndexFile gets a
+# distinctKeys attribute. Inserts and deletes keep the row count, null counts and
+# bucket counts current in memory; ANALYZE writes them back to the catalog.
+import bisect
+import datetime
+import os
+import random
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from db_catalog import load_catalog, save_catalog, get_table
+from record_codec import cast_value, decode_row, literal_value
+from storage_engine import get_engine
+
+HISTOGRAM_BUCKETS = int(os.environ.get("DBMS_HISTOGRAM_BUCKETS", "32"))
+ANALYZE_SAMPLE_ROWS = int(os.environ.get("DBMS_ANALYZE_SAMPLE_ROWS", "30000"))  # rows the histograms are built from
+
+# Guesses for columns without statistics
+DEFAULT_EQUALITY_SELECTIVITY = 0.1
+DEFAULT_RANGE_SELECTIVITY = 1 / 3
+
+_stats = {}  # (db_name, table_name) -> (catalog element, TableStats or None)
+_stats_lock = threading.Lock()
+_write_lock = threading.Lock()  # ANALYZE runs under a shared catalog lock; one writes at a time
+
+
+class ColumnStats:
+    def __init__(self, distinct, null_count, buckets):
+        self.distinct = distinct
+        self.null_count = null_count
+        self.buckets = buckets  # [lower, upper, rows, distinct, rows equal to upper], in value order
+        self.uppers = [bucket[1] for bucket in buckets]
+
+    def record(self, value, sign):
+        if value is None:
+            self.null_count = max(0, self.null_count + sign)
+            return
+        if not self.buckets:
+            if sign > 0:
+                self.buckets.append([value, value, 1, 1, 1])
+                self.uppers.append(value)
+                self.distinct = max(self.distinct, 1)
+            return
+        position = bisect.bisect_left(self.uppers, value)
+        if position == len(self.buckets):
+            if sign < 0:
+                return
+            # A new largest value becomes the last bucket's upper bound
+            position -= 1
+            self.buckets[position][1] = self.uppers[position] = value
+            self.buckets[position][3] += 1
+            self.buckets[position][4] = 0
+            self.distinct += 1
+        bucket = self.buckets[position]
+        if sign > 0 and value < bucket[0]:
+            bucket[0] = value
+        bucket[2] = max(0, bucket[2] + sign)
+        if value == bucket[1]:
+            bucket[4] = max(0, bucket[4] + sign)
+
+    def equal_rows(self, value):
+        position = bisect.bisect_left(self.uppers, value)
+        if position == len(self.buckets) or value < self.buckets[position][0]:
+            return 0.0
+        lower, upper, rows, distinct, upper_rows = self.buckets[position]
+        if value == upper:
+            return float(upper_rows)
+        # The bucket's other values share what the upper bound leaves over
+        return (rows - upper_rows) / max(1, distinct - 1)
+
+    def rows_below(self, value):
+        # Non-NULL rows with a value below the given one (interpolated inside a bucket)
+        total = 0.0
+        for lower, upper, rows, _, _ in self.buckets:
+            if upper < value:
+                total += rows
+                continue
+            if lower < value:
+                if isinstance(value, (int, float)) and upper > lower:
+                    total += rows * (value - lower) / (upper - lower)
+                else:
+                    total += rows / 2
+            break
+        return total
+
+
+class TableStats:
+    def __init__(self, row_count, columns):
+        self.row_count = row_count
+        self.columns = columns  # column name -> ColumnStats
+        self.lock = threading.Lock()
+
+    def record(self, rows, sign):
+        with self.lock:
+            self.row_count = max(0, self.row_count + sign * len(rows))
+            for row in rows:
+                for name, column in self.columns.items():
+                    try:
+                        column.record(row.get(name), sign)
+                    except TypeError:
+                        pass  # a value of another type than the column's; ignored
+
+    def selectivity(self, predicate, types):
+        """Estimated fraction of rows that match a WHERE predicate."""
+        if predicate is None:
+            return 1.0
+        if predicate[0] == 'and':
+            result = 1.0
+            for branch in predicate[1]:
+                result *= self.selectivity(branch, types)
+            return result
+        if predicate[0] == 'or':
+            miss = 1.0
+            for branch in predicate[1]:
+                miss *= 1.0 - self.selectivity(branch, types)
+            return 1.0 - miss
+
+        _, column_name, operator, literal = predicate
+        column = self.columns.get(column_name)
+        value = literal_value(literal, types.get(column_name))
+        if column is None or value is None:
+            return DEFAULT_EQUALITY_SELECTIVITY if operator == "=" else DEFAULT_RANGE_SELECTIVITY
+        with self.lock:
+            if self.row_count == 0:
+                return 0.0
+            try:
+                equal = column.equal_rows(value) / self.row_count
+                if operator == "=":
+                    return min(1.0, equal)
+                non_null = max(0, self.row_count - column.null_count) / self.row_count
+                if operator == "!=":
+                    return max(0.0, non_null - equal)
+                below = column.rows_below(value) / self.row_count
+                if operator == "<":
+                    return min(1.0, below)
+                if operator == "<=":
+                    return min(1.0, below + equal)
+                if operator == ">":
+                    return max(0.0, non_null - below - equal)
+                return max(0.0, non_null - below)
+            except TypeError:
+                return DEFAULT_RANGE_SELECTIVITY
+
+
+def _build_histogram(values, scale):
+    # Equi-depth over the sorted sample; runs of equal values stay in one bucket
+    values.sort()
+    buckets = []
+    depth = max(1, len(values) // HISTOGRAM_BUCKETS)
+    start = 0
+    while start < len(values):
+        end = min(len(values), start + depth)
+        while end < len(values) and values[end] == values[end - 1]:
+            end += 1
+        upper = values[end - 1]
+        upper_start = bisect.bisect_left(values, upper, start, end)
+        distinct = 1
+        for position in range(start + 1, end):
+            if values[position] != values[position - 1]:
+                distinct += 1
+        buckets.append([values[start], upper, round((end - start) * scale), distinct, round((end - upper_start) * scale)])
+        start = end
+    return buckets
+
+
+def _collect(table_info, store):
+    # One pass over the table: exact row, NULL and distinct counts, plus a uniform
+    # sample of rows (reservoir sampling) for the histograms
+    columns = table_info['attributes']
+    index_columns = [index for index in table_info['indexes'] if not index.get('implicit')]
+    row_count = 0
+    null_counts = dict.fromkeys(columns, 0)
+    distinct = {column: set() for column in columns}
+    index_keys = {index['name']: set() for index in index_columns}
+    sample = []
+    sampler = random.Random(0)
+    for _, row in store.rows(None, columns):
+        row_count += 1
+        for column in columns:
+            value = row.get(column)
+            if value is None:
+                null_counts[column] += 1
+            else:
+                distinct[column].add(value)
+        for index in index_columns:
+            index_keys[index['name']].add(tuple(row.get(column) for column in index['columns']))
+        if len(sample) < ANALYZE_SAMPLE_ROWS:
+            sample.append(row)
+        else:
+            slot = sampler.randrange(row_count)
+            if slot < ANALYZE_SAMPLE_ROWS:
+                sample[slot] = row
+
+    column_stats = {}
+    for column in columns:
+        values = [row[column] for row in sample if row.get(column) is not None]
+        non_null = row_count - null_counts[column]
+        scale = non_null / len(values) if values else 1.0
+        column_stats[column] = ColumnStats(len(distinct[column]), null_counts[column], _build_histogram(values, scale))
+    return TableStats(row_count, column_stats), {name: len(keys) for name, keys in index_keys.items()}
+
+
+def _to_element(stats):
+    element = ET.Element("Statistics", {
+        "rowCount": str(stats.row_count),
+        "analyzedAt": datetime.datetime.now().isoformat(timespec="seconds")
+    })
+    for name, column in stats.columns.items():
+        null_fraction = column.null_count / stats.row_count if stats.row_count else 0.0
+        column_el = ET.SubElement(element, "ColumnStatistics", {
+            "attributeName": name,
+            "distinctCount": str(column.distinct),
+            "nullFraction": f"{null_fraction:.4f}"
+        })
+        for lower, upper, rows, distinct, upper_rows in column.buckets:
+            ET.SubElement(column_el, "Bucket", {
+                "lowerBound": str(lower),
+                "upperBound": str(upper),
+                "rowCount": str(rows),
+                "distinctCount": str(distinct),
+                "upperCount": str(upper_rows)
+            })
+    return element
+
+
+def _from_element(element, table_info):
+    row_count = int(element.get("rowCount", "0"))
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    columns = {}
+    for column_el in element.findall("ColumnStatistics"):
+        name = column_el.get("attributeName")
+        if name not in types:
+            continue
+        buckets = [
+            [cast_value(bucket.get("lowerBound"), types[name]), cast_value(bucket.get("upperBound"), types[name]),
+             int(bucket.get("rowCount")), int(bucket.get("distinctCount")), int(bucket.get("upperCount"))]
+            for bucket in column_el.findall("Bucket")
+        ]
+        null_count = round(float(column_el.get("nullFraction", "0")) * row_count)
+        columns[name] = ColumnStats(int(column_el.get("distinctCount", "0")), null_count, buckets)
+    return TableStats(row_count, columns)
+
+
+def get_stats(db_name, table_info):
+    """The table's statistics, or None if it was never analyzed."""
+    key = (db_name, table_info['name'])
+    element = table_info['element']
+    cached = _stats.get(key)
+    if cached is not None and cached[0] is element:
+        return cached[1]
+    with _stats_lock:
+        cached = _stats.get(key)
+        if cached is None or cached[0] is not element:
+            # First use, or the table was dropped and created again
+            statistics_el = element.find("Statistics")
+            cached = (element, _from_element(statistics_el, table_info) if statistics_el is not None else None)
+            _stats[key] = cached
+    return cached[1]
+
+
+def record_documents(db_name, table_info, documents, sign):
+    """Apply inserted (sign 1) or deleted (sign -1) rows to the table's statistics."""
+    if not documents:
+        return
+    stats = get_stats(db_name, table_info)
+    if stats is not None:
+        stats.record([decode_row(document, table_info) for document in documents], sign)
+
+
+def estimate_rows(db_name, table_info, predicate):
+    """Estimated rows matching predicate, or None without statistics."""
+    stats = get_stats(db_name, table_info)
+    if stats is None:
+        return None
+    types = {attr['name']: attr['type'] for attr in table_info['structure']}
+    return stats.row_count * stats.selectivity(predicate, types)
+
+
+def analyze_table(db_name, table_name):
+    if not db_name:
+        return "No database selected. Use 'USE <database_name>' to select a database."
+    table_info = get_table(db_name, table_name)
+    if table_info is None:
+        return f"Table '{table_name}' or database '{db_name}' does not exist in the catalog."
+
+    started = time.perf_counter()
+    try:
+        stats, index_keys = _collect(table_info, get_engine().table(db_name, table_name))
+    except Exception as e:
+        return f"Error analyzing table {table_name}: {str(e)}"
+
+    with _write_lock:
+        tree = load_catalog()
+        if tree is None:
+            return "Failed to load catalog."
+        element = table_info['element']
+        for old in element.findall("Statistics"):
+            element.remove(old)
+        # Right after the Structure it describes
+        position = list(element).index(element.find("Structure")) + 1 if element.find("Structure") is not None else 0
+        element.insert(position, _to_element(stats))
+        for index_el in element.findall("IndexFiles/IndexFile"):
+            if index_el.get("indexName") in index_keys:
+                index_el.set("distinctKeys", str(index_keys[index_el.get("indexName")]))
+        save_catalog(tree)
+        with _stats_lock:
+            _stats[(db_name, table_name)] = (element, stats)
+
+    return (f"Table {table_name} analyzed: {stats.row_count} row(s), {len(stats.columns)} column(s) "
+            f"in {time.perf_counter() - started:.2f}s.")
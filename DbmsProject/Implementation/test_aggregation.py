@@ -0,0 +1,85 @@
+# test_aggregation.py
+# Aggregate SELECTs: the $group pipeline used for key columns on MongoDB has to give
+# the same rows as hash aggregation over the decoded rows:
+#
+#   python -m unittest test_aggregation
+import unittest
+from unittest import mock
+
+import test_support
+
+# Every input is a primary key column, so these can run as a pipeline
+KEY_QUERIES = [
+    "SELECT region, COUNT(*), SUM(year), AVG(amount), MIN(amount), MAX(year) FROM sale GROUP BY region",
+    "SELECT COUNT(region), SUM(amount), MIN(region), MAX(region), MIN(year) FROM sale",
+    "SELECT year, region, MAX(amount), COUNT(*) FROM sale GROUP BY year, region",
+    "SELECT year, AVG(year) FROM sale GROUP BY year",
+]
+
+
+def setUpModule():
+    test_support.start()
+
+
+class AggregationTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE aggregates",
+            "USE aggregates",
+            "CREATE TABLE sale (region VARCHAR(10), year INT, amount FLOAT, note VARCHAR(10), "
+            "PRIMARY KEY (region, year, amount))",
+            "CREATE TABLE empty (id INT PRIMARY KEY, n INT)",
+            "INSERT INTO sale (region, year, amount, note) VALUES ('north', 2020, 10.5, 'a'), "
+            "('north', 2021, -3, NULL), ('south', 2020, 7, 'b'), ('south', 2020, 2.25, 'c'), "
+            "('east', 2019, 100, NULL)",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE aggregates")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def test_group_by_key_columns(self):
+        self.assertEqual(self._run(KEY_QUERIES[0]).splitlines(), [
+            "region | COUNT(*) | SUM(year) | AVG(amount) | MIN(amount) | MAX(year)",
+            "east | 1 | 2019 | 100.0 | 100.0 | 2019",
+            "north | 2 | 4041 | 3.75 | -3.0 | 2021",
+            "south | 2 | 4040 | 4.625 | 2.25 | 2020",
+            "(3 rows)",
+        ])
+
+    def test_pushdown_matches_hash_aggregation(self):
+        import storage_engine
+        from db_operations import engine
+        if not engine.table("aggregates", "sale").key_aggregation:
+            self.skipTest("the engine cannot aggregate on keys")
+        for query in KEY_QUERIES:
+            with self.subTest(query=query):
+                self.assertTrue(self._run("EXPLAIN " + query).startswith("AGGREGATE PUSHDOWN"))
+                pushed = self._run(query)
+                with mock.patch.object(storage_engine.MongoTable, "key_aggregation", False):
+                    self.assertTrue(self._run("EXPLAIN " + query).startswith("HASH AGGREGATE"))
+                    self.assertEqual(pushed, self._run(query))
+
+    def test_other_columns_use_hash_aggregation(self):
+        query = "SELECT region, COUNT(note), MIN(note) FROM sale GROUP BY region"
+        self.assertTrue(self._run("EXPLAIN " + query).startswith("HASH AGGREGATE"))
+        self.assertEqual(self._run(query).splitlines()[1:4],
+                         ["east | 0 | NULL", "north | 1 | a", "south | 2 | b"])
+        query = "SELECT COUNT(*) FROM sale WHERE year = 2020"
+        self.assertTrue(self._run("EXPLAIN " + query).startswith("HASH AGGREGATE"))
+        self.assertEqual(test_support.column_values(self._run(query), "COUNT(*)"), ["3"])
+
+    def test_empty_table(self):
+        self.assertEqual(self._run("SELECT COUNT(*), SUM(n), MAX(id) FROM empty").splitlines()[1], "0 | NULL | NULL")
+        self.assertEqual(self._run("SELECT n, COUNT(*) FROM empty GROUP BY n").splitlines()[1:], ["(0 rows)"])
+
+    def test_column_outside_group_by(self):
+        self.assertEqual(self._run("SELECT region, year, COUNT(*) FROM sale GROUP BY region"),
+                         "Error: Column year must appear in GROUP BY or inside an aggregate function.")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# test_btree.py
+# The B+tree index files on their own: splits, deletes that empty and unlink leaves,
+# ordered scans, and a file reopened after a commit or after a commit cut short:
+#
+#   python -m unittest test_btree
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import btree
+
+# Small pages, so a few hundred entries need several levels
+PAGE_SIZE = 256
+
+
+def _key(number):
+    return ((1, number),)
+
+
+class BPlusTreeTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp(prefix="dbms-btree-")
+        self.addCleanup(shutil.rmtree, directory, True)
+        self.path = os.path.join(directory, "t.ix.ind")
+        self.tree = self._open()
+
+    def tearDown(self):
+        self.tree.close()
+
+    def _open(self, signature="ix"):
+        return btree.BPlusTree(self.path, PAGE_SIZE, signature)
+
+    def _reopen(self):
+        self.tree.close()
+        self.tree = self._open()
+        self.assertTrue(self.tree.reused)
+
+    def _fill(self, numbers):
+        for number in numbers:
+            self.tree.insert(_key(number), str(number), [number * 10])
+        self.tree.commit()
+
+    def _numbers(self, **bounds):
+        return [key[0][1] for key, _, _ in self.tree.scan(**bounds)]
+
+    def test_splits_keep_entries_in_order(self):
+        numbers = list(range(500))
+        random.Random(1).shuffle(numbers)
+        self._fill(numbers)
+        self.assertEqual(len(self.tree), 500)
+        self.assertGreaterEqual(self.tree.stats()['height'], 3)
+        self.assertEqual(self._numbers(), list(range(500)))
+        self.assertEqual([included for _, _, included in self.tree.scan()][:3], [[0], [10], [20]])
+
+    def test_scan_across_reopen(self):
+        numbers = list(range(0, 600, 2))
+        random.Random(2).shuffle(numbers)
+        self._fill(numbers)
+        stats = self.tree.stats()
+        self._reopen()
+        self.assertEqual(len(self.tree), 300)
+        self.assertEqual(self.tree.stats()['height'], stats['height'])
+        self.assertEqual(self._numbers(), list(range(0, 600, 2)))
+        # Bounds compare with (key, primary key); end is excluded
+        self.assertEqual(self._numbers(start=(_key(100), ""), end=(_key(110), "")), [100, 102, 104, 106, 108])
+        self.assertEqual(self._numbers(start=(_key(101), ""), end=(_key(107), ""), reverse=True), [106, 104, 102])
+        self.assertEqual(self._numbers(reverse=True)[:3], [598, 596, 594])
+
+    def test_equal_keys_are_ordered_by_primary_key(self):
+        for primary_key in ["b", "c", "a"]:
+            self.tree.insert(_key(7), primary_key, [primary_key])
+        # Inserting an existing entry only replaces its INCLUDE values
+        self.tree.insert(_key(7), "b", ["new"])
+        self.assertEqual([(primary_key, included) for _, primary_key, included in self.tree.scan()],
+                         [("a", ["a"]), ("b", ["new"]), ("c", ["c"])])
+        self.assertEqual(len(self.tree), 3)
+
+    def test_delete_unlinks_empty_leaves(self):
+        self._fill(range(400))
+        grown = self.tree.stats()
+        self.assertTrue(self.tree.delete(_key(5), "5"))
+        self.assertFalse(self.tree.delete(_key(5), "5"))
+        self.assertFalse(self.tree.delete(_key(5), "6"))
+
+        # Everything but a few entries at either end
+        for number in range(6, 395):
+            self.assertTrue(self.tree.delete(_key(number), str(number)))
+        self.tree.commit()
+        self.assertEqual(self._numbers(), [0, 1, 2, 3, 4, 395, 396, 397, 398, 399])
+        self.assertEqual(self._numbers(reverse=True), [399, 398, 397, 396, 395, 4, 3, 2, 1, 0])
+        self._reopen()
+        self.assertEqual(len(self.tree), 10)
+        self.assertEqual(self._numbers(), [0, 1, 2, 3, 4, 395, 396, 397, 398, 399])
+
+        # The emptied leaves were freed, and are used again before the file grows
+        self._fill(range(5, 395))
+        self.assertEqual(self._numbers(), list(range(400)))
+        self.assertLessEqual(self.tree.stats()['pages'], grown['pages'] + 2)
+
+    def test_root_with_one_child_hands_over(self):
+        self._fill(range(40))
+        grown = self.tree.stats()
+        self.assertEqual(grown['height'], 2)
+        for number in range(3, 40):
+            self.tree.delete(_key(number), str(number))
+        self.tree.commit()
+        self.assertEqual(self.tree.stats()['height'], 1)
+        self._reopen()
+        self.assertEqual(self.tree.stats()['height'], 1)
+        self.assertEqual(self._numbers(), [0, 1, 2])
+        self._fill(range(3, 40))
+        self.assertEqual(self._numbers(), list(range(40)))
+        self.assertEqual(self.tree.stats()['pages'], grown['pages'])
+
+    def test_delete_everything(self):
+        self._fill(range(300))
+        for number in range(300):
+            self.tree.delete(_key(number), str(number))
+        self.tree.commit()
+        self._reopen()
+        self.assertEqual(len(self.tree), 0)
+        self.assertEqual(self._numbers(), [])
+        self._fill([3, 1, 2])
+        self.assertEqual(self._numbers(), [1, 2, 3])
+
+    def test_bulk_load_then_insert(self):
+        self.tree.bulk_load((_key(number), str(number), [number]) for number in range(0, 1000, 2))
+        self._fill(range(1, 1000, 2))
+        self._reopen()
+        self.assertEqual(self._numbers(), list(range(1000)))
+
+    def test_other_signature_starts_empty(self):
+        self._fill(range(50))
+        self.tree.close()
+        self.tree = self._open("other")
+        self.assertFalse(self.tree.reused)
+        self.assertEqual(len(self.tree), 0)
+
+    def test_interrupted_commit_is_rolled_back(self):
+        self._fill(range(200))
+        for number in range(200, 400):
+            self.tree.insert(_key(number), str(number), [number])
+        self.tree.delete(_key(0), "0")
+        # The pages are written, but the process dies before the journal is removed
+        with mock.patch.object(btree.os, "remove", side_effect=OSError("crash")):
+            with self.assertRaises(OSError):
+                self.tree.commit()
+        self.assertTrue(os.path.exists(self.path + "-journal"))
+        self.tree._close_file()
+
+        self.tree = self._open()
+        self.assertTrue(self.tree.reused)
+        self.assertFalse(os.path.exists(self.path + "-journal"))
+        self.assertEqual(len(self.tree), 200)
+        self.assertEqual(self._numbers(), list(range(200)))
+
+
+if __name__ == "__main__":
+    unittest.main()
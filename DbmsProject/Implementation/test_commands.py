@@ -0,0 +1,126 @@
+# test_commands.py
+# CREATE TABLE's catalog entry, DELETE by key and LOAD DATA, run as a client sends them
+# through process_command:
+#
+#   python -m unittest test_commands
+import os
+import unittest
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class CreateTableTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE creating",
+            "USE creating",
+            "CREATE TABLE t (id INT PRIMARY KEY, f FLOAT, v VARCHAR(10), d DATE)",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE creating")
+
+    def test_row_length_is_the_slot_size(self):
+        from db_catalog import get_table
+        from db_operations import engine
+        from record_codec import attribute_width
+        table_info = get_table("creating", "t")
+        self.assertEqual([attr['length'] for attr in table_info['structure']], ['', '', '10', ''])
+        # Status byte, null bitmap, two 8-byte numbers, then length-prefixed text
+        date_width = attribute_width({'type': "DATE", 'length': ''})
+        self.assertEqual(table_info['row_length'], str(1 + 1 + 8 + 8 + (2 + 10) + (2 + date_width)))
+        store = engine.table("creating", "t")
+        if hasattr(store, "slot_size"):
+            self.assertEqual(table_info['row_length'], str(store.slot_size))
+
+
+class DeleteByKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE commands",
+            "USE commands",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))",
+            "CREATE TABLE pair (a INT PRIMARY KEY, b VARCHAR(10) PRIMARY KEY, v INT)",
+            "INSERT INTO t (id, v) VALUES (1, 'one'), (2, 'two')",
+            "INSERT INTO pair (a, b, v) VALUES (1, 'x', 10), (2, 'y', 20)",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE commands")
+
+    def _ids(self, table, column):
+        return test_support.column_values(test_support.run(self.session, f"SELECT {column} FROM {table}"), column)
+
+    def test_key_is_normalized_like_the_column(self):
+        # '01' is the INT key 1, whether it is given through key or through the column
+        self.assertIn("deleted successfully", test_support.run(self.session, "DELETE FROM t WHERE key = '01'"))
+        self.assertEqual(self._ids("t", "id"), ["2"])
+        self.assertIn("deleted successfully", test_support.run(self.session, "DELETE FROM t WHERE id = '02'"))
+        self.assertEqual(self._ids("t", "id"), [])
+
+    def test_numeric_key(self):
+        self.assertIn("deleted successfully", test_support.run(self.session, "DELETE FROM t WHERE key = 2.0"))
+        self.assertEqual(self._ids("t", "id"), ["1"])
+
+    def test_composite_key(self):
+        self.assertIn("deleted successfully", test_support.run(self.session, "DELETE FROM pair WHERE key = '02#y'"))
+        self.assertEqual(self._ids("pair", "a"), ["1"])
+
+    def test_key_with_wrong_number_of_parts(self):
+        self.assertEqual(test_support.run(self.session, "DELETE FROM pair WHERE key = '1'"),
+                         "No record found with the given primary key.")
+        self.assertEqual(test_support.run(self.session, "DELETE FROM t WHERE key = '1#x'"),
+                         "No record found with the given primary key.")
+        self.assertEqual(sorted(self._ids("t", "id")), ["1", "2"])
+
+
+class LoadDataTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE loading",
+            "USE loading",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10), n INT)",
+            "CREATE TABLE copy (id INT PRIMARY KEY, v VARCHAR(10), n INT)",
+            "INSERT INTO t (id, v, n) VALUES (1, 'a', 10), (2, NULL, 20), (3, 'c', NULL)",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE loading")
+
+    def _rows(self, table):
+        result = test_support.run(self.session, f"SELECT id, v, n FROM {table}")
+        return sorted(zip(*(test_support.column_values(result, column) for column in ("id", "v", "n"))))
+
+    def test_file_under_the_file_directory(self):
+        from bulk_loader import FILE_DIR
+        os.makedirs(FILE_DIR, exist_ok=True)
+        with open(os.path.join(FILE_DIR, "rows.csv"), "w") as file:
+            file.write("id,v,n\n7,g,70\n8,,\n")
+        result = test_support.run(self.session, "LOAD DATA FROM 'rows.csv' INTO TABLE copy")
+        self.assertTrue(result.startswith("Loaded 2 of 2 row(s)"), result)
+        self.assertEqual(self._rows("copy"), [("7", "g", "70"), ("8", "NULL", "NULL")])
+
+    def test_mirror_snapshot_by_name(self):
+        import json_mirror
+        json_mirror.flush_all()
+        result = test_support.run(self.session, "LOAD DATA FROM 'loading.t.json' INTO TABLE copy")
+        self.assertTrue(result.startswith("Loaded 3 of 3 row(s)"), result)
+        self.assertEqual(self._rows("copy"), self._rows("t"))
+
+    def test_paths_outside_the_file_directory(self):
+        for path in ["../DataBase.xml", "/etc/passwd", "other.t.json", "../loading.t.json"]:
+            with self.subTest(path=path):
+                result = test_support.run(self.session, f"LOAD DATA FROM '{path}' INTO TABLE copy FORMAT JSON")
+                self.assertTrue(result.startswith("Error"), result)
+        self.assertEqual(self._rows("copy"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
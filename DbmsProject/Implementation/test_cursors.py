@@ -0,0 +1,104 @@
+# test_cursors.py
+# OPEN / FETCH / CLOSE read a SELECT result a batch at a time, and EXPORT TABLE writes
+# a table out in a form LOAD DATA reads back:
+#
+#   python -m unittest test_cursors
+import unittest
+
+import test_support
+
+ROW_COUNT = 25
+
+
+def setUpModule():
+    test_support.start()
+
+
+class CursorTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE cursors",
+            "USE cursors",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10), n INT)",
+            "CREATE TABLE copy (id INT PRIMARY KEY, v VARCHAR(10), n INT)",
+            "INSERT INTO t (id, v, n) VALUES " + ", ".join(
+                f"({i}, 'v{i}', {'NULL' if i % 5 == 0 else i * 10})" for i in range(ROW_COUNT)),
+        ])
+
+    def tearDown(self):
+        for name in list(self.session.cursors):
+            test_support.run(self.session, f"CLOSE {name}")
+        test_support.run(self.session, "DROP DATABASE cursors")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def _fetch(self, command):
+        # (ids of the batch, status line)
+        lines = self._run(command).splitlines()
+        return [int(value) for value in test_support.column_values("\n".join(lines[:-1]), "id")], lines[-1]
+
+    def test_fetch_in_batches(self):
+        self.assertEqual(self._run("OPEN c FOR SELECT id, v FROM t WHERE id < 10 ORDER BY id"),
+                         "Cursor c opened on columns id, v.")
+        ids, status = self._fetch("FETCH 4 FROM c")
+        self.assertEqual(ids, [0, 1, 2, 3])
+        self.assertEqual(status, "-- more rows available, FETCH again from cursor c")
+        ids, _ = self._fetch("FETCH 4 FROM c")
+        self.assertEqual(ids, [4, 5, 6, 7])
+        # The batch that reaches the end says so, even when it is full
+        ids, status = self._fetch("FETCH 2 FROM c")
+        self.assertEqual(ids, [8, 9])
+        self.assertEqual(status, "-- end of cursor c, 10 row(s) in total; CLOSE it to release it")
+        ids, _ = self._fetch("FETCH 2 FROM c")
+        self.assertEqual(ids, [])
+        self.assertEqual(self._run("CLOSE c"), "Cursor c closed after 10 row(s).")
+        self.assertEqual(self._run("FETCH FROM c"), "Error: No open cursor named c.")
+
+    def test_batches_cover_the_select_result(self):
+        test_support.run_all(self.session, ["OPEN FOR SELECT id FROM t WHERE n > 50"])
+        fetched = []
+        while True:
+            ids, status = self._fetch("FETCH 7")
+            fetched.extend(ids)
+            if status.startswith("-- end"):
+                break
+        expected = [int(value) for value in test_support.column_values(
+            self._run("SELECT id FROM t WHERE n > 50"), "id")]
+        self.assertEqual(sorted(fetched), sorted(expected))
+        self.assertEqual(self._run("CLOSE"), f"Cursor default closed after {len(expected)} row(s).")
+
+    def test_cursor_errors(self):
+        self.assertEqual(self._run("CLOSE nothing"), "Error: No open cursor named nothing.")
+        test_support.run_all(self.session, ["OPEN c FOR SELECT id FROM t"])
+        self.assertEqual(self._run("OPEN c FOR SELECT id FROM t"), "Error: Cursor c is already open.")
+        self.assertEqual(self._run("FETCH 0 FROM c"), "Error: FETCH needs a positive row count.")
+        self.assertTrue(self._run("OPEN d FOR SELECT id FROM missing").startswith("Error"))
+        self.assertNotIn("d", self.session.cursors)
+
+    def test_close_releases_the_cursor(self):
+        import cursors
+        for number in range(cursors.MAX_CURSORS):
+            test_support.run_all(self.session, [f"OPEN c{number} FOR SELECT id FROM t"])
+        self.assertEqual(self._run("OPEN extra FOR SELECT id FROM t"),
+                         f"Error: At most {cursors.MAX_CURSORS} cursors can be open on one connection.")
+        ids, _ = self._fetch("FETCH 3 FROM c0")
+        self.assertEqual(len(ids), 3)
+        self.assertEqual(self._run("CLOSE c0"), "Cursor c0 closed after 3 row(s).")
+        test_support.run_all(self.session, ["OPEN extra FOR SELECT id FROM t"])
+
+    def test_export_reads_back(self):
+        for path in ["t.csv", "t.json", "t.jsonl.gz"]:
+            with self.subTest(path=path):
+                result = self._run(f"EXPORT TABLE t TO '{path}'")
+                self.assertTrue(result.startswith(f"Exported {ROW_COUNT} row(s) from table t to {path}"), result)
+                result = self._run(f"LOAD DATA FROM '{path}' INTO TABLE copy")
+                self.assertTrue(result.startswith(f"Loaded {ROW_COUNT} of {ROW_COUNT} row(s)"), result)
+                self.assertEqual(self._run("SELECT * FROM copy ORDER BY id"), self._run("SELECT * FROM t ORDER BY id"))
+                test_support.run_all(self.session, ["DROP TABLE copy",
+                                                    "CREATE TABLE copy (id INT PRIMARY KEY, v VARCHAR(10), n INT)"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+# test_foreign_keys.py
+# Foreign key enforcement: inserts need an existing parent, referenced parents cannot
+# be deleted, and deferred checks report every violation at the end. Both the indexed
+# lookups and the table scans used when no index can be had are covered:
+#
+#   python -m unittest test_foreign_keys
+import unittest
+from unittest import mock
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class ForeignKeyTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE fk",
+            "USE fk",
+            # Referenced through the whole primary key
+            "CREATE TABLE parent (id INT PRIMARY KEY, name VARCHAR(10))",
+            "CREATE TABLE child (cid INT PRIMARY KEY, pid INT, FOREIGN KEY (pid) REFERENCES parent(id))",
+            # Referenced through part of a composite key
+            "CREATE TABLE pair (code VARCHAR(10), n INT, PRIMARY KEY (code, n))",
+            "CREATE TABLE ref (rid INT PRIMARY KEY, code VARCHAR(10), FOREIGN KEY (code) REFERENCES pair(code))",
+            # A text key that reads like Python's None
+            "CREATE TABLE tag (code VARCHAR(10) PRIMARY KEY)",
+            "CREATE TABLE note (nid INT PRIMARY KEY, code VARCHAR(10), FOREIGN KEY (code) REFERENCES tag(code))",
+            "INSERT INTO parent (id, name) VALUES (1, 'one'), (2, 'two')",
+            "INSERT INTO pair (code, n) VALUES ('a', 1), ('a', 2), ('b', 1)",
+            "INSERT INTO tag (code) VALUES ('None'), ('x')",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE fk")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def _ids(self, table, column):
+        return sorted(test_support.column_values(self._run(f"SELECT {column} FROM {table}"), column))
+
+    def test_insert_needs_a_parent(self):
+        self.assertEqual(self._run("INSERT INTO child (cid, pid) VALUES (10, 3)"),
+                         "Error: Foreign key pid = 3 has no matching id in table parent.")
+        self.assertIn("inserted successfully", self._run("INSERT INTO child (cid, pid) VALUES (10, 1)"))
+        # Normalized like the parent's key, and a missing value needs no parent
+        self.assertIn("inserted successfully", self._run("INSERT INTO child (cid, pid) VALUES (11, '02')"))
+        self.assertIn("inserted successfully", self._run("INSERT INTO child (cid, pid) VALUES (12, NULL)"))
+        self.assertEqual(self._ids("child", "cid"), ["10", "11", "12"])
+
+    def test_batch_rejects_only_the_orphans(self):
+        result = self._run("INSERT INTO child (cid, pid) VALUES (10, 1), (11, 9), (12, 2)")
+        self.assertIn("2 of 3", result)
+        self.assertIn("pid = 9", result)
+        self.assertEqual(self._ids("child", "cid"), ["10", "12"])
+
+    def test_part_of_a_composite_key(self):
+        self.assertIn("inserted successfully", self._run("INSERT INTO ref (rid, code) VALUES (1, 'b')"))
+        self.assertEqual(self._run("INSERT INTO ref (rid, code) VALUES (2, 'c')"),
+                         "Error: Foreign key code = c has no matching code in table pair.")
+        self.assertEqual(self._run("INSERT INTO ref (rid, code) VALUES (3, 'None')"),
+                         "Error: Foreign key code = None has no matching code in table pair.")
+
+    def test_referenced_parent_cannot_be_deleted(self):
+        test_support.run_all(self.session, ["INSERT INTO child (cid, pid) VALUES (10, 1)"])
+        self.assertEqual(self._run("DELETE FROM parent WHERE id = 1"),
+                         "Error: Cannot delete key 1 from table parent: it is referenced by child.pid.")
+        self.assertIn("deleted successfully", self._run("DELETE FROM parent WHERE id = 2"))
+        self.assertIn("deleted successfully", self._run("DELETE FROM child WHERE cid = 10"))
+        self.assertIn("deleted successfully", self._run("DELETE FROM parent WHERE id = 1"))
+
+    def test_referenced_parent_with_child_index(self):
+        test_support.run_all(self.session, ["CREATE INDEX child_pid ON child (pid)",
+                                            "INSERT INTO child (cid, pid) VALUES (10, 1)"])
+        self.assertIn("referenced by child.pid", self._run("DELETE FROM parent WHERE id = 1"))
+        self.assertIn("deleted successfully", self._run("DELETE FROM parent WHERE id = 2"))
+
+    def test_missing_child_value_references_nothing(self):
+        # A NULL foreign key is no reference, not even to a parent whose key reads 'None'
+        test_support.run_all(self.session, ["INSERT INTO note (nid, code) VALUES (1, NULL), (2, 'x')"])
+        self.assertIn("deleted successfully", self._run("DELETE FROM tag WHERE code = 'None'"))
+        self.assertIn("referenced by note.code", self._run("DELETE FROM tag WHERE code = 'x'"))
+
+    def test_deferred_checks(self):
+        self.assertEqual(self._run("SET foreign_key_checks = DEFERRED"),
+                         "Foreign key checks deferred until SET foreign_key_checks = IMMEDIATE.")
+        # A child before its parent, and one that never gets a parent
+        test_support.run_all(self.session, [
+            "INSERT INTO child (cid, pid) VALUES (10, 3)",
+            "INSERT INTO parent (id, name) VALUES (3, 'three')",
+            "INSERT INTO child (cid, pid) VALUES (11, 4), (12, 1)",
+        ])
+        result = self._run("SET foreign_key_checks = IMMEDIATE")
+        self.assertEqual(result.splitlines(), [
+            "Error: 1 deferred foreign key violation(s):",
+            "child key 11: Error: Foreign key pid = 4 has no matching id in table parent.",
+        ])
+        # Checks are immediate again
+        self.assertIn("Error", self._run("INSERT INTO child (cid, pid) VALUES (13, 5)"))
+        self.assertEqual(self._run("SET foreign_key_checks = IMMEDIATE"), "Foreign key checks are immediate.")
+
+
+class ScanFallbackTest(ForeignKeyTest):
+    """The same checks through the table scans used when no index can be had."""
+
+    def setUp(self):
+        import index_manager
+        patch = mock.patch.object(index_manager, "find_index", return_value=None)
+        patch.start()
+        self.addCleanup(patch.stop)
+        super().setUp()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# test_group_commit.py
+# Single-row INSERTs and DELETEs from concurrent sessions are written together, and
+# every session still gets the response for its own statement:
+#
+#   python -m unittest test_group_commit
+import threading
+import time
+import unittest
+from unittest import mock
+
+import test_support
+
+SESSIONS = 20
+
+
+def setUpModule():
+    test_support.start()
+
+
+class GroupCommitTest(unittest.TestCase):
+    def setUp(self):
+        import group_commit
+        if not group_commit.GROUP_COMMIT:
+            self.skipTest("group commit is disabled")
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE grouping",
+            "USE grouping",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))",
+        ])
+        # Batch sizes of the flushes; the first one is slow, so the others queue up behind it
+        self.batches = []
+        original = group_commit.insert_statements
+
+        def insert_statements(table_name, statements, db_name):
+            self.batches.append(len(statements))
+            if len(self.batches) == 1:
+                time.sleep(0.2)
+            return original(table_name, statements, db_name)
+
+        patch = mock.patch.object(group_commit, "insert_statements", side_effect=insert_statements)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE grouping")
+
+    def _concurrently(self, commands):
+        # Runs each command from its own session; returns the responses in command order
+        responses = [None] * len(commands)
+        start = threading.Barrier(len(commands))
+
+        def worker(number):
+            session = test_support.new_session()
+            test_support.run(session, "USE grouping")
+            start.wait()
+            responses[number] = test_support.run(session, commands[number])
+
+        threads = [threading.Thread(target=worker, args=(number,)) for number in range(len(commands))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return responses
+
+    def _ids(self):
+        return sorted(int(value) for value in test_support.column_values(self._run("SELECT id FROM t"), "id"))
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def test_inserts_share_flushes(self):
+        responses = self._concurrently([f"INSERT INTO t (id, v) VALUES ({i}, 'v{i}')" for i in range(SESSIONS)])
+        for response in responses:
+            self.assertIn("inserted successfully", response)
+        self.assertEqual(sum(self.batches), SESSIONS)
+        self.assertLess(len(self.batches), SESSIONS)
+        self.assertGreater(max(self.batches), 1)
+        self.assertEqual(self._ids(), list(range(SESSIONS)))
+
+    def test_each_session_gets_its_own_response(self):
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (0, 'old')"])
+        commands = [f"INSERT INTO t (id, v) VALUES ({i % 10}, 'v{i}')" for i in range(SESSIONS)]
+        responses = self._concurrently(commands)
+        duplicates = [number for number, response in enumerate(responses)
+                      if response == "Error: Record with this primary key already exists."]
+        inserted = [number for number, response in enumerate(responses) if "inserted successfully" in response]
+        # Key 0 was taken; every other key is won by exactly one of its two sessions
+        self.assertEqual(len(inserted), 9)
+        self.assertEqual(len(duplicates), SESSIONS - 9)
+        self.assertEqual(sorted(number % 10 for number in inserted), list(range(1, 10)))
+        self.assertEqual(self._ids(), list(range(10)))
+
+    def test_deletes_and_inserts_mix(self):
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES " +
+                                            ", ".join(f"({i}, 'v{i}')" for i in range(10))])
+        commands = ([f"DELETE FROM t WHERE id = {i}" for i in range(10)] +
+                    [f"INSERT INTO t (id, v) VALUES ({i}, 'v{i}')" for i in range(10, 20)])
+        responses = self._concurrently(commands)
+        for response in responses[:10]:
+            self.assertIn("deleted successfully", response)
+        for response in responses[10:]:
+            self.assertIn("inserted successfully", response)
+        self.assertEqual(self._ids(), list(range(10, 20)))
+
+    def test_failed_flush_answers_every_waiting_session(self):
+        import group_commit
+        with mock.patch.object(group_commit, "insert_statements", side_effect=RuntimeError("backend down")), \
+                self.assertLogs("dbms.commands", "ERROR"):
+            responses = self._concurrently([f"INSERT INTO t (id, v) VALUES ({i}, 'v{i}')" for i in range(5)])
+        for response in responses:
+            self.assertTrue(response.startswith("Error"), response)
+        # Nothing is left holding the queue
+        self.assertIn("inserted successfully", self._run("INSERT INTO t (id, v) VALUES (1, 'v1')"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+# test_index_seek.py
+# An index seek must return exactly the rows a full scan returns, whatever literal the
+# WHERE clause compares with. Runs on either engine (see test_support):
+#
+#   python -m unittest test_index_seek
+import unittest
+
+import test_support
+
+ROWS = [(number, number * 7 % 31 - 5, number * 0.75, f"name {number % 13}") for number in range(80)]
+
+QUERIES = [
+    "SELECT id FROM t WHERE a > 15.5",
+    "SELECT id FROM t WHERE a >= 15.5",
+    "SELECT id FROM t WHERE a < 15.5",
+    "SELECT id FROM t WHERE a <= 15.0",
+    "SELECT id FROM t WHERE a = 15.0",
+    "SELECT id FROM t WHERE a = 15.5",
+    "SELECT id FROM t WHERE a > -2.5 AND a < 4.25",
+    "SELECT id FROM t WHERE a BETWEEN 3.5 AND 7.2",
+    "SELECT id FROM t WHERE a > 'abc'",
+    "SELECT id FROM t WHERE a < 'abc'",
+    "SELECT id FROM t WHERE a = 'abc'",
+    "SELECT id FROM t WHERE a = 3 AND b > 10",
+    "SELECT id FROM t WHERE a = 3 AND b >= 10.5",
+    "SELECT id FROM t WHERE b > 20",
+    "SELECT id FROM t WHERE b <= 7",
+    "SELECT id FROM t WHERE c > 'name 5'",
+    "SELECT id FROM t WHERE c = 'name 1'",
+    "SELECT id FROM t WHERE c < 10",
+]
+
+
+def setUpModule():
+    test_support.start()
+
+
+def _ids(session, query):
+    return sorted(int(value) for value in test_support.column_values(test_support.run(session, query), "id"))
+
+
+class IndexSeekTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.session = test_support.new_session()
+        test_support.run_all(cls.session, [
+            "CREATE DATABASE seek",
+            "USE seek",
+            "CREATE TABLE t (id INT PRIMARY KEY, a INT, b FLOAT, c VARCHAR(20))",
+            "INSERT INTO t (id, a, b, c) VALUES " + ", ".join(f"({i}, {a}, {b}, '{c}')" for i, a, b, c in ROWS)
+        ])
+        # Results before any index exists come from full scans
+        cls.expected = {query: _ids(cls.session, query) for query in QUERIES}
+        test_support.run_all(cls.session, ["CREATE INDEX ia ON t (a)", "CREATE INDEX iab ON t (a, b)",
+                                           "CREATE INDEX ib ON t (b)", "CREATE INDEX ic ON t (c)"])
+
+    def test_full_scan_results(self):
+        self.assertEqual(self.expected["SELECT id FROM t WHERE a > 15.5"],
+                         sorted(i for i, a, _, _ in ROWS if a > 15.5))
+        self.assertEqual(self.expected["SELECT id FROM t WHERE a = 15.0"],
+                         sorted(i for i, a, _, _ in ROWS if a == 15))
+
+    def test_index_seek_matches_full_scan(self):
+        for query in QUERIES:
+            with self.subTest(query=query):
+                self.assertEqual(_ids(self.session, query), self.expected[query])
+
+    def test_numeric_bound_uses_index(self):
+        self.assertIn("INDEX SEEK", test_support.run(self.session, "EXPLAIN SELECT id FROM t WHERE a > 15.5"))
+
+    def test_text_bound_on_number_column_is_filtered(self):
+        self.assertIn("FULL SCAN", test_support.run(self.session, "EXPLAIN SELECT id FROM t WHERE a > 'abc'"))
+
+
+class SortedIndexTest(unittest.TestCase):
+    def _index(self):
+        from index_manager import SortedIndex
+        return SortedIndex({'name': 'ia', 'columns': ['a'], 'is_unique': False}, ["INT"])
+
+    def test_insert_keeps_the_load_order(self):
+        # Many rows share each key; inserted one at a time in any order they have to end
+        # up where a bulk load puts them: by key, then by primary key
+        rows = [({"a": str(number % 4)}, f"{number:03}") for number in range(40)]
+        loaded = self._index()
+        loaded.load([loaded.make_entry(row, primary_key) for row, primary_key in rows])
+        inserted = self._index()
+        for row, primary_key in reversed(rows):
+            inserted.insert(*inserted.make_entry(row, primary_key))
+        self.assertEqual(list(inserted.entries()), list(loaded.entries()))
+        self.assertEqual(inserted.lookup(inserted.make_key({"a": "1"})), [f"{n:03}" for n in range(1, 40, 4)])
+        self.assertTrue(inserted.delete(inserted.make_key({"a": "1"}), "021"))
+        self.assertNotIn("021", inserted.lookup(inserted.make_key({"a": "1"})))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+# test_row_cache.py
+# The MongoDB engine's primary-key row cache has to agree with the collection after
+# deletes and after a failed COMMIT puts rows back. On the local engine, which has no
+# row cache, the same statements only check the results:
+#
+#   python -m unittest test_row_cache
+import unittest
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class RowCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE caching",
+            "USE caching",
+            "CREATE TABLE item (id INT PRIMARY KEY, name VARCHAR(10))",
+            "INSERT INTO item (id, name) VALUES (1, 'one'), (2, 'two'), (3, 'three')",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "ROLLBACK")
+        test_support.run(self.session, "DROP DATABASE caching")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def _name(self, key):
+        return test_support.column_values(self._run(f"SELECT name FROM item WHERE id = {key}"), "name")
+
+    def _assert_cache_matches_backend(self):
+        import row_cache
+        from db_operations import engine
+        store = engine.table("caching", "item")
+        if getattr(store, "cache", None) is None:
+            return
+        entries = dict(store.cache.entries)
+        self.assertTrue(entries)
+        for key, entry in entries.items():
+            document = store.collection.find_one({"_id": key})
+            if entry is row_cache.ABSENT:
+                self.assertIsNone(document, f"key {key} is cached as absent")
+            else:
+                self.assertIsNotNone(document, f"key {key} is cached as present")
+                if isinstance(entry, dict):
+                    self.assertEqual(entry["row"], document["row"])
+
+    def test_delete_invalidates(self):
+        # Read first, so the rows are cached
+        self.assertEqual(self._name(2), ["two"])
+        self.assertEqual(self._name(4), [])
+        self.assertIn("deleted successfully", self._run("DELETE FROM item WHERE id = 2"))
+        self._assert_cache_matches_backend()
+        self.assertEqual(self._name(2), [])
+        # The key is free again, and the new row is what is read back
+        self.assertIn("inserted successfully", self._run("INSERT INTO item (id, name) VALUES (2, 'deux')"))
+        self.assertEqual(self._name(2), ["deux"])
+        self.assertEqual(self._run("INSERT INTO item (id, name) VALUES (2, 'again')"),
+                         "Error: Record with this primary key already exists.")
+        self._assert_cache_matches_backend()
+
+    def test_delete_after_duplicate_check(self):
+        # A rejected duplicate only caches that the key has a row, not the row itself
+        self.assertEqual(self._run("INSERT INTO item (id, name) VALUES (3, 'dup')"),
+                         "Error: Record with this primary key already exists.")
+        self.assertIn("deleted successfully", self._run("DELETE FROM item WHERE id = 3"))
+        self._assert_cache_matches_backend()
+        self.assertEqual(self._name(3), [])
+        self.assertIn("inserted successfully", self._run("INSERT INTO item (id, name) VALUES (3, 'trois')"))
+        self.assertEqual(self._name(3), ["trois"])
+
+    def test_failed_commit_restores_the_cache(self):
+        self.assertEqual(self._name(2), ["two"])
+        self.assertEqual(self._name(5), [])
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "DELETE FROM item WHERE id = 2",
+            "INSERT INTO item (id, name) VALUES (5, 'five')",
+            # Only found at COMMIT: 1 is already in the backend
+            "INSERT INTO item (id, name) VALUES (1, 'dup')",
+        ])
+        self.assertIn("The transaction was rolled back.", self._run("COMMIT"))
+        # The undo put 2 back and took 5 out again, through the same store
+        self._assert_cache_matches_backend()
+        self.assertEqual(self._name(2), ["two"])
+        self.assertEqual(self._name(5), [])
+        self.assertEqual(self._run("INSERT INTO item (id, name) VALUES (2, 'again')"),
+                         "Error: Record with this primary key already exists.")
+        self.assertIn("inserted successfully", self._run("INSERT INTO item (id, name) VALUES (5, 'five')"))
+        self._assert_cache_matches_backend()
+
+    def test_drop_table_forgets_the_cache(self):
+        self.assertEqual(self._name(1), ["one"])
+        test_support.run_all(self.session, [
+            "DROP TABLE item",
+            "CREATE TABLE item (id INT PRIMARY KEY, name VARCHAR(10))",
+        ])
+        self.assertEqual(self._name(1), [])
+        self.assertIn("inserted successfully", self._run("INSERT INTO item (id, name) VALUES (1, 'uno')"))
+        self.assertEqual(self._name(1), ["uno"])
+
+
+class LruTest(unittest.TestCase):
+    def test_least_recently_used_goes_first(self):
+        import row_cache
+        entry_size = row_cache.ENTRY_OVERHEAD + 1
+        cache = row_cache.RowCache(3 * entry_size)
+        for key in "abc":
+            cache.put(key, row_cache.PRESENT)
+        cache.lookup(["a"], False)
+        cache.put("d", row_cache.ABSENT)
+        self.assertEqual(list(cache.entries), ["c", "a", "d"])
+        self.assertEqual(cache.size, 3 * entry_size)
+        # A PRESENT entry does not answer a lookup that needs the document
+        found, missing = cache.lookup(["a", "d", "x"], True)
+        self.assertEqual((found, missing), ({"d": row_cache.ABSENT}, ["a", "x"]))
+        cache.discard("a")
+        self.assertEqual(cache.size, 2 * entry_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
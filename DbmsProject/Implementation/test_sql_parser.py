@@ -0,0 +1,136 @@
+# test_sql_parser.py
+# What parse_statement makes of a command, the errors it reports for malformed ones, and
+# the statement cache: templates are shared by every session, so running a statement
+# must never change the template it was bound from.
+#
+#   python -m unittest test_sql_parser
+import copy
+import unittest
+
+import test_support
+from sql_parser import Delete, Explain, Insert, Select, clear_statement_cache, parse_statement
+import sql_parser
+
+# (command, attribute, expected value of that attribute)
+CASES = [
+    # Quoted literals keep separators, quotes and keywords as text
+    ("INSERT INTO t (a, b) VALUES ('x, y', 'p#q')", "rows", [["x, y", "p#q"]]),
+    ("INSERT INTO t (a, b) VALUES ('it''s', \"say \"\"hi\"\"\")", "rows", [["it's", 'say "hi"']]),
+    ("INSERT INTO t (a, b) VALUES ('SELECT', 'FROM t WHERE')", "rows", [["SELECT", "FROM t WHERE"]]),
+    ("SELECT a FROM t WHERE b = 'x AND c = 1'", "where", ('cmp', 'b', '=', 'x AND c = 1')),
+    ("DELETE FROM t WHERE key = '1#x'", "where", ('cmp', 'key', '=', '1#x')),
+    # NULL and the empty string are both the missing value
+    ("INSERT INTO t (a, b, c) VALUES (NULL, '', null)", "rows", [["", "", ""]]),
+    # Numbers are kept as their text
+    ("INSERT INTO t (a, b) VALUES (-1.5, 007)", "rows", [["-1.5", "007"]]),
+    ("INSERT INTO t (a, b) VALUES (1, 'a'), (2, 'b'), (3, NULL)", "rows", [["1", "a"], ["2", "b"], ["3", ""]]),
+    # AND binds tighter than OR; parentheses override it
+    ("SELECT a FROM t WHERE a = 1 OR b = 2 AND c = 3", "where",
+     ('or', [('cmp', 'a', '=', '1'), ('and', [('cmp', 'b', '=', '2'), ('cmp', 'c', '=', '3')])])),
+    ("SELECT a FROM t WHERE (a = 1 OR b = 2) AND c <> 'x'", "where",
+     ('and', [('or', [('cmp', 'a', '=', '1'), ('cmp', 'b', '=', '2')]), ('cmp', 'c', '!=', 'x')])),
+    ("SELECT a FROM t WHERE a = 1 AND b = 2 AND c = 3", "where",
+     ('and', [('cmp', 'a', '=', '1'), ('cmp', 'b', '=', '2'), ('cmp', 'c', '=', '3')])),
+    ("SELECT a FROM t WHERE a BETWEEN 1 AND 5", "where", ('and', [('cmp', 'a', '>=', '1'), ('cmp', 'a', '<=', '5')])),
+    ("SELECT a, COUNT(*) FROM t GROUP BY a ORDER BY COUNT(*) DESC, a LIMIT 3", "order_by",
+     [("COUNT(*)", True), ("a", False)]),
+]
+
+# (command, error message)
+ERRORS = [
+    ("", "Empty command."),
+    ("FROB t", "Unknown command 'FROB'."),
+    ("SELECT a FROM", "Expected table name but found end of command."),
+    ("SELECT a FROM t WHERE a", "Expected a comparison after 'a' but found end of command."),
+    ("SELECT a FROM t WHERE a = 1 extra", "Unexpected 'extra' at end of command."),
+    ("SELECT a FROM t WHERE a @ 1", "Unexpected character '@' in command."),
+    ("SELECT a FROM t WHERE a = 'open", "Unexpected character ''' in command."),
+    ("INSERT INTO t (a) VALUES (1", "Expected ')' but found end of command."),
+    ("INSERT INTO t a VALUES (1)", "Expected '(' but found 'a'."),
+    ("INSERT INTO t (a) VALUES (1,)", "Expected a value but found ')'."),
+    ("SELECT SUM(*) FROM t", "SUM(*) is not allowed; only COUNT(*) is."),
+    ("SELECT FOO(a) FROM t", "Unknown function FOO; expected one of COUNT, SUM, AVG, MIN, MAX."),
+    ("SELECT *, COUNT(*) FROM t", "SELECT * cannot be combined with aggregates or GROUP BY."),
+    ("SELECT a FROM t JOIN u ON a < b", "Only equality join conditions are supported."),
+    ("CREATE TABLE t (a VARCHAR(x))", "Expected a number but found 'x'."),
+    ("EXPLAIN DELETE FROM t", "Expected SELECT but found 'DELETE'."),
+]
+
+
+def setUpModule():
+    test_support.start()
+
+
+class ParserTest(unittest.TestCase):
+    def setUp(self):
+        clear_statement_cache()
+
+    def test_statements(self):
+        for command, attribute, expected in CASES:
+            with self.subTest(command=command):
+                self.assertEqual(getattr(parse_statement(command), attribute), expected)
+
+    def test_statement_types(self):
+        self.assertIsInstance(parse_statement("INSERT INTO t (a) VALUES (1), (2)"), Insert)
+        self.assertIsInstance(parse_statement("DELETE FROM t WHERE key = 1"), Delete)
+        explain = parse_statement("EXPLAIN SELECT a FROM t WHERE a > 2")
+        self.assertIsInstance(explain, Explain)
+        self.assertIsInstance(explain.statement, Select)
+        self.assertEqual(explain.statement.where, ('cmp', 'a', '>', '2'))
+
+    def test_errors(self):
+        for command, message in ERRORS:
+            with self.subTest(command=command):
+                with self.assertRaises(ValueError) as raised:
+                    parse_statement(command)
+                self.assertEqual(str(raised.exception), message)
+
+    def test_error_reaches_the_client(self):
+        session = test_support.new_session()
+        self.assertIn("Unexpected 'extra' at end of command.",
+                      test_support.run(session, "SELECT a FROM t WHERE a = 1 extra"))
+
+    def test_template_is_reused_with_other_literals(self):
+        first = parse_statement("INSERT INTO t (a, b) VALUES (1, 'x'), (2, NULL)")
+        second = parse_statement("INSERT INTO t (a, b) VALUES (3, 'y, z'), (4, NULL)")
+        self.assertEqual(len(sql_parser._cache), 1)
+        self.assertEqual(first.rows, [["1", "x"], ["2", ""]])
+        self.assertEqual(second.rows, [["3", "y, z"], ["4", ""]])
+
+
+class CachedStatementTest(unittest.TestCase):
+    COMMANDS = [
+        "INSERT INTO t (id, v, n) VALUES (1, 'a,b', 10), (2, 'it''s', NULL), (3, '#', 30)",
+        "SELECT id, v FROM t WHERE n > 5 AND (v = 'a,b' OR id = 3) ORDER BY id DESC LIMIT 2",
+        "SELECT v, COUNT(*) FROM t WHERE id BETWEEN 1 AND 3 GROUP BY v ORDER BY COUNT(*) DESC",
+        "EXPLAIN SELECT id FROM t WHERE id = 2 AND n = 20",
+        "SELECT t.id, u.w FROM t JOIN u ON t.id = u.id WHERE t.id = 1",
+        "DELETE FROM t WHERE id = 2",
+        "DELETE FROM t WHERE key = '3'",
+    ]
+
+    def test_execution_leaves_templates_unchanged(self):
+        session = test_support.new_session()
+        test_support.run_all(session, ["CREATE DATABASE parsing", "USE parsing",
+                                       "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10), n INT)",
+                                       "CREATE TABLE u (id INT PRIMARY KEY, w VARCHAR(10))",
+                                       "CREATE INDEX tn ON t (n)"])
+        try:
+            clear_statement_cache()
+            for command in self.COMMANDS:
+                with self.subTest(command=command):
+                    parse_statement(command)
+                    normalized = sql_parser.extract_literals(command)[0]
+                    before = copy.deepcopy(sql_parser._cache[normalized])
+                    result = test_support.run(session, command)
+                    self.assertFalse(result.startswith("Error"), result)
+                    self.assertEqual(repr(sql_parser._cache[normalized]), repr(before))
+                    # Running it again binds the same statement
+                    self.assertEqual(repr(parse_statement(command)), repr(before.bind(
+                        sql_parser.extract_literals(command)[1])))
+        finally:
+            test_support.run(session, "DROP DATABASE parsing")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+# test_support.py
+# Set-up shared by the test modules. All of them run in one scratch working directory
+# per process (the catalog, data, index and mirror files are relative to it), on the
+# in-memory MongoDB stand-in or, with DBMS_STORAGE_ENGINE=local, on the local engine.
+# The server modules bind the engine when they are imported, so it is only set once;
+# each test module uses its own database names instead.
+import atexit
+import os
+import shutil
+import tempfile
+
+# Set before the server modules read them: no log file in the scratch directory
+os.environ.setdefault("DBMS_WAL", "0")
+
+_previous_dir = None
+_work_dir = None
+
+
+def start():
+    """Create the scratch directory, engine and catalog the first time it is called."""
+    global _previous_dir, _work_dir
+    if _work_dir is not None:
+        return _work_dir
+    _previous_dir = os.getcwd()
+    _work_dir = tempfile.mkdtemp(prefix="dbms-test-")
+    os.chdir(_work_dir)
+    import metrics
+    metrics.configure_logging("ERROR")
+
+    # The engine has to be in place before the server modules bind it
+    import storage_engine
+    if storage_engine.STORAGE_ENGINE == "local":
+        storage_engine.set_engine(storage_engine.LocalEngine(os.path.abspath("data")))
+    else:
+        from memory_mongo import MemoryMongoClient
+        storage_engine.set_engine(storage_engine.MongoEngine(client=MemoryMongoClient()))
+    from db_catalog import init_catalog
+    init_catalog()
+    atexit.register(_remove_work_dir)
+    return _work_dir
+
+
+def _remove_work_dir():
+    import json_mirror
+    json_mirror.flush_all()
+    os.chdir(_previous_dir)
+    shutil.rmtree(_work_dir, ignore_errors=True)
+
+
+def use_log(test, name):
+    """Log to a fresh file in the scratch directory until the test ends; returns its path.
+
+    The log is not registered for a checkpoint at exit, unlike the one wal.get_log() opens.
+    """
+    from unittest import mock
+    import wal
+    path = os.path.abspath(name)
+    if os.path.exists(path):
+        os.remove(path)
+    log = wal.WriteAheadLog(path)
+    for patch in [mock.patch.object(wal, "WAL_ENABLED", True), mock.patch.object(wal, "WAL_FILE", path),
+                  mock.patch.object(wal, "_log", log)]:
+        patch.start()
+        test.addCleanup(patch.stop)
+    # Cleanups run last first: this one before the patches are undone
+    test.addCleanup(log.file.close)
+    test.addCleanup(lambda: wal.get_log().drain())
+    return path
+
+
+def new_session():
+    from session import Session
+    return Session()
+
+
+def run(session, command):
+    from server_commands import process_command
+    return process_command(command, session)
+
+
+def run_all(session, commands):
+    """Run set-up commands, failing on the first error."""
+    for command in commands:
+        result = run(session, command)
+        if result.startswith("Error"):
+            raise AssertionError(f"{command}: {result}")
+
+
+def column_values(result, column):
+    """The values of one column of a SELECT result, in result order."""
+    lines = result.splitlines()
+    if not lines or "(" not in lines[-1]:
+        raise AssertionError(result)
+    header = lines[0].split(" | ")
+    if column not in header:
+        raise AssertionError(result)
+    position = header.index(column)
+    return [line.split(" | ")[position] for line in lines[1:-1]]
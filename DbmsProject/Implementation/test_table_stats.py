@@ -0,0 +1,84 @@
+# test_table_stats.py
+# ANALYZE TABLE statistics: the row estimates EXPLAIN shows, their upkeep on inserts
+# and deletes, and reading them back from the catalog:
+#
+#   python -m unittest test_table_stats
+import re
+import unittest
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class AnalyzeTest(unittest.TestCase):
+    def setUp(self):
+        self.session = test_support.new_session()
+        # Half the rows in group 'a', the rest spread over ten groups; every fourth n is NULL
+        rows = ", ".join(f"({i}, '{'a' if i < 100 else f'g{i % 10}'}', {'NULL' if i % 4 == 0 else i})"
+                         for i in range(200))
+        test_support.run_all(self.session, [
+            "CREATE DATABASE analyzing",
+            "USE analyzing",
+            "CREATE TABLE t (id INT PRIMARY KEY, grp VARCHAR(10), n INT)",
+            "INSERT INTO t (id, grp, n) VALUES " + rows,
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE analyzing")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def _estimate(self, where=""):
+        plan = self._run(f"EXPLAIN SELECT * FROM t {where}")
+        match = re.search(r"estimated rows: (\d+) \(from statistics\)", plan)
+        return int(match.group(1)) if match else None
+
+    def test_estimates_follow_the_data(self):
+        self.assertIsNone(self._estimate("WHERE grp = 'a'"))
+        self.assertTrue(self._run("ANALYZE TABLE t").startswith("Table t analyzed: 200 row(s), 3 column(s) in "))
+        self.assertEqual(self._estimate(), 200)
+        self.assertEqual(self._estimate("WHERE grp = 'a'"), 100)
+        self.assertEqual(self._estimate("WHERE grp = 'g3'"), 10)
+        self.assertEqual(self._estimate("WHERE grp = 'zzz'"), 0)
+        # 37 of the ids below 50 have an n; ranges are interpolated, so allow some slack
+        self.assertAlmostEqual(self._estimate("WHERE n < 50"), 37, delta=5)
+        self.assertAlmostEqual(self._estimate("WHERE n > 150 AND grp = 'g1'"), 2, delta=2)
+
+    def test_writes_keep_the_estimates_current(self):
+        test_support.run_all(self.session, [
+            "ANALYZE TABLE t",
+            "INSERT INTO t (id, grp, n) VALUES (500, 'a', 1), (501, 'a', 2)",
+            "DELETE FROM t WHERE id = 150",
+        ])
+        self.assertEqual(self._estimate(), 201)
+        self.assertEqual(self._estimate("WHERE grp = 'a'"), 102)
+
+    def test_statistics_are_read_back_from_the_catalog(self):
+        import table_stats
+        from db_catalog import load_catalog
+        test_support.run_all(self.session, ["ANALYZE TABLE t"])
+        tree = load_catalog()
+        self.assertEqual([element.get("rowCount") for element in tree.iter("Statistics")], ["200"])
+        # Forget the parsed statistics; the next plan parses them from the catalog again
+        table_stats._stats.clear()
+        self.assertEqual(self._estimate("WHERE grp = 'a'"), 100)
+
+    def test_table_created_again_has_no_statistics(self):
+        test_support.run_all(self.session, [
+            "ANALYZE TABLE t",
+            "DROP TABLE t",
+            "CREATE TABLE t (id INT PRIMARY KEY, grp VARCHAR(10), n INT)",
+        ])
+        self.assertIsNone(self._estimate())
+
+    def test_missing_table(self):
+        self.assertEqual(self._run("ANALYZE TABLE missing"),
+                         "Table 'missing' or database 'analyzing' does not exist in the catalog.")
+
+
+if __name__ == "__main__":
+    unittest.main()
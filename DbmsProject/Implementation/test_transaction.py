@@ -0,0 +1,137 @@
+# test_transaction.py
+# BEGIN ... COMMIT: buffered writes, what a session sees before COMMIT, and a failed
+# COMMIT leaving no trace in the backend or the log:
+#
+#   python -m unittest test_transaction
+import unittest
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class TransactionTest(unittest.TestCase):
+    def setUp(self):
+        self.log_path = test_support.use_log(self, "transaction.wal")
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, [
+            "CREATE DATABASE bank",
+            "USE bank",
+            "CREATE TABLE owner (id INT PRIMARY KEY, name VARCHAR(10))",
+            "CREATE TABLE account (no INT PRIMARY KEY, owner_id INT, FOREIGN KEY (owner_id) REFERENCES owner(id))",
+            "INSERT INTO owner (id, name) VALUES (1, 'ann'), (2, 'bob')",
+            "INSERT INTO account (no, owner_id) VALUES (10, 1)",
+        ])
+
+    def tearDown(self):
+        test_support.run(self.session, "ROLLBACK")
+        test_support.run(self.session, "DROP DATABASE bank")
+
+    def _run(self, command):
+        return test_support.run(self.session, command)
+
+    def _column(self, query, column):
+        return sorted(test_support.column_values(self._run(query), column))
+
+    def _write_records(self):
+        import wal
+        wal.get_log().drain()
+        return [record for record in wal.read_records(self.log_path) if record["type"] == "write"]
+
+    def test_commit_writes_one_log_record(self):
+        before = len(self._write_records())
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "INSERT INTO owner (id, name) VALUES (3, 'cy')",
+            "INSERT INTO account (no, owner_id) VALUES (30, 3), (31, 3)",
+            "DELETE FROM account WHERE no = 10",
+        ])
+        self.assertEqual(len(self._write_records()), before)
+        self.assertEqual(self._run("COMMIT"), "Transaction committed: 3 record(s) inserted, 1 record(s) deleted.")
+        records = self._write_records()
+        self.assertEqual(len(records), before + 1)
+        self.assertEqual(sorted((change[0], change[1], change[2]) for change in records[-1]["changes"]),
+                         [("account", "del", "10"), ("account", "put", "30"), ("account", "put", "31"),
+                          ("owner", "put", "3")])
+        self.assertEqual(self._column("SELECT no FROM account", "no"), ["30", "31"])
+
+    def test_duplicate_key_rolls_back_earlier_statements(self):
+        before = len(self._write_records())
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "INSERT INTO owner (id, name) VALUES (3, 'cy')",
+            "DELETE FROM account WHERE no = 10",
+            "INSERT INTO account (no, owner_id) VALUES (11, 3)",
+            # Only found at COMMIT: 2 is already in the backend
+            "INSERT INTO owner (id, name) VALUES (2, 'dup')",
+        ])
+        result = self._run("COMMIT")
+        self.assertTrue(result.startswith("Error: COMMIT failed at statement 4 (insert on table owner)"), result)
+        self.assertEqual(self._column("SELECT id FROM owner", "id"), ["1", "2"])
+        self.assertEqual(self._column("SELECT name FROM owner", "name"), ["ann", "bob"])
+        self.assertEqual(self._column("SELECT no FROM account", "no"), ["10"])
+        self.assertEqual(len(self._write_records()), before)
+
+    def test_foreign_key_violation_rolls_back_earlier_statements(self):
+        before = len(self._write_records())
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "INSERT INTO owner (id, name) VALUES (3, 'cy')",
+            "INSERT INTO account (no, owner_id) VALUES (30, 3)",
+            "DELETE FROM owner WHERE id = 2",
+            "INSERT INTO account (no, owner_id) VALUES (40, 99)",
+        ])
+        result = self._run("COMMIT")
+        self.assertTrue(result.startswith("Error: COMMIT failed at statement 4 (insert on table account)"), result)
+        self.assertEqual(self._column("SELECT id FROM owner", "id"), ["1", "2"])
+        self.assertEqual(self._column("SELECT no FROM account", "no"), ["10"])
+        self.assertEqual(len(self._write_records()), before)
+        # The undone rows are gone from the indexes too: the keys can be used again
+        test_support.run_all(self.session, ["INSERT INTO owner (id, name) VALUES (3, 'cy')"])
+
+    def test_reads_see_the_transaction_writes(self):
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "INSERT INTO owner (id, name) VALUES (3, 'cy')",
+            "DELETE FROM owner WHERE id = 1",
+        ])
+        self.assertEqual(self._column("SELECT name FROM owner WHERE id = 3", "name"), ["cy"])
+        self.assertEqual(self._column("SELECT name FROM owner WHERE id = 1", "name"), [])
+        self.assertEqual(self._column("SELECT name FROM owner WHERE id = 2", "name"), ["bob"])
+        # Another session only sees committed rows
+        other = test_support.new_session()
+        test_support.run_all(other, ["USE bank"])
+        self.assertEqual(test_support.column_values(test_support.run(other, "SELECT name FROM owner WHERE id = 1"),
+                                                    "name"), ["ann"])
+        self.assertEqual(test_support.column_values(test_support.run(other, "SELECT name FROM owner WHERE id = 3"),
+                                                    "name"), [])
+
+    def test_view_rows(self):
+        from db_operations import engine
+        from transaction import Transaction, TransactionView
+        transaction = Transaction("bank")
+        transaction.insert("owner", [{"id": "3", "name": "cy"}])
+        transaction.delete("owner", "1")
+        view = transaction.view("owner", engine.table("bank", "owner"))
+        self.assertIsInstance(view, TransactionView)
+        self.assertEqual(dict(view.rows(["1", "2", "3", "4"], ["name"])), {"2": {"name": "bob"}, "3": {"name": "cy"}})
+        # A table without buffered writes is read as it is
+        self.assertNotIsInstance(transaction.view("account", engine.table("bank", "account")), TransactionView)
+
+    def test_delete_then_insert_same_key(self):
+        test_support.run_all(self.session, [
+            "BEGIN",
+            "DELETE FROM owner WHERE id = 2",
+            "INSERT INTO owner (id, name) VALUES (2, 'bea')",
+        ])
+        self.assertEqual(self._column("SELECT name FROM owner WHERE id = 2", "name"), ["bea"])
+        self.assertEqual(self._run("INSERT INTO owner (id, name) VALUES (2, 'again')"),
+                         "Error: Record with this primary key already exists.")
+        self.assertEqual(self._run("COMMIT"), "Transaction committed: 1 record(s) inserted, 1 record(s) deleted.")
+        self.assertEqual(self._column("SELECT name FROM owner", "name"), ["ann", "bea"])
+
+
+if __name__ == "__main__":
+    unittest.main()
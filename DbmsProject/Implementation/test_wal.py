@@ -0,0 +1,152 @@
+# test_wal.py
+# Crash recovery from the log. A crash is simulated by taking logged rows out of the
+# backend again before recover() replays the log:
+#
+#   python -m unittest test_wal
+import os
+import shutil
+import unittest
+from unittest import mock
+
+import test_support
+
+
+def setUpModule():
+    test_support.start()
+
+
+class RecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.path = test_support.use_log(self, "test.wal")
+        self.session = test_support.new_session()
+        test_support.run_all(self.session, ["CREATE DATABASE recovery", "USE recovery",
+                                            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))"])
+
+    def tearDown(self):
+        test_support.run(self.session, "DROP DATABASE recovery")
+        test_support.run(self.session, "DROP DATABASE recovery2")
+
+    def _rows(self, table="t"):
+        result = test_support.run(self.session, f"SELECT id, v FROM {table}")
+        return sorted(zip(test_support.column_values(result, "id"), test_support.column_values(result, "v")))
+
+    def _lose(self, db_name, table_name, keys):
+        # What the backend would not have after a crash
+        from storage_engine import get_engine
+        get_engine().table(db_name, table_name).delete_many(keys)
+
+    def _recover(self):
+        import wal
+        # recover() replays the file, so everything appended must be in it
+        wal.get_log().drain()
+        wal.recover()
+
+    def test_replays_lost_writes(self):
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (1, 'a'), (2, 'b'), (3, 'c')",
+                                            "DELETE FROM t WHERE id = 2"])
+        self._lose("recovery", "t", ["1", "3"])
+        self.assertEqual(self._rows(), [])
+        self._recover()
+        self.assertEqual(self._rows(), [("1", "a"), ("3", "c")])
+        # The checkpoint at the end of recovery empties the log
+        self.assertEqual(os.path.getsize(self.path), 0)
+
+    def test_torn_tail_is_ignored(self):
+        import wal
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (1, 'a')",
+                                            "INSERT INTO t (id, v) VALUES (2, 'b')"])
+        wal.get_log().drain()
+        size = os.path.getsize(self.path)
+        intact = wal.read_records(self.path)
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (3, 'c')"])
+        wal.get_log().drain()
+        self._lose("recovery", "t", ["1", "2", "3"])
+        # The last record only got half way to disk
+        with open(self.path, "r+b") as log_file:
+            log_file.truncate(size + (os.path.getsize(self.path) - size) // 2)
+        self.assertEqual(wal.read_records(self.path), intact)
+        self._recover()
+        self.assertEqual(self._rows(), [("1", "a"), ("2", "b")])
+
+    def test_corrupt_record_ends_the_log(self):
+        import wal
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (1, 'a')"])
+        wal.get_log().drain()
+        size = os.path.getsize(self.path)
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (2, 'b')",
+                                            "INSERT INTO t (id, v) VALUES (3, 'c')"])
+        wal.get_log().drain()
+        self._lose("recovery", "t", ["1", "2", "3"])
+        # A flipped byte in the payload of the first of the two later records
+        with open(self.path, "r+b") as log_file:
+            log_file.seek(size + 12)
+            byte = log_file.read(1)
+            log_file.seek(size + 12)
+            log_file.write(bytes([byte[0] ^ 0xFF]))
+        self._recover()
+        self.assertEqual(self._rows(), [("1", "a")])
+
+    def test_writes_before_drop_table_are_skipped(self):
+        test_support.run_all(self.session, [
+            "INSERT INTO t (id, v) VALUES (1, 'old'), (2, 'old')",
+            "DROP TABLE t",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))",
+            "INSERT INTO t (id, v) VALUES (3, 'new')",
+        ])
+        self._lose("recovery", "t", ["3"])
+        self._recover()
+        self.assertEqual(self._rows(), [("3", "new")])
+
+    def test_writes_before_drop_database_are_skipped(self):
+        test_support.run_all(self.session, [
+            "CREATE DATABASE recovery2", "USE recovery2",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))",
+            "INSERT INTO t (id, v) VALUES (1, 'old')",
+            "DROP DATABASE recovery2",
+            "CREATE DATABASE recovery2", "USE recovery2",
+            "CREATE TABLE t (id INT PRIMARY KEY, v VARCHAR(10))",
+            "INSERT INTO t (id, v) VALUES (2, 'new')",
+        ])
+        self._lose("recovery2", "t", ["2"])
+        self._recover()
+        self.assertEqual(self._rows(), [("2", "new")])
+
+    def test_replaying_twice_changes_nothing(self):
+        import wal
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (1, 'a'), (2, 'b')",
+                                            "DELETE FROM t WHERE id = 1",
+                                            "INSERT INTO t (id, v) VALUES (1, 'c')"])
+        wal.get_log().drain()
+        saved = self.path + ".saved"
+        shutil.copyfile(self.path, saved)
+        # Once over rows that are all still there, then again after the checkpoint emptied the log
+        self._recover()
+        self.assertEqual(self._rows(), [("1", "c"), ("2", "b")])
+        shutil.copyfile(saved, self.path)
+        self._recover()
+        self.assertEqual(self._rows(), [("1", "c"), ("2", "b")])
+        self.assertEqual(test_support.column_values(test_support.run(self.session, "SELECT COUNT(*) FROM t"),
+                                                    "COUNT(*)"), ["2"])
+        os.remove(saved)
+
+    def test_checkpoint_keeps_records_appended_during_it(self):
+        import json_mirror
+        import wal
+        test_support.run_all(self.session, ["INSERT INTO t (id, v) VALUES (1, 'a')"])
+        late = {"type": "catalog", "action": "create_database", "db": "recovery"}
+        flush_all = json_mirror.flush_all
+
+        def flush_and_append():
+            # Another session logs a record while the checkpoint flushes the mirror
+            wal.get_log().append(late)
+            flush_all()
+
+        with mock.patch.object(json_mirror, "flush_all", flush_and_append):
+            wal.checkpoint()
+        self.assertEqual(wal.read_records(self.path), [late])
+        wal.sync()
+        self.assertEqual(wal.read_records(self.path), [late])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,212 @@
+# transaction.py
+import foreign_keys
+import index_manager
+import table_stats
+import wal
+from db_catalog import get_table
+from db_operations import engine, store_documents, remove_documents
+from record_codec import build_document, decode_row
+
+INSERT = "insert"
+DELETE = "delete"
+
+
+class TransactionView:
+    """A table as seen from inside a transaction: key lookups include its buffered writes."""
+
+    def __init__(self, store, pending):
+        self.store = store
+        self.pending = pending  # key -> buffered document, or None once deleted
+
+    # Buffered writes are not in the backend, so aggregates cannot be pushed down to it
+    key_aggregation = False
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    def rows(self, keys=None, columns=None):
+        if keys is None:
+            return self.store.rows(None, columns)
+        committed = [key for key in keys if key not in self.pending]
+        found = dict(self.store.rows(committed, columns)) if committed else {}
+        result = []
+        for key in keys:
+            if key in self.pending:
+                if self.pending[key] is not None:
+                    result.append((key, decode_row(self.pending[key], self.store.table_info, columns)))
+            elif key in found:
+                result.append((key, found[key]))
+        return iter(result)
+
+
+class Transaction:
+    """Writes buffered between BEGIN and COMMIT in one database; nothing reaches the backend before COMMIT."""
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.writes = []  # (table_name, kind, payload) in statement order
+        self.keys = {}    # table_name -> {key: buffered document, or None once deleted}
+
+    def tables(self):
+        return list(self.keys)
+
+    def view(self, table_name, store):
+        pending = self.keys.get(table_name)
+        return TransactionView(store, pending) if pending else store
+
+    def insert(self, table_name, rows):
+        """Validate and buffer the rows of one INSERT; a bad row buffers none of them."""
+        table_info = get_table(self.db_name, table_name)
+        if table_info is None:
+            return f"Table '{table_name}' or database '{self.db_name}' does not exist in the catalog."
+        pending = self.keys.get(table_name, {})
+
+        entries = []  # (document, values)
+        added = set()
+        for row_number, values in enumerate(rows, start=1):
+            invalid_fields = set(values.keys()) - set(table_info['attributes'])
+            if invalid_fields:
+                error = f"Error: Invalid field(s) {', '.join(invalid_fields)} for table '{table_name}'."
+            else:
+                document, error = build_document(values, table_info)
+                # Read-your-writes: a key this transaction already inserted is a duplicate
+                if not error and document["_id"] in added:
+                    error = "Error: Duplicate primary key within the same INSERT."
+                elif not error and pending.get(document["_id"]) is not None:
+                    error = "Error: Record with this primary key already exists."
+            if error:
+                return error if len(rows) == 1 else f"{error} (row {row_number}; nothing was buffered)"
+            added.add(document["_id"])
+            entries.append((document, values))
+
+        self.writes.append((table_name, INSERT, entries))
+        pending = self.keys.setdefault(table_name, {})
+        for document, _ in entries:
+            pending[document["_id"]] = document
+        if len(rows) == 1:
+            return f"Record will be inserted into table {table_name} on COMMIT."
+        return f"{len(rows)} record(s) will be inserted into table {table_name} on COMMIT."
+
+    def delete(self, table_name, key):
+        if get_table(self.db_name, table_name) is None:
+            return f"Table '{table_name}' or database '{self.db_name}' does not exist in the catalog."
+        pending = self.keys.setdefault(table_name, {})
+        if key in pending and pending[key] is None:
+            return "No record found with the given primary key."
+        self.writes.append((table_name, DELETE, key))
+        pending[key] = None
+        return f"Record with key {key} will be deleted from table {table_name} on COMMIT."
+
+    def lock_tables(self):
+        """(shared, exclusive) tables COMMIT needs: the written tables and those its FK checks read."""
+        shared = set()
+        for table_name, kind, _ in self.writes:
+            table_info = get_table(self.db_name, table_name)
+            if table_info is None:
+                continue
+            if kind == INSERT:
+                shared.update(foreign_keys.referenced_tables(table_info))
+            else:
+                shared.update(foreign_keys.referencing_tables(self.db_name, table_name))
+        exclusive = self.tables()
+        return sorted(shared - set(exclusive)), exclusive
+
+    def _runs(self):
+        # Consecutive writes to the same table of the same kind go to the backend together
+        run = []
+        for number, write in enumerate(self.writes, start=1):
+            if run and write[:2] != run[0][1][:2]:
+                yield run
+                run = []
+            run.append((number, write))
+        if run:
+            yield run
+
+    def commit(self, deferred=None):
+        """Apply every buffered write; the caller holds the locks from lock_tables().
+
+        Writes are applied to the backend in statement order, so rows can reference
+        parents inserted earlier in the transaction. If any statement fails, what was
+        already applied is undone before anyone else can see it, and nothing is logged.
+        Once every statement succeeded the whole transaction is logged as one record,
+        and COMMIT is only answered when that record is on disk: recovery replays all of
+        an acknowledged transaction. A crash in the middle of COMMIT, before the record
+        is written, can leave part of the transaction in the backend, and recovery does
+        not undo it; such a COMMIT was never acknowledged.
+        """
+        # Rows inserted with deferred foreign key checks only join the session's list on success
+        checks = foreign_keys.DeferredChecks() if deferred is not None else None
+        applied = []  # (table_info, store, inserted documents, deleted documents)
+        changes = {}  # table_name -> (store, [mirror changes in order])
+        inserted_count = deleted_count = 0
+        try:
+            for run in self._runs():
+                table_name, kind = run[0][1][:2]
+                table_info = get_table(self.db_name, table_name)
+                if table_info is None:
+                    return self._abort(applied, run[0][0], f"Table '{table_name}' does not exist in database '{self.db_name}'.")
+                store = engine.table(self.db_name, table_name)
+                table_changes = changes.setdefault(table_name, (store, []))[1]
+
+                if kind == INSERT:
+                    statements = [(entries, checks, False) for _, (_, _, entries) in run]
+                    documents = [
+                        (position, row_number, document, values)
+                        for position, (_, (_, _, entries)) in enumerate(run)
+                        for row_number, (document, values) in enumerate(entries, start=1)
+                    ]
+                    errors = [{} for _ in run]
+                    # Registered for _undo before the write, which fills it as soon as rows are stored
+                    inserted = []
+                    applied.append((table_info, store, inserted, []))
+                    store_documents(self.db_name, table_info, store, statements, documents, errors,
+                                    logged=False, written=inserted)
+                    for position, statement_errors in enumerate(errors):
+                        if statement_errors:
+                            row_number = min(statement_errors)
+                            return self._abort(applied, run[position][0], statement_errors[row_number])
+                    table_changes.extend(("put", document) for document in inserted)
+                    inserted_count += len(inserted)
+                else:
+                    keys = [key for _, (_, _, key) in run]
+                    removed = []
+                    applied.append((table_info, store, [], removed))
+                    errors, deleted = remove_documents(self.db_name, table_info, store, keys,
+                                                       logged=False, written=removed)
+                    if errors:
+                        position = min(errors)
+                        return self._abort(applied, run[position][0], errors[position])
+                    # Deleting a key that does not exist is not an error, as outside a transaction
+                    table_changes.extend(("del", key) for key in deleted)
+                    deleted_count += len(deleted)
+        except Exception as e:
+            self._undo(applied)
+            return f"Error committing transaction: {str(e)}. The transaction was rolled back."
+
+        # One log record for the whole transaction (see the docstring for what recovery does)
+        wal.log_changes(self.db_name, changes)
+        if checks is not None:
+            deferred.extend(checks)
+        return (f"Transaction committed: {inserted_count} record(s) inserted, "
+                f"{deleted_count} record(s) deleted.")
+
+    def _abort(self, applied, number, error):
+        self._undo(applied)
+        table_name, kind, _ = self.writes[number - 1]
+        if error.startswith("Error: "):
+            error = error[len("Error: "):]
+        return (f"Error: COMMIT failed at statement {number} ({kind} on table {table_name}): "
+                f"{error} The transaction was rolled back.")
+
+    def _undo(self, applied):
+        # Reverse order: take inserted rows out again and put deleted rows back
+        for table_info, store, inserted, deleted in reversed(applied):
+            if inserted:
+                store.delete_many([document["_id"] for document in inserted])
+                index_manager.unindex_documents(self.db_name, table_info, store, inserted)
+                foreign_keys.forget_keys(self.db_name, table_info['name'], [document["_id"] for document in inserted])
+                table_stats.record_documents(self.db_name, table_info, inserted, -1)
+            if deleted:
+                store.insert_many(deleted)
+                index_manager.index_documents(self.db_name, table_info, store, deleted)
+                table_stats.record_documents(self.db_name, table_info, deleted, 1)
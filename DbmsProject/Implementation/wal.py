@@ -0,0 +1,348 @@
+# wal.py
+# Redo log for acknowledged writes. Every INSERT/DELETE batch and transaction COMMIT
+# appends one record to WAL_FILE right after its changes were applied to the backend,
+# and the command is only answered once the record is on disk. Sessions waiting at the
+# same time share one fsync: the first one syncs everything written so far, the others
+# wait for it. Catalog changes are the exception: they are logged (and synced) before
+# the catalog is saved, so recovery can finish their cleanup.
+#
+# So recovery restores every acknowledged write, but it never undoes one: a crash after
+# the backend write and before its record is on disk can leave rows in the backend that
+# were never acknowledged (see Transaction.commit for the same window in a COMMIT).
+#
+# A record is a 4-byte payload length, a CRC32 of the payload, then the payload as
+# JSON. Write records list the changes exactly as they were applied to the backend:
+#
+#   {"type": "write", "db": "school", "changes": [["students", "put", "7", "<row, base64>"],
+#                                                  ["students", "del", "3"]]}
+#   {"type": "catalog", "action": "drop_table", "db": "school", "table": "students"}
+#
+# The JSON mirror is updated from the log in the background, once a record is durable.
+# A checkpoint makes the mirror and the data files durable and then truncates the log;
+# it runs when the log grows past WAL_CHECKPOINT_BYTES, after LOAD DATA and at exit.
+# On startup recover() replays whatever is left on top of the backend (puts replace the
+# row, so replaying twice changes nothing), rebuilds the indexes and mirror snapshots
+# of the tables it touched, and checkpoints.
+import atexit
+import base64
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+
+log = logging.getLogger("dbms.wal")
+
+WAL_ENABLED = os.environ.get("DBMS_WAL", "1") != "0"
+WAL_FILE = os.environ.get("DBMS_WAL_FILE", "dbms.wal")
+# How long the session that syncs waits for more records first (0: sync what is there)
+WAL_SYNC_WINDOW_MS = float(os.environ.get("DBMS_WAL_SYNC_WINDOW_MS", "0"))
+WAL_CHECKPOINT_BYTES = int(os.environ.get("DBMS_WAL_CHECKPOINT_BYTES", str(64 << 20)))
+
+_FRAME = struct.Struct("<II")  # payload length, CRC32 of the payload
+
+_log = None
+_log_lock = threading.Lock()
+
+
+class WriteAheadLog:
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "ab")
+        self.lock = threading.Lock()  # appends, and swapping the file at a checkpoint
+        self.condition = threading.Condition(threading.Lock())
+        self.appended = 0  # records written (maybe still buffered)
+        self.durable = 0   # records known to be on disk
+        self.applied = 0   # records whose mirror changes are written
+        self.syncing = False
+        self.checkpoint_lock = threading.Lock()
+        self.mirror_queue = queue.Queue()
+        threading.Thread(target=self._mirror_loop, name="wal-mirror", daemon=True).start()
+
+    def append(self, record, mirror_changes=None):
+        """Write a record; returns its position for sync()."""
+        payload = json.dumps(record, separators=(",", ":")).encode("utf-8")
+        with self.lock:
+            self.file.write(_FRAME.pack(len(payload), zlib.crc32(payload)) + payload)
+            self.appended += 1
+            position = self.appended
+            # Queued under the lock, so the mirror sees changes in log order
+            self.mirror_queue.put((position, mirror_changes))
+        return position
+
+    def sync(self, position=None):
+        """Wait until the record at position (default: every record so far) is on disk."""
+        if position is None:
+            position = self.appended
+        with self.condition:
+            while self.durable < position and self.syncing:
+                self.condition.wait()
+            if self.durable >= position:
+                return
+            self.syncing = True
+        upto = self.durable
+        try:
+            if WAL_SYNC_WINDOW_MS > 0:
+                time.sleep(WAL_SYNC_WINDOW_MS / 1000)
+            with self.lock:
+                self.file.flush()
+                upto = self.appended
+            # Outside the lock: records appended meanwhile go with the next fsync
+            os.fsync(self.file.fileno())
+        finally:
+            with self.condition:
+                self.durable = max(self.durable, upto)
+                self.syncing = False
+                self.condition.notify_all()
+
+    def _mirror_loop(self):
+        import json_mirror
+        while True:
+            position, mirror_changes = self.mirror_queue.get()
+            db_name, changes = mirror_changes or (None, {})
+            # The mirror never shows a write that could still be lost
+            with self.condition:
+                while self.durable < position:
+                    self.condition.wait()
+            for table_name, (store, table_changes) in changes.items():
+                try:
+                    json_mirror.record_changes(store, db_name, table_name, table_changes)
+                except Exception as e:
+                    log.error("Error updating mirror for %s.%s: %s", db_name, table_name, e)
+            with self.condition:
+                self.applied = position
+                self.condition.notify_all()
+            if self.mirror_queue.empty() and self.size() >= WAL_CHECKPOINT_BYTES and not self.checkpoint_lock.locked():
+                # Not on this thread: a checkpoint waits for the mirror to catch up
+                threading.Thread(target=self._checkpoint_quietly, name="wal-checkpoint", daemon=True).start()
+
+    def _checkpoint_quietly(self):
+        try:
+            self.checkpoint()
+        except Exception as e:
+            log.error("Checkpoint failed: %s", e)
+
+    def drain(self):
+        """Wait until the mirror has every change logged so far."""
+        position = self.appended
+        self.sync(position)
+        with self.condition:
+            while self.applied < position:
+                self.condition.wait()
+
+    def size(self):
+        with self.lock:
+            return self.file.tell()
+
+    def checkpoint(self):
+        """Make everything logged so far durable outside the log, then drop it from the log."""
+        import json_mirror
+        from storage_engine import get_engine
+        with self.checkpoint_lock:
+            with self.lock:
+                offset = self.file.tell()
+            self.drain()
+            json_mirror.flush_all()
+            get_engine().flush()
+
+            # Keep what was appended since; no fsync may run while the file is swapped
+            with self.condition:
+                while self.syncing:
+                    self.condition.wait()
+                self.syncing = True
+            upto = self.durable
+            try:
+                with self.lock:
+                    self.file.flush()
+                    with open(self.path, "rb") as old:
+                        old.seek(offset)
+                        tail = old.read()
+                    tmp_path = self.path + ".tmp"
+                    with open(tmp_path, "wb") as new:
+                        new.write(tail)
+                        new.flush()
+                        os.fsync(new.fileno())
+                    self.file.close()
+                    os.replace(tmp_path, self.path)
+                    self.file = open(self.path, "ab")
+                    upto = self.appended
+            finally:
+                with self.condition:
+                    self.durable = max(self.durable, upto)
+                    self.syncing = False
+                    self.condition.notify_all()
+            log.debug("Checkpoint: %d byte(s) of log dropped, %d kept.", offset, len(tail))
+
+
+def get_log():
+    global _log
+    if _log is None:
+        with _log_lock:
+            if _log is None:
+                _log = WriteAheadLog(WAL_FILE)
+                atexit.register(_log._checkpoint_quietly)
+    return _log
+
+
+def log_changes(db_name, changes):
+    """Log applied writes: changes is {table_name: (store, [("put", document) / ("del", key)])}.
+
+    The JSON mirror is updated from the log once the record is durable.
+    """
+    changes = {table_name: entry for table_name, entry in changes.items() if entry[1]}
+    if not changes:
+        return
+    if not WAL_ENABLED:
+        import json_mirror
+        for table_name, (store, table_changes) in changes.items():
+            json_mirror.record_changes(store, db_name, table_name, table_changes)
+        return
+    entries = []
+    for table_name, (_, table_changes) in changes.items():
+        for op, item in table_changes:
+            if op == "put":
+                entries.append([table_name, op, item["_id"], base64.b64encode(item["row"]).decode("ascii")])
+            else:
+                entries.append([table_name, op, item])
+    with metrics.phase("wal"):
+        get_log().append({"type": "write", "db": db_name, "changes": entries}, (db_name, changes))
+
+
+def log_catalog(action, db_name, table_name=None, tables=None):
+    """Log a catalog change before it is saved; its cleanup is redone on recovery."""
+    if not WAL_ENABLED:
+        return
+    record = {"type": "catalog", "action": action, "db": db_name}
+    if table_name is not None:
+        record["table"] = table_name
+    if tables is not None:
+        record["tables"] = tables
+    with metrics.phase("wal"):
+        wal = get_log()
+        # A dropped table's mirror must not get changes after it is forgotten
+        if action in ("drop_table", "drop_database"):
+            wal.drain()
+        wal.sync(wal.append(record))
+
+
+def sync():
+    """Wait until every record logged so far is on disk (the acknowledgement point)."""
+    if not WAL_ENABLED or _log is None:
+        return
+    with metrics.phase("wal"):
+        _log.sync()
+
+
+def checkpoint():
+    if WAL_ENABLED:
+        get_log().checkpoint()
+
+
+def read_records(path):
+    """Every intact record of a log file; reading stops at a torn or corrupt tail."""
+    records = []
+    if not os.path.exists(path):
+        return records
+    with open(path, "rb") as f:
+        data = f.read()
+    offset = 0
+    while offset + _FRAME.size <= len(data):
+        length, checksum = _FRAME.unpack_from(data, offset)
+        payload = data[offset + _FRAME.size:offset + _FRAME.size + length]
+        if len(payload) < length or zlib.crc32(payload) != checksum:
+            break
+        records.append(json.loads(payload))
+        offset += _FRAME.size + length
+    if offset < len(data):
+        log.warning("Ignoring %d byte(s) of torn log at the end of %s.", len(data) - offset, path)
+    return records
+
+
+def _redo_catalog(record, engine):
+    import foreign_keys
+    import index_manager
+    import json_mirror
+    from db_catalog import get_database, get_table
+    db_name, action = record["db"], record["action"]
+    if action == "create_database" and get_database(db_name) is not None:
+        engine.create_database(db_name)
+    elif action == "drop_database" and get_database(db_name) is None:
+        for table_name in record.get("tables", []):
+            json_mirror.forget_table(db_name, table_name)
+        index_manager.drop_table_indexes(db_name)
+        foreign_keys.forget_table(db_name)
+        engine.drop_database(db_name)
+    elif action == "drop_table" and get_table(db_name, record["table"]) is None:
+        json_mirror.forget_table(db_name, record["table"])
+        index_manager.drop_table_indexes(db_name, record["table"])
+        foreign_keys.forget_table(db_name, record["table"])
+        engine.drop_table(db_name, record["table"])
+    # Created tables and indexes are complete once the catalog is saved; nothing to redo
+
+
+def _redo_changes(store, changes):
+    # Runs of puts or deletes, in log order; a put replaces whatever row has its key
+    run = []
+    for change in changes + [None]:
+        if run and (change is None or change[1] != run[0][1]):
+            keys = [entry[2] for entry in run]
+            store.delete_many(keys)
+            if run[0][1] == "put":
+                documents = [{"_id": entry[2], "row": base64.b64decode(entry[3])} for entry in run]
+                store.insert_many(documents)
+            run = []
+        if change is not None:
+            run.append(change)
+
+
+def recover():
+    """Replay the log left by the previous run, then checkpoint. Call once at startup."""
+    if not WAL_ENABLED:
+        return
+    import index_manager
+    import json_mirror
+    from storage_engine import get_engine
+    records = read_records(WAL_FILE)
+    if not records:
+        get_log()
+        return
+    engine = get_engine()
+
+    # Writes logged before a table (or its database) was dropped do not belong to a
+    # table created later under the same name
+    dropped = {}
+    for position, record in enumerate(records):
+        if record["type"] == "catalog" and record["action"] == "drop_table":
+            dropped[(record["db"], record["table"])] = position
+        elif record["type"] == "catalog" and record["action"] == "drop_database":
+            dropped[(record["db"], None)] = position
+
+    touched = {}
+    for position, record in enumerate(records):
+        if record["type"] == "catalog":
+            _redo_catalog(record, engine)
+            continue
+        db_name = record["db"]
+        by_table = {}
+        for change in record["changes"]:
+            by_table.setdefault(change[0], []).append(change)
+        for table_name, changes in by_table.items():
+            if max(dropped.get((db_name, table_name), -1), dropped.get((db_name, None), -1)) > position:
+                continue
+            store = engine.table(db_name, table_name)
+            if store is None:
+                continue
+            _redo_changes(store, changes)
+            touched[(db_name, table_name)] = store
+
+    # Index files and mirror snapshots are rebuilt from the recovered rows
+    for (db_name, table_name), store in touched.items():
+        index_manager.drop_table_indexes(db_name, table_name)
+        json_mirror.rebuild_table(store, db_name, table_name)
+    get_log().checkpoint()
+    log.info("Recovered %d log record(s); %d table(s) replayed.", len(records), len(touched))